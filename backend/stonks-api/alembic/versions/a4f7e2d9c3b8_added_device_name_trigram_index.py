@@ -0,0 +1,45 @@
+"""Added device name trigram index
+
+Revision ID: a4f7e2d9c3b8
+Revises: f2a6c8e4d1b7
+Create Date: 2026-10-18 20:52:09.471730
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4f7e2d9c3b8'
+down_revision = 'f2a6c8e4d1b7'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+
+def upgrade():
+    available = op.get_bind().execute(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    ).scalar()
+
+    # pg_trgm is a contrib extension, included in the official postgres images but not in every build
+    if available is None:
+        logger.warning("Extension pg_trgm is not available, similar devices lookup will not work. "
+                       "Install postgres contrib and run this migration again.")
+        return
+
+    # Trusted extension, it can be created by the owner of the database
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_device_name_trgm', 'device', ['name'], postgresql_using='gin',
+                        postgresql_ops={'name': 'gin_trgm_ops'}, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_device_name_trgm")
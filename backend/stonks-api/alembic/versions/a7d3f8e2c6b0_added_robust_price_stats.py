@@ -0,0 +1,64 @@
+"""Added robust price stats
+
+Revision ID: a7d3f8e2c6b0
+Revises: e5a2c9d4b7f1
+Create Date: 2026-10-18 16:02:44.918273
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3f8e2c6b0'
+down_revision = 'e5a2c9d4b7f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('device_price_stats', sa.Column('trimmed_mean_price', sa.Numeric(precision=15, scale=4), nullable=True))
+    op.add_column('device_price_stats', sa.Column('q1_price', sa.Numeric(precision=15, scale=4), nullable=True))
+    op.add_column('device_price_stats', sa.Column('q3_price', sa.Numeric(precision=15, scale=4), nullable=True))
+    op.add_column('device_price_stats', sa.Column('last_price_at', sa.DateTime(), nullable=True))
+
+    # Backfill new statistics of existing devices, afterwards they are refreshed when prices are added
+    op.execute("""
+        UPDATE device_price_stats
+        SET trimmed_mean_price = stats.trimmed_mean_price,
+            q1_price = stats.q1_price,
+            q3_price = stats.q3_price,
+            last_price_at = stats.last_price_at
+        FROM (
+            SELECT device_name,
+                   window_days,
+                   avg(price) FILTER (WHERE rank > floor(total * 0.1) AND rank <= total - floor(total * 0.1))
+                       AS trimmed_mean_price,
+                   percentile_cont(0.25) WITHIN GROUP (ORDER BY price) AS q1_price,
+                   percentile_cont(0.75) WITHIN GROUP (ORDER BY price) AS q3_price,
+                   max(date) AS last_price_at
+            FROM (
+                SELECT price.device_name,
+                       device_price_stats.window_days,
+                       price.price,
+                       price.date,
+                       row_number() OVER w AS rank,
+                       count(*) OVER w AS total
+                FROM device_price_stats
+                JOIN price ON price.device_name = device_price_stats.device_name
+                          AND price.date > timezone('utc', now()) - make_interval(days => device_price_stats.window_days)
+                WINDOW w AS (PARTITION BY price.device_name, device_price_stats.window_days ORDER BY price.price
+                             ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+            ) AS windowed
+            GROUP BY device_name, window_days
+        ) AS stats
+        WHERE device_price_stats.device_name = stats.device_name
+          AND device_price_stats.window_days = stats.window_days
+    """)
+
+
+def downgrade():
+    op.drop_column('device_price_stats', 'last_price_at')
+    op.drop_column('device_price_stats', 'q3_price')
+    op.drop_column('device_price_stats', 'q1_price')
+    op.drop_column('device_price_stats', 'trimmed_mean_price')
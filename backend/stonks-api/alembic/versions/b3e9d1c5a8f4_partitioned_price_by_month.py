@@ -0,0 +1,103 @@
+"""Partitioned price by month
+
+Revision ID: b3e9d1c5a8f4
+Revises: a7d3f8e2c6b0
+Create Date: 2026-10-18 17:40:12.305561
+
+"""
+from datetime import datetime, date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e9d1c5a8f4'
+down_revision = 'a7d3f8e2c6b0'
+branch_labels = None
+depends_on = None
+
+# Partitions are created up to that many months ahead, later ones are created by `stonks_api.cli price-partitions`
+MONTHS_AHEAD = 2
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def create_price_table(name: str, primary_key: sa.PrimaryKeyConstraint, **kwargs):
+    op.create_table(name,
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('price_id_seq'::regclass)"), nullable=False),
+    sa.Column('device_name', sa.String(), nullable=False),
+    sa.Column('source', sa.String(length=32), nullable=False),
+    sa.Column('price', sa.Numeric(precision=15, scale=4), nullable=False),
+    sa.Column('currency', sa.String(length=3), nullable=False),
+    sa.Column('date', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['device_name'], ['device.name'], name='price_device_name_fkey', ondelete='CASCADE'),
+    primary_key,
+    **kwargs
+    )
+
+
+def replace_price_table(primary_key: sa.PrimaryKeyConstraint, **kwargs):
+    """
+    Rename `price` table to `price_old` and create a new one in its place, which keeps using the id sequence.
+    """
+    op.execute("ALTER TABLE price RENAME TO price_old")
+    op.execute("ALTER TABLE price_old RENAME CONSTRAINT price_pkey TO price_old_pkey")
+    op.execute("ALTER INDEX ix_price_device_name_date RENAME TO ix_price_old_device_name_date")
+    op.execute("ALTER SEQUENCE price_id_seq OWNED BY NONE")
+
+    create_price_table('price', primary_key, **kwargs)
+    op.execute("ALTER SEQUENCE price_id_seq OWNED BY price.id")
+
+
+def upgrade():
+    replace_price_table(primary_key=sa.PrimaryKeyConstraint('id', 'date', name='price_pkey'),
+                        postgresql_partition_by='RANGE (date)')
+    op.execute("CREATE TABLE price_default PARTITION OF price DEFAULT")
+
+    # Monthly partitions of all existing prices and of the upcoming months
+    first = op.get_bind().execute(sa.text("SELECT min(date) FROM price_old")).scalar()
+    current = datetime.utcnow().date().replace(day=1)
+    month = min(first.date(), current).replace(day=1) if first is not None else current
+
+    while month <= add_months(current, MONTHS_AHEAD):
+        end = add_months(month, 1)
+        op.execute(f"CREATE TABLE price_{month:%Y_%m} PARTITION OF price FOR VALUES FROM ('{month}') TO ('{end}')")
+        month = end
+
+    op.execute("INSERT INTO price (id, device_name, source, price, currency, date) "
+               "SELECT id, device_name, source, price, currency, date FROM price_old")
+    op.drop_table('price_old')
+
+    op.create_index('ix_price_device_name_date', 'price', ['device_name', 'date'])
+    op.create_index('ix_price_date_brin', 'price', ['date'], postgresql_using='brin')
+
+    op.create_table('price_daily',
+    sa.Column('device_name', sa.String(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('currency', sa.String(length=3), nullable=False),
+    sa.Column('sample_count', sa.Integer(), nullable=False),
+    sa.Column('min_price', sa.Numeric(precision=15, scale=4), nullable=False),
+    sa.Column('max_price', sa.Numeric(precision=15, scale=4), nullable=False),
+    sa.Column('sum_price', sa.Numeric(precision=20, scale=4), nullable=False),
+    sa.ForeignKeyConstraint(['device_name'], ['device.name'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('device_name', 'day', 'currency')
+    )
+
+
+def downgrade():
+    op.drop_table('price_daily')
+
+    # Dropping the partitioned table drops all of its partitions
+    op.drop_index('ix_price_date_brin', table_name='price')
+    replace_price_table(primary_key=sa.PrimaryKeyConstraint('id', name='price_pkey'))
+
+    op.execute("INSERT INTO price (id, device_name, source, price, currency, date) "
+               "SELECT id, device_name, source, price, currency, date FROM price_old")
+    op.drop_table('price_old')
+
+    op.create_index('ix_price_device_name_date', 'price', ['device_name', 'date'])
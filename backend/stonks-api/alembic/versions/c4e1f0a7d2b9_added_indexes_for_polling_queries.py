@@ -0,0 +1,63 @@
+"""Added indexes for polling queries
+
+Revision ID: c4e1f0a7d2b9
+Revises: 55cd444d7791
+Create Date: 2026-10-18 12:04:31.114092
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e1f0a7d2b9'
+down_revision = '55cd444d7791'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_offer_is_active_scraped_at', 'offer', ['is_active', 'scraped_at', 'id'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_offer_is_active_last_update', 'offer',
+                        ['is_active', sa.text('coalesce(last_update_at, scraped_at)')],
+                        postgresql_concurrently=True)
+        op.create_index('ix_offer_without_device_scraped_at', 'offer', ['is_active', 'scraped_at', 'id'],
+                        postgresql_where=sa.text("device_name IS NULL OR device_name = '_no_device'"),
+                        postgresql_concurrently=True)
+        op.create_index('ix_offer_with_device_last_stonks_check', 'offer',
+                        [sa.text("coalesce(last_stonks_check, '-infinity'::timestamp)")],
+                        postgresql_where=sa.text("is_active AND device_name IS NOT NULL AND device_name <> '_no_device'"),
+                        postgresql_concurrently=True)
+        op.create_index('ix_offer_device_name', 'offer', ['device_name'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_device_last_price_update', 'device',
+                        [sa.text("coalesce(last_price_update, '-infinity'::timestamp)")],
+                        postgresql_concurrently=True)
+        op.create_index('ix_price_device_name_date', 'price', ['device_name', 'date'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_delivery_offer_id', 'delivery', ['offer_id'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_stonks_offer_id', 'stonks', ['offer_id'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_stonks_is_active_stonks_amount', 'stonks', ['is_active', 'stonks_amount', 'id'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_fee_stonks_id', 'fee', ['stonks_id'],
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_fee_stonks_id', table_name='fee', postgresql_concurrently=True)
+        op.drop_index('ix_stonks_is_active_stonks_amount', table_name='stonks', postgresql_concurrently=True)
+        op.drop_index('ix_stonks_offer_id', table_name='stonks', postgresql_concurrently=True)
+        op.drop_index('ix_delivery_offer_id', table_name='delivery', postgresql_concurrently=True)
+        op.drop_index('ix_price_device_name_date', table_name='price', postgresql_concurrently=True)
+        op.drop_index('ix_device_last_price_update', table_name='device', postgresql_concurrently=True)
+        op.drop_index('ix_offer_device_name', table_name='offer', postgresql_concurrently=True)
+        op.drop_index('ix_offer_with_device_last_stonks_check', table_name='offer', postgresql_concurrently=True)
+        op.drop_index('ix_offer_without_device_scraped_at', table_name='offer', postgresql_concurrently=True)
+        op.drop_index('ix_offer_is_active_last_update', table_name='offer', postgresql_concurrently=True)
+        op.drop_index('ix_offer_is_active_scraped_at', table_name='offer', postgresql_concurrently=True)
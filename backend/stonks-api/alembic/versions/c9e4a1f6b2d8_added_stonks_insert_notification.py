@@ -0,0 +1,38 @@
+"""Added stonks insert notification
+
+Revision ID: c9e4a1f6b2d8
+Revises: a4f7e2d9c3b8
+Create Date: 2026-10-18 21:34:18.215906
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9e4a1f6b2d8'
+down_revision = 'a4f7e2d9c3b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Notifications are delivered to listeners when the inserting transaction commits,
+    # stonks_api.notifications loads the stonkses by id and sends them to subscribed clients
+    op.execute("""
+        CREATE FUNCTION notify_stonks_created() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('stonks_created', NEW.id::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER stonks_created AFTER INSERT ON stonks
+        FOR EACH ROW EXECUTE FUNCTION notify_stonks_created()
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS stonks_created ON stonks")
+    op.execute("DROP FUNCTION IF EXISTS notify_stonks_created()")
@@ -0,0 +1,132 @@
+"""Added device price stats to stonks
+
+Revision ID: d3b7f9a2c5e1
+Revises: c9e4a1f6b2d8
+Create Date: 2026-10-18 23:12:51.640372
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3b7f9a2c5e1'
+down_revision = 'c9e4a1f6b2d8'
+branch_labels = None
+depends_on = None
+
+STATS_COLUMNS = ('min_price', 'max_price', 'mean_price', 'median_price', 'harmonic_price')
+# Window of statistics stonkses are sorted by, `DEFAULT_WINDOW` of stonks_api.crud.crud_price_stats
+SORT_WINDOW = 7
+
+# Statistics of the offer device from `stats`, NULL if the offer has no device or the device has no statistics
+SET_STATS = ", ".join(f"device_{column} = stats.{column}" for column in STATS_COLUMNS)
+CHANGED_STATS = f"({', '.join(f'stonks.device_{column}' for column in STATS_COLUMNS)}) " \
+                f"IS DISTINCT FROM ({', '.join(f'stats.{column}' for column in STATS_COLUMNS)})"
+UPDATE_STONKS = f"""
+    UPDATE stonks SET {SET_STATS}
+    FROM offer
+    LEFT JOIN device_price_stats AS stats ON stats.device_name = offer.device_name
+                                         AND stats.window_days = {SORT_WINDOW}
+    WHERE stonks.offer_id = offer.id AND {CHANGED_STATS}
+"""
+
+
+def upgrade():
+    for column in STATS_COLUMNS:
+        op.add_column('stonks', sa.Column(f'device_{column}', sa.Numeric(precision=15, scale=4), nullable=True))
+
+    # Statistics are copied to stonkses by triggers, so every way of inserting stonkses, changing devices of offers
+    # and refreshing statistics keeps them up to date
+    op.execute(f"""
+        CREATE FUNCTION set_stonks_device_price_stats() RETURNS trigger AS $$
+        BEGIN
+            SELECT {', '.join(f'stats.{column}' for column in STATS_COLUMNS)}
+            INTO {', '.join(f'NEW.device_{column}' for column in STATS_COLUMNS)}
+            FROM offer
+            JOIN device_price_stats AS stats ON stats.device_name = offer.device_name
+                                            AND stats.window_days = {SORT_WINDOW}
+            WHERE offer.id = NEW.offer_id;
+
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER stonks_device_price_stats BEFORE INSERT OR UPDATE OF offer_id ON stonks
+        FOR EACH ROW EXECUTE FUNCTION set_stonks_device_price_stats()
+    """)
+    op.execute(f"""
+        CREATE FUNCTION update_offer_stonks_price_stats() RETURNS trigger AS $$
+        BEGIN
+            {UPDATE_STONKS} AND offer.id = NEW.id;
+
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER offer_stonks_price_stats AFTER UPDATE OF device_name ON offer
+        FOR EACH ROW WHEN (OLD.device_name IS DISTINCT FROM NEW.device_name)
+        EXECUTE FUNCTION update_offer_stonks_price_stats()
+    """)
+    op.execute(f"""
+        CREATE FUNCTION update_device_stonks_price_stats() RETURNS trigger AS $$
+        DECLARE
+            changed device_price_stats;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                changed := OLD;
+            ELSE
+                changed := NEW;
+            END IF;
+
+            IF changed.window_days = {SORT_WINDOW} THEN
+                {UPDATE_STONKS} AND offer.device_name = changed.device_name;
+            END IF;
+
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER device_stonks_price_stats AFTER INSERT OR UPDATE OR DELETE ON device_price_stats
+        FOR EACH ROW EXECUTE FUNCTION update_device_stonks_price_stats()
+    """)
+
+    op.execute(UPDATE_STONKS)
+
+    # Statistics of the join could not supply the order of stonkses
+    for column in STATS_COLUMNS:
+        op.drop_index(f'ix_device_price_stats_{column}', table_name='device_price_stats')
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for column in STATS_COLUMNS:
+            # Both directions keep stonkses of devices without prices last, so every one needs its own index
+            op.create_index(f'ix_stonks_is_active_device_{column}', 'stonks',
+                            ['is_active', f'device_{column}', 'id'], postgresql_concurrently=True)
+            op.create_index(f'ix_stonks_is_active_device_{column}_desc', 'stonks',
+                            ['is_active', sa.text(f'device_{column} DESC NULLS LAST'), sa.text('id DESC')],
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for column in STATS_COLUMNS:
+            op.drop_index(f'ix_stonks_is_active_device_{column}_desc', table_name='stonks',
+                          postgresql_concurrently=True)
+            op.drop_index(f'ix_stonks_is_active_device_{column}', table_name='stonks', postgresql_concurrently=True)
+
+    for column in STATS_COLUMNS:
+        op.create_index(f'ix_device_price_stats_{column}', 'device_price_stats', ['window_days', column])
+
+    op.execute("DROP TRIGGER IF EXISTS device_stonks_price_stats ON device_price_stats")
+    op.execute("DROP FUNCTION IF EXISTS update_device_stonks_price_stats()")
+    op.execute("DROP TRIGGER IF EXISTS offer_stonks_price_stats ON offer")
+    op.execute("DROP FUNCTION IF EXISTS update_offer_stonks_price_stats()")
+    op.execute("DROP TRIGGER IF EXISTS stonks_device_price_stats ON stonks")
+    op.execute("DROP FUNCTION IF EXISTS set_stonks_device_price_stats()")
+
+    for column in STATS_COLUMNS:
+        op.drop_column('stonks', f'device_{column}')
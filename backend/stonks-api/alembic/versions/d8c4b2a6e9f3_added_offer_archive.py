@@ -0,0 +1,77 @@
+"""Added offer archive
+
+Revision ID: d8c4b2a6e9f3
+Revises: b3e9d1c5a8f4
+Create Date: 2026-10-18 19:24:51.662017
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'd8c4b2a6e9f3'
+down_revision = 'b3e9d1c5a8f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('offer_archive',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('url', sa.String(), nullable=True),
+    sa.Column('title', sa.String(), nullable=False),
+    sa.Column('description', sa.String(), nullable=True),
+    sa.Column('category', sa.String(length=32), nullable=False),
+    sa.Column('device_name', sa.String(), nullable=True),
+    sa.Column('price', sa.Numeric(precision=15, scale=4), nullable=False),
+    sa.Column('currency', sa.String(length=3), nullable=False),
+    sa.Column('photos', postgresql.ARRAY(sa.String()), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=False),
+    sa.Column('scraped_at', sa.DateTime(), nullable=False),
+    sa.Column('last_update_at', sa.DateTime(), nullable=True),
+    sa.Column('last_stonks_check', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['device_name'], ['device.name'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('delivery_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('offer_id', sa.String(), nullable=False),
+    sa.Column('title', sa.String(), nullable=True),
+    sa.Column('price', sa.Numeric(precision=15, scale=4), nullable=False),
+    sa.Column('currency', sa.String(length=3), nullable=False),
+    sa.ForeignKeyConstraint(['offer_id'], ['offer_archive.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_delivery_archive_offer_id'), 'delivery_archive', ['offer_id'], unique=False)
+    op.create_table('stonks_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('stonks_amount', sa.Numeric(precision=15, scale=4), nullable=False),
+    sa.Column('offer_id', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('is_active', sa.Boolean(), nullable=False),
+    sa.ForeignKeyConstraint(['offer_id'], ['offer_archive.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_stonks_archive_offer_id'), 'stonks_archive', ['offer_id'], unique=False)
+    op.create_table('fee_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('stonks_id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=15, scale=4), nullable=False),
+    sa.Column('currency', sa.String(length=3), nullable=False),
+    sa.ForeignKeyConstraint(['stonks_id'], ['stonks_archive.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_fee_archive_stonks_id'), 'fee_archive', ['stonks_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_fee_archive_stonks_id'), table_name='fee_archive')
+    op.drop_table('fee_archive')
+    op.drop_index(op.f('ix_stonks_archive_offer_id'), table_name='stonks_archive')
+    op.drop_table('stonks_archive')
+    op.drop_index(op.f('ix_delivery_archive_offer_id'), table_name='delivery_archive')
+    op.drop_table('delivery_archive')
+    op.drop_table('offer_archive')
@@ -0,0 +1,64 @@
+"""Added device price stats
+
+Revision ID: e5a2c9d4b7f1
+Revises: c4e1f0a7d2b9
+Create Date: 2026-10-18 14:21:07.530118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a2c9d4b7f1'
+down_revision = 'c4e1f0a7d2b9'
+branch_labels = None
+depends_on = None
+
+STATS_COLUMNS = ('min_price', 'max_price', 'mean_price', 'median_price', 'harmonic_price')
+
+
+def upgrade():
+    op.create_table('device_price_stats',
+    sa.Column('device_name', sa.String(), nullable=False),
+    sa.Column('window_days', sa.Integer(), nullable=False),
+    sa.Column('min_price', sa.Numeric(precision=15, scale=4), nullable=True),
+    sa.Column('max_price', sa.Numeric(precision=15, scale=4), nullable=True),
+    sa.Column('mean_price', sa.Numeric(precision=15, scale=4), nullable=True),
+    sa.Column('median_price', sa.Numeric(precision=15, scale=4), nullable=True),
+    sa.Column('harmonic_price', sa.Numeric(precision=15, scale=4), nullable=True),
+    sa.Column('sample_count', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['device_name'], ['device.name'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('device_name', 'window_days')
+    )
+
+    for column in STATS_COLUMNS:
+        op.create_index(f'ix_device_price_stats_{column}', 'device_price_stats', ['window_days', column])
+
+    # Backfill statistics of existing devices, afterwards they are refreshed when prices are added
+    op.execute("""
+        INSERT INTO device_price_stats
+        SELECT device.name,
+               windows.window_days,
+               min(price.price),
+               max(price.price),
+               avg(price.price),
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY price.price),
+               count(nullif(price.price, 0)) / sum(1 / nullif(price.price, 0)),
+               count(price.price),
+               timezone('utc', now())
+        FROM device
+        CROSS JOIN (VALUES (7), (30)) AS windows (window_days)
+        LEFT JOIN price ON price.device_name = device.name
+                       AND price.date > timezone('utc', now()) - make_interval(days => windows.window_days)
+        WHERE device.name != '_no_device'
+        GROUP BY device.name, windows.window_days
+    """)
+
+
+def downgrade():
+    for column in STATS_COLUMNS:
+        op.drop_index(f'ix_device_price_stats_{column}', table_name='device_price_stats')
+
+    op.drop_table('device_price_stats')
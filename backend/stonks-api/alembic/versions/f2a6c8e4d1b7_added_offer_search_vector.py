@@ -0,0 +1,37 @@
+"""Added offer search vector
+
+Revision ID: f2a6c8e4d1b7
+Revises: d8c4b2a6e9f3
+Create Date: 2026-10-18 20:11:37.084519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'f2a6c8e4d1b7'
+down_revision = 'd8c4b2a6e9f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Stored generated column is computed for existing offers when it is added
+    op.add_column('offer', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(
+        "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(description, '')), 'B')",
+        persisted=True
+    ), nullable=True))
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_offer_search_vector', 'offer', ['search_vector'], postgresql_using='gin',
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_offer_search_vector', table_name='offer', postgresql_concurrently=True)
+
+    op.drop_column('offer', 'search_vector')
@@ -0,0 +1,45 @@
+"""
+Compare two results of `benchmarks.traffic`, e.g. of the base branch and of a change:
+
+    python -m benchmarks.compare results/base.json results/change.json
+"""
+import argparse
+import json
+
+METRICS = ["rps", "p50_ms", "p95_ms", "p99_ms"]
+
+
+def change(old: float, new: float) -> str:
+    if old == 0:
+        return "    n/a"
+
+    return f"{(new - old) / old:+7.1%}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old")
+    parser.add_argument("new")
+    args = parser.parse_args()
+
+    with open(args.old) as file:
+        old = json.load(file)
+
+    with open(args.new) as file:
+        new = json.load(file)
+
+    print(f"old: {old.get('commit')} ({old['config']['concurrency']} clients, {old['config']['duration']} s)")
+    print(f"new: {new.get('commit')} ({new['config']['concurrency']} clients, {new['config']['duration']} s)")
+    print(f"{'route':<45}" + "".join(f" {metric:>22}" for metric in METRICS))
+
+    old_routes = {**old["routes"], "total": old["total"]}
+    new_routes = {**new["routes"], "total": new["total"]}
+
+    for route in [route for route in new_routes if route in old_routes]:
+        print(f"{route:<45}" + "".join(f" {old_routes[route][metric]:>7.1f} {new_routes[route][metric]:>7.1f} "
+                                       f"{change(old_routes[route][metric], new_routes[route][metric])}"
+                                       for metric in METRICS))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Load test of a running stonks API with many concurrent clients.
+
+Every client sends requests to the given paths in a loop until the duration passes.
+Run it against the same database before and after a change to compare results, e.g.:
+
+    python -m benchmarks.concurrency --url http://localhost:8000 --clients 200 --duration 30
+"""
+import argparse
+import itertools
+import statistics
+import threading
+import time
+from typing import List, Tuple
+
+import requests
+
+DEFAULT_PATHS = [
+    "/v1/offers/?limit=50&has_device=true",
+    "/v1/offers/?limit=50&has_device=false",
+    "/v1/stonks?limit=50",
+]
+
+
+def percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_client(url: str,
+               paths: List[str],
+               deadline: float,
+               results: List[Tuple[float, bool]]):
+    session = requests.Session()
+
+    for path in itertools.cycle(paths):
+        if time.monotonic() >= deadline:
+            return
+
+        start = time.monotonic()
+
+        try:
+            ok = session.get(url + path, timeout=30).ok
+        except requests.RequestException:
+            ok = False
+
+        # list.append is atomic, so results can be shared between threads
+        results.append((time.monotonic() - start, ok))
+
+
+def run(url: str, paths: List[str], clients: int, duration: float) -> dict:
+    results: List[Tuple[float, bool]] = []
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=run_client, args=(url, paths[i % len(paths):] + paths[:i % len(paths)],
+                                                         deadline, results))
+               for i in range(clients)]
+
+    start = time.monotonic()
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+    elapsed = time.monotonic() - start
+
+    latencies = [latency for latency, ok in results if ok]
+
+    return {
+        "requests": len(results),
+        "errors": sum(not ok for _, ok in results),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p99_ms": percentile(latencies, 0.99) * 1000 if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds")
+    parser.add_argument("--path", dest="paths", action="append",
+                        help="Path to request, may be given many times. Defaults to offers and stonks lists.")
+    args = parser.parse_args()
+
+    result = run(args.url, args.paths or DEFAULT_PATHS, args.clients, args.duration)
+
+    print(f"clients:  {args.clients}")
+    print(f"requests: {result['requests']} ({result['errors']} failed)")
+    print(f"rps:      {result['rps']:.1f}")
+    print(f"p50:      {result['p50_ms']:.1f} ms")
+    print(f"p99:      {result['p99_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
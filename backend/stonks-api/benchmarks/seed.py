@@ -0,0 +1,223 @@
+"""
+Seed the database with realistic synthetic devices, prices, offers with deliveries and stonkses with fees.
+
+Rows are loaded with COPY, which is orders of magnitude faster than INSERT for 100k+ offers.
+All seeded rows are prefixed, so they can be removed without touching real data, e.g.:
+
+    python -m benchmarks.seed --offers 100000 --devices 2000
+    python -m benchmarks.seed --clean
+"""
+import argparse
+import csv
+import io
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, List, Sequence
+
+from loguru import logger
+from sqlalchemy import text
+
+from stonks_api import crud
+from stonks_api.database import SessionLocal, engine
+from stonks_api.partitions import ensure_price_partitions
+
+OFFER_PREFIX = "bench-"
+DEVICE_PREFIX = "bench device "
+CATEGORIES = ["smartphones/samsung", "smartphones/iphone", "smartphones/xiaomi", "smartphones/huawei",
+              "smartphones/other", "tablets", "laptops", "consoles", "monitors", "routers"]
+WORDS = ["telefon", "stan", "idealny", "bardzo", "dobry", "sprzedam", "zamienie", "etui", "ladowarka",
+         "gwarancja", "okazja", "uszkodzony", "ekran", "bateria", "pudelko", "faktura", "nowy", "uzywany"]
+# Rows of a single COPY, so the generated CSV does not have to fit in memory at once
+COPY_BATCH_SIZE = 50_000
+STATS_BATCH_SIZE = 1000
+
+
+def copy_rows(table: str, columns: Sequence[str], rows: Iterable[Sequence]) -> int:
+    """
+    Load `rows` to `table` with COPY in batches of COPY_BATCH_SIZE rows.
+    `None` is loaded as NULL and lists as arrays.
+    :return: Number of loaded rows.
+    """
+    connection = engine.raw_connection()
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    count = 0
+
+    try:
+        cursor = connection.cursor()
+
+        def flush(buffer: io.StringIO):
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        for row in rows:
+            writer.writerow([r"\N" if value is None else
+                             "{" + ",".join(f'"{item}"' for item in value) + "}" if isinstance(value, list) else
+                             value for value in row])
+            count += 1
+
+            if count % COPY_BATCH_SIZE == 0:
+                flush(buffer)
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+
+        if buffer.tell() > 0:
+            flush(buffer)
+
+        connection.commit()
+    finally:
+        connection.close()
+
+    logger.info(f"Copied {count} rows to {table}")
+
+    return count
+
+
+def reserve_ids(sequence: str, count: int) -> List[int]:
+    db = SessionLocal()
+
+    try:
+        return db.execute(text("SELECT nextval(:sequence) FROM generate_series(1, :count)"),
+                          {"sequence": sequence, "count": count}).scalars().all()
+    finally:
+        db.close()
+
+
+def seed(offers: int,
+         devices: int,
+         prices_per_device: int,
+         stonks_fraction: float,
+         days: int = 30,
+         random_seed: int = 0):
+    """
+    Seed `devices` devices with `prices_per_device` prices from the last `days` days
+    and `offers` offers, `stonks_fraction` of which have a stonks.
+    """
+    rng = random.Random(random_seed)
+    now = datetime.utcnow()
+
+    def moment() -> datetime:
+        return now - timedelta(seconds=rng.randrange(days * 24 * 3600))
+
+    device_names = [f"{DEVICE_PREFIX}{i}" for i in range(devices)]
+    device_categories = [rng.choice(CATEGORIES) for _ in range(devices)]
+    # Prices of devices span from cheap accessories to expensive laptops
+    base_prices = [round(rng.lognormvariate(6.5, 0.8), 2) for _ in range(devices)]
+
+    db = SessionLocal()
+
+    try:
+        ensure_price_partitions(db)
+    finally:
+        db.close()
+
+    copy_rows("device", ("name", "category", "last_price_update"),
+              ((name, category, moment()) for name, category in zip(device_names, device_categories)))
+    copy_rows("price", ("device_name", "source", "price", "currency", "date"),
+              ((name, "allegro", round(base_price * rng.uniform(0.7, 1.3), 2), "PLN", moment())
+               for name, base_price in zip(device_names, base_prices)
+               for _ in range(prices_per_device)))
+
+    offer_devices = [rng.randrange(devices) if rng.random() < 0.8 else None for _ in range(offers)]
+
+    def offer_rows():
+        for i, device in enumerate(offer_devices):
+            scraped_at = moment()
+            name = device_names[device] if device is not None else None
+            title = " ".join([name or rng.choice(WORDS), *rng.sample(WORDS, 3)])
+            price = base_prices[device] if device is not None else rng.lognormvariate(6.5, 0.8)
+
+            yield (f"{OFFER_PREFIX}{i}",
+                   f"https://example.org/offers/{i}",
+                   title,
+                   " ".join(rng.choices(WORDS, k=rng.randrange(5, 60))),
+                   device_categories[device] if device is not None else rng.choice(CATEGORIES),
+                   name,
+                   round(price * rng.uniform(0.4, 1.2), 2),
+                   "PLN",
+                   [f"https://example.org/photos/{i}/{j}.jpg" for j in range(rng.randrange(4))],
+                   rng.random() < 0.9,
+                   scraped_at,
+                   scraped_at + timedelta(minutes=rng.randrange(60)) if rng.random() < 0.5 else None,
+                   scraped_at + timedelta(minutes=rng.randrange(60)) if rng.random() < 0.7 else None)
+
+    copy_rows("offer", ("id", "url", "title", "description", "category", "device_name", "price", "currency",
+                        "photos", "is_active", "scraped_at", "last_update_at", "last_stonks_check"),
+              offer_rows())
+    copy_rows("delivery", ("offer_id", "title", "price", "currency"),
+              ((f"{OFFER_PREFIX}{i}", title, price, "PLN")
+               for i in range(offers)
+               for title, price in rng.sample([("Paczkomat", 9.99), ("Kurier", 14.99), ("Odbior osobisty", 0)],
+                                              rng.randrange(1, 3))))
+
+    stonks_offers = [i for i, device in enumerate(offer_devices)
+                     if device is not None and rng.random() < stonks_fraction]
+    stonks_ids = reserve_ids("stonks_id_seq", len(stonks_offers))
+
+    copy_rows("stonks", ("id", "stonks_amount", "offer_id", "created_at", "is_active"),
+              ((id, round(rng.uniform(10, 500), 2), f"{OFFER_PREFIX}{i}", moment(), rng.random() < 0.8)
+               for id, i in zip(stonks_ids, stonks_offers)))
+    copy_rows("fee", ("stonks_id", "title", "amount", "currency"),
+              ((id, "Prowizja", round(rng.uniform(1, 50), 2), "PLN") for id in stonks_ids))
+
+    db = SessionLocal()
+
+    try:
+        for batch_start in range(0, devices, STATS_BATCH_SIZE):
+            crud.price_stats.refresh(db, device_names[batch_start:batch_start + STATS_BATCH_SIZE])
+
+        # Planner statistics of freshly loaded tables would be missing until autovacuum analyzes them
+        db.execute(text("ANALYZE device, price, offer, delivery, stonks, fee, device_price_stats"))
+        db.commit()
+    finally:
+        db.close()
+
+
+def clean():
+    db = SessionLocal()
+
+    try:
+        # Deliveries, stonkses, fees, prices and price statistics are deleted by cascade
+        offers = db.execute(text("DELETE FROM offer WHERE id LIKE :prefix"),
+                            {"prefix": f"{OFFER_PREFIX}%"}).rowcount
+        devices = db.execute(text("DELETE FROM device WHERE name LIKE :prefix"),
+                             {"prefix": f"{DEVICE_PREFIX}%"}).rowcount
+        db.commit()
+    finally:
+        db.close()
+
+    logger.info(f"Deleted {offers} offers and {devices} devices")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--offers", type=int, default=100_000)
+    parser.add_argument("--devices", type=int, default=2000)
+    parser.add_argument("--prices", type=int, default=50, help="Prices per device")
+    parser.add_argument("--stonks", type=float, default=0.05, help="Fraction of offers with a stonks")
+    parser.add_argument("--days", type=int, default=30, help="Dates are spread over that many last days")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator")
+    parser.add_argument("--clean", action="store_true", help="Only delete previously seeded rows")
+    args = parser.parse_args()
+
+    clean()
+
+    if args.clean:
+        return
+
+    start = time.monotonic()
+    seed(offers=args.offers,
+         devices=args.devices,
+         prices_per_device=args.prices,
+         stonks_fraction=args.stonks,
+         days=args.days,
+         random_seed=args.seed)
+
+    logger.info(f"Seeded in {time.monotonic() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
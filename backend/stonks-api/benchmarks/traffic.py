@@ -0,0 +1,350 @@
+"""
+Replay the traffic mix of stonks-watcher and stonks-scraper against offers seeded with `benchmarks.seed`.
+Offers and devices created by the benchmark are prefixed like the seeded ones, so `--clean` of the seed removes them.
+
+Every client picks a request from the mix by its weight in a loop until the duration passes.
+Latency percentiles and throughput are reported per route template and saved as JSON,
+so runs can be compared between commits with `benchmarks.compare`, e.g.:
+
+    python -m benchmarks.seed --offers 100000
+    python -m benchmarks.traffic --serve --concurrency 50 --duration 60 --output results/$(git rev-parse --short HEAD).json
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib import parse
+
+import requests
+from sqlalchemy import text
+
+from benchmarks.concurrency import percentile
+from benchmarks.seed import OFFER_PREFIX, DEVICE_PREFIX
+from stonks_api.database import SessionLocal
+
+# Offers and devices requests are made for, sampled from the seeded ones
+SAMPLE_SIZE = 10_000
+
+
+@dataclass
+class Sample:
+    # Id, device name, category and price of offers
+    offers: List[Tuple[str, Optional[str], str, float]]
+    devices: List[str]
+
+
+# Method, path and body of a request
+Request = Tuple[str, str, Optional[dict]]
+
+
+def poll_offers(sample: Sample, rng: random.Random) -> Request:
+    # Watcher polling active offers which were not updated recently, and less often offers without devices
+    if rng.random() < 0.2:
+        return "GET", "/v1/offers?is_active=true&has_device=false&limit=500", None
+
+    before = datetime.utcnow() - timedelta(minutes=rng.randrange(30, 24 * 60))
+
+    return "GET", f"/v1/offers?is_active=true&last_update_before={parse.quote(before.isoformat())}&limit=50", None
+
+
+def get_offer(sample: Sample, rng: random.Random) -> Request:
+    # Scraper checking whether a scraped offer already exists
+    id, *_ = rng.choice(sample.offers)
+
+    return "GET", f"/v1/offers/{id}", None
+
+
+def create_offers(sample: Sample, rng: random.Random) -> Request:
+    # Scraper saving a batch of new offers, `OFFERS_BATCH_SIZE` of stonks-scraper
+    offers = []
+
+    for _ in range(100):
+        id = f"{OFFER_PREFIX}new-{uuid.uuid4().hex}"
+        offers.append({"id": id,
+                       "url": f"https://example.org/offers/{id}",
+                       "title": f"Scraped offer {id}",
+                       "description": "Scraped by the benchmark",
+                       "category": rng.choice(sample.offers)[2],
+                       "price": round(rng.uniform(50, 5000), 2),
+                       "currency": "PLN",
+                       "photos": [f"https://example.org/photos/{id}.jpg"],
+                       "is_active": True,
+                       "deliveries": [{"title": "Paczkomat", "price": 10, "currency": "PLN"}],
+                       "scraped_at": datetime.utcnow().isoformat()})
+
+    return "POST", "/v1/offers/bulk?on_conflict=skip", offers
+
+
+def update_offer(sample: Sample, rng: random.Random) -> Request:
+    id, device_name, category, price = rng.choice(sample.offers)
+
+    return "PUT", f"/v1/offers/{id}", {"url": f"https://example.org/offers/{id}",
+                                       "title": f"Updated offer {id}",
+                                       "description": "Updated by the benchmark",
+                                       "category": category,
+                                       "price": round(price * rng.uniform(0.9, 1.1), 2),
+                                       "currency": "PLN",
+                                       "photos": [],
+                                       "is_active": rng.random() < 0.9,
+                                       "device_name": device_name}
+
+
+def patch_offer(sample: Sample, rng: random.Random) -> Request:
+    # Watcher setting recognized devices of offers, and less often dates of stonks checks
+    id, *_ = rng.choice(sample.offers)
+
+    if rng.random() < 0.2:
+        return "PATCH", f"/v1/offers/{id}", {"last_stonks_check": datetime.utcnow().isoformat()}
+
+    return "PATCH", f"/v1/offers/{id}", {"device_name": rng.choice(sample.devices)}
+
+
+def create_device(sample: Sample, rng: random.Random) -> Request:
+    # Watcher creating devices recognized in offers
+    return "POST", "/v1/devices", {"name": f"{DEVICE_PREFIX}new {uuid.uuid4().hex}",
+                                   "category": rng.choice(sample.offers)[2]}
+
+
+def poll_devices(sample: Sample, rng: random.Random) -> Request:
+    # Watcher polling devices whose prices were not updated recently
+    before = datetime.utcnow() - timedelta(days=7)
+
+    return "GET", f"/v1/devices?last_price_update_before={parse.quote(before.isoformat())}&limit=6", None
+
+
+def create_prices(sample: Sample, rng: random.Random) -> Request:
+    # Watcher saving the cheapest allegro offers of a device
+    return "POST", f"/v1/prices/{parse.quote(rng.choice(sample.devices), safe='')}", {
+        "prices": [{"source": "allegro", "price": round(rng.uniform(50, 5000), 2), "currency": "PLN"}
+                   for _ in range(10)]
+    }
+
+
+def get_prices(sample: Sample, rng: random.Random) -> Request:
+    return "GET", f"/v1/prices/{parse.quote(rng.choice(sample.devices), safe='')}", None
+
+
+def get_price_stats(sample: Sample, rng: random.Random) -> Request:
+    return "GET", f"/v1/devices/{parse.quote(rng.choice(sample.devices), safe='')}/price-stats", None
+
+
+def create_stonks(sample: Sample, rng: random.Random) -> Request:
+    id, *_ = rng.choice(sample.offers)
+
+    return "POST", f"/v1/offers/{id}/stonks", {"stonks_amount": round(rng.uniform(10, 500), 2),
+                                               "fees": [{"title": "Prowizja",
+                                                         "amount": round(rng.uniform(1, 50), 2),
+                                                         "currency": "PLN"}]}
+
+
+def recompute_stonks(sample: Sample, rng: random.Random) -> Request:
+    # Watcher finding stonkses of all offers not checked for a day
+    return "POST", "/v1/stonks/recompute", {
+        "last_stonks_check_before": (datetime.utcnow() - timedelta(days=1)).isoformat(),
+        "sell_fees": {category: 0.045 for category in {category for _, _, category, _ in sample.offers}},
+        "window_days": 7,
+    }
+
+
+# Route template, request factory and default weight.
+# Weights follow the schedules of stonks-watcher tasks and a scraper finding mostly already scraped offers:
+# offers are updated one by one and get devices one by one, while new offers, prices and stonkses are saved in batches.
+TRAFFIC_MIX: Dict[str, Tuple[Callable[[Sample, random.Random], Request], float]] = {
+    "GET /v1/offers": (poll_offers, 3),
+    "GET /v1/offers/{offer_id}": (get_offer, 30),
+    "POST /v1/offers/bulk": (create_offers, 1),
+    "PUT /v1/offers/{offer_id}": (update_offer, 25),
+    "PATCH /v1/offers/{offer_id}": (patch_offer, 12),
+    "POST /v1/devices": (create_device, 10),
+    "GET /v1/devices": (poll_devices, 2),
+    "POST /v1/prices/{device_name}": (create_prices, 8),
+    # Only `find_stonks` of the watcher, which is no longer scheduled, checks single offers
+    "GET /v1/devices/{device_name}/price-stats": (get_price_stats, 1),
+    "POST /v1/offers/{offer_id}/stonks": (create_stonks, 1),
+    "POST /v1/stonks/recompute": (recompute_stonks, 1),
+    # Not sent by the watcher since it uses price statistics, enabled with --mix
+    "GET /v1/prices/{device_name}": (get_prices, 0),
+}
+
+
+def load_sample(size: int = SAMPLE_SIZE) -> Sample:
+    db = SessionLocal()
+
+    try:
+        offers = db.execute(text("SELECT id, device_name, category, price FROM offer "
+                                 "WHERE id LIKE :prefix ORDER BY random() LIMIT :size"),
+                            {"prefix": f"{OFFER_PREFIX}%", "size": size}).all()
+        devices = db.execute(text("SELECT name FROM device WHERE name LIKE :prefix ORDER BY random() LIMIT :size"),
+                             {"prefix": f"{DEVICE_PREFIX}%", "size": size}).scalars().all()
+    finally:
+        db.close()
+
+    if len(offers) == 0 or len(devices) == 0:
+        raise RuntimeError("No seeded offers or devices, run `python -m benchmarks.seed` first")
+
+    return Sample(offers=[(id, device_name, category, float(price)) for id, device_name, category, price in offers],
+                  devices=devices)
+
+
+def run_client(url: str,
+               sample: Sample,
+               weights: Dict[str, float],
+               deadline: float,
+               rng: random.Random,
+               results: List[Tuple[str, float, bool]]):
+    session = requests.Session()
+    routes = list(weights)
+    route_weights = [weights[route] for route in routes]
+
+    while time.monotonic() < deadline:
+        route, = rng.choices(routes, route_weights)
+        method, path, body = TRAFFIC_MIX[route][0](sample, rng)
+        start = time.monotonic()
+
+        try:
+            ok = session.request(method, url + path, json=body, timeout=30).ok
+        except requests.RequestException:
+            ok = False
+
+        # list.append is atomic, so results can be shared between threads
+        results.append((route, time.monotonic() - start, ok))
+
+
+def summarize(results: List[Tuple[float, bool]], elapsed: float) -> dict:
+    latencies = [latency for latency, ok in results if ok]
+
+    return {
+        "requests": len(results),
+        "errors": sum(not ok for _, ok in results),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000 if latencies else 0.0,
+        "p95_ms": percentile(latencies, 0.95) * 1000 if latencies else 0.0,
+        "p99_ms": percentile(latencies, 0.99) * 1000 if latencies else 0.0,
+    }
+
+
+def run(url: str, sample: Sample, weights: Dict[str, float], concurrency: int, duration: float,
+        random_seed: int = 0) -> dict:
+    results: List[Tuple[str, float, bool]] = []
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=run_client,
+                                args=(url, sample, weights, deadline, random.Random(random_seed + i), results))
+               for i in range(concurrency)]
+
+    start = time.monotonic()
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+    elapsed = time.monotonic() - start
+
+    return {
+        "total": summarize([(latency, ok) for _, latency, ok in results], elapsed),
+        "routes": {route: summarize([(latency, ok) for r, latency, ok in results if r == route], elapsed)
+                   for route in weights},
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def serve(port: int, workers: int) -> subprocess.Popen:
+    """
+    Start uvicorn with the API from the current directory and wait until it responds.
+    """
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+                               "--workers", str(workers), "--log-level", "warning"],
+                              env={**os.environ, "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING")})
+    deadline = time.monotonic() + 30
+
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://localhost:{port}/docs", timeout=1)
+            return server
+        except requests.ConnectionError:
+            time.sleep(0.2)
+
+    server.terminate()
+    raise RuntimeError("uvicorn did not start in 30 seconds")
+
+
+def parse_mix(values: Optional[List[str]]) -> Dict[str, float]:
+    weights = {route: weight for route, (_, weight) in TRAFFIC_MIX.items()}
+
+    for value in values or []:
+        route, _, weight = value.rpartition("=")
+
+        if route not in TRAFFIC_MIX:
+            raise ValueError(f"Unknown route {route}, expected one of: {', '.join(TRAFFIC_MIX)}")
+
+        weights[route] = float(weight)
+
+    return {route: weight for route, weight in weights.items() if weight > 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=50, help="Number of concurrent clients")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds")
+    parser.add_argument("--mix", action="append", metavar="ROUTE=WEIGHT",
+                        help='Weight of a route, e.g. "PUT /v1/offers/{offer_id}=0" to disable it. '
+                             "May be given many times.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generators")
+    parser.add_argument("--serve", action="store_true",
+                        help="Start uvicorn on the port of --url for the duration of the benchmark")
+    parser.add_argument("--workers", type=int, default=1, help="Number of uvicorn workers with --serve")
+    parser.add_argument("--output", help="Save results to this JSON file")
+    args = parser.parse_args()
+
+    try:
+        weights = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    sample = load_sample()
+    server = serve(parse.urlparse(args.url).port or 80, args.workers) if args.serve else None
+
+    # After the server started, right before the clients
+    started_at = datetime.utcnow()
+
+    try:
+        result = run(args.url, sample, weights, args.concurrency, args.duration, args.seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    result = {
+        "commit": git_commit(),
+        "started_at": started_at.isoformat(),
+        "config": {"url": args.url, "concurrency": args.concurrency, "duration": args.duration,
+                   "workers": args.workers if args.serve else None, "mix": weights},
+        **result,
+    }
+
+    print(f"{'route':<45} {'requests':>9} {'errors':>7} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+
+    for route, summary in [*result["routes"].items(), ("total", result["total"])]:
+        print(f"{route:<45} {summary['requests']:>9} {summary['errors']:>7} {summary['rps']:>8.1f} "
+              f"{summary['p50_ms']:>8.1f} {summary['p95_ms']:>8.1f} {summary['p99_ms']:>8.1f}")
+
+    if args.output is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+
+        with open(args.output, "w") as file:
+            json.dump(result, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+from _pytest.config import Config
+
+from stonks_api.tests.worker_database import CLONE_DATABASE, prepare_test_template
+
+
+def pytest_configure(config: Config):
+    # xdist controller migrates the template database once, its workers only clone it
+    is_controller = not hasattr(config, "workerinput") and getattr(config.option, "dist", "no") != "no"
+
+    if CLONE_DATABASE and is_controller:
+        prepare_test_template()
+
@@ -1,9 +1,18 @@
 """Configure handlers and formats for application loggers."""
 import logging
+import sys
 
 from loguru import logger
 
 
+def configure_logging(level: str):
+    """
+    Log to stderr through a queue, so writing logs never blocks request handling.
+    """
+    logger.remove()
+    logger.add(sys.stderr, level=level, enqueue=True)
+
+
 class InterceptHandler(logging.Handler):
     def emit(self, record):
         # Get corresponding Loguru level if it exists
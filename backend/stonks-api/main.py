@@ -1,19 +1,52 @@
 import logging
 import os
 
-from fastapi import FastAPI, Request
-from fastapi.params import Depends
+from fastapi import FastAPI
 from loguru import logger
 
-from logger import InterceptHandler
+from logger import InterceptHandler, configure_logging
 from stonks_api.api.v1.api import api_router
-from starlette.routing import Match
 
-from stonks_api.database import create_no_device
+from stonks_api.database import create_no_device, DATABASE_REPLICA_URL, DATABASE_REPLICA_LAG_WINDOW
+from stonks_api.metrics import metrics_response, mark_process_dead
+from stonks_api.middleware import TimingMiddleware, CompressionMiddleware
+from stonks_api.notifications import stonks_broadcaster
+from stonks_api.profiling import ProfileMode, configure_explain_log
+from stonks_api.replica import ReadYourWritesMiddleware
 
 DEBUG = True if os.getenv("ENV", "production") == "development" else False
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG" if DEBUG else "INFO")
+# Fraction of requests which have their body logged, bodies larger than LOG_BODY_MAX_SIZE bytes are never logged
+LOG_BODY_SAMPLE_RATE = float(os.getenv("LOG_BODY_SAMPLE_RATE", 0))
+LOG_BODY_MAX_SIZE = int(os.getenv("LOG_BODY_MAX_SIZE", 10_000))
+# off, header (only requests with `X-SQL-Profile: 1`) or on
+SQL_PROFILE = ProfileMode(os.getenv("SQL_PROFILE", "off"))
+# Profiled statements slower than that are logged with their plan to SQL_PROFILE_LOG
+SQL_PROFILE_SLOW_MS = float(os.getenv("SQL_PROFILE_SLOW_MS", 100))
+SQL_PROFILE_LOG = os.getenv("SQL_PROFILE_LOG", "logs/slow_statements.log")
+# Responses smaller than that many bytes are not compressed, 0 disables compression
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", 1000))
+
+configure_logging(LOG_LEVEL)
+
+if SQL_PROFILE != ProfileMode.off:
+    configure_explain_log(SQL_PROFILE_LOG)
+
 app = FastAPI(debug=DEBUG)
 
+if GZIP_MIN_SIZE > 0:
+    # Added first, so request durations logged by `TimingMiddleware` include compression
+    app.add_middleware(CompressionMiddleware, minimum_size=GZIP_MIN_SIZE, exclude_paths=["/v1/stonks/stream"])
+
+app.add_middleware(TimingMiddleware,
+                   body_sample_rate=LOG_BODY_SAMPLE_RATE,
+                   max_body_size=LOG_BODY_MAX_SIZE,
+                   sql_profile=SQL_PROFILE,
+                   slow_query_threshold=SQL_PROFILE_SLOW_MS / 1000)
+
+if DATABASE_REPLICA_URL is not None:
+    app.add_middleware(ReadYourWritesMiddleware, lag_window=DATABASE_REPLICA_LAG_WINDOW)
+
 for logger_name in logging.root.manager.loggerDict:
     if logger_name.startswith("uvicorn."):
         logging.getLogger(logger_name).handlers = []
@@ -23,33 +56,27 @@ logging.getLogger("uvicorn").handlers = [handler]
 logging.getLogger("uvicorn.access").handlers = [handler]
 
 
-async def log_middle(request: Request):
-    logger.debug(f"{request.method} {request.url}")
-    routes = request.app.router.routes
-
-    logger.debug("Params:")
-    for route in routes:
-        match, scope = route.matches(request)
-        if match == Match.FULL:
-            for name, value in scope["path_params"].items():
-                logger.debug(f"\t{name}: {value}")
-
-    logger.debug("Headers:")
-    for name, value in request.headers.items():
-        logger.debug(f"\t{name}: {value}")
-
-    logger.debug("Body:")
-    logger.debug(await request.body())
-
-
 @app.on_event("startup")
 async def on_startup():
     create_no_device()
 
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    mark_process_dead()
+    await stonks_broadcaster.stop()
+    # Write out logs still waiting in the queue
+    await logger.complete()
+
+
 @app.get("/")
 async def index():
     return {"message": "SWEET HOME ALABAMA"}
 
 
-app.include_router(api_router, prefix="/v1", dependencies=[Depends(log_middle)])
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
+
+
+app.include_router(api_router, prefix="/v1")
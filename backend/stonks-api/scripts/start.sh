@@ -2,5 +2,11 @@
 
 #"$(dirname "$0")/prestart.sh" || exit
 
+# Metrics of previous runs must not be aggregated with the new ones
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 echo "Starting production server on port 80"
 uvicorn main:app --host 0.0.0.0 --port=80 --log-level=info
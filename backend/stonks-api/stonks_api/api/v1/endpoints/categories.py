@@ -7,14 +7,14 @@ from sqlalchemy.orm import Session
 from stonks_types import schemas
 
 from stonks_api import crud
-from stonks_api.database import get_db
+from stonks_api.database import get_db, get_read_db
 
 router = APIRouter()
 
 
 @router.get("/", response_model=List[schemas.Category])
 def get_category(category_id: Optional[int] = None,
-                 db: Session = Depends(get_db)):
+                 db: Session = Depends(get_read_db)):
     # if category_id is not None:
     categories = crud.category.get_children(db=db, parent_id=category_id)
     # logger.debug(category)
@@ -1,17 +1,23 @@
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response, Query
 from fastapi.params import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from starlette.responses import JSONResponse
 from stonks_types import schemas
 
 from stonks_api import crud
-from stonks_api.database import get_db
+from stonks_api.crud.crud_price_stats import PRICE_STATS_WINDOWS
+from stonks_api.database import get_db, get_async_db, get_read_db, get_async_read_db
+from stonks_api.pagination import InvalidCursor, invalid_cursor, set_next_cursor
 
 router = APIRouter()
 
+# Maximum number of devices of a single batched price statistics request
+MAX_PRICE_STATS_DEVICES = 500
+
 
 def device_not_found(device: schemas.DeviceBase):
     if device is None:
@@ -19,18 +25,127 @@ def device_not_found(device: schemas.DeviceBase):
 
 
 @router.get("/", response_model=List[schemas.Device])
-def get_devices(limit: int = 500,
+def get_devices(response: Response,
+                limit: int = 500,
                 skip: int = 0,
                 last_price_update_before: datetime = None,
-                db: Session = Depends(get_db)):
-    devices = crud.device.get_many(db=db,
-                                   limit=limit,
-                                   skip=skip,
-                                   last_price_update_before=last_price_update_before)
+                cursor: Optional[str] = None,
+                db: Session = Depends(get_read_db)):
+    try:
+        devices = crud.device.get_many(db=db,
+                                       limit=limit,
+                                       skip=skip,
+                                       last_price_update_before=last_price_update_before,
+                                       cursor=cursor)
+    except InvalidCursor:
+        invalid_cursor()
+
+    set_next_cursor(response, devices, limit, crud.device.cursor_key)
 
     return devices
 
 
+def parse_window(window: str) -> int:
+    """
+    Parse statistics window like `7d` to days, only windows with precomputed statistics are supported.
+    """
+    days = window[:-1] if window.endswith("d") else None
+
+    if days is None or not days.isdigit() or int(days) not in PRICE_STATS_WINDOWS:
+        windows = ", ".join(f"{window_days}d" for window_days in PRICE_STATS_WINDOWS)
+        raise HTTPException(status_code=400, detail=f"Unsupported window, use one of: {windows}.")
+
+    return int(days)
+
+
+@router.get("/price-stats", response_model=List[schemas.PriceStats])
+async def get_many_price_stats(name: List[str] = Query(...),
+                               window: str = "7d",
+                               db: AsyncSession = Depends(get_async_read_db)):
+    """
+    Get price statistics of many devices, devices without statistics are left out.
+    """
+    window_days = parse_window(window)
+
+    if len(name) > MAX_PRICE_STATS_DEVICES:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {MAX_PRICE_STATS_DEVICES} devices can be requested at once.")
+
+    return await crud.price_stats.get_many_async(db=db,
+                                                 device_names=name,
+                                                 window_days=window_days)
+
+
+@router.get("/similar", response_model=List[schemas.SimilarDevice])
+async def get_similar_devices(name: str = Query(..., min_length=1),
+                              limit: int = 10,
+                              threshold: float = Query(0.3, ge=0, le=1),
+                              db: AsyncSession = Depends(get_async_read_db)):
+    """
+    Get devices with names similar to `name`, the most similar first.
+    Names like "iphone 8", "iphone8" and "iphone 8 64gb" are similar, such duplicates can be merged with `merge`.
+    """
+    devices = await crud.device.get_similar_async(db=db,
+                                                  name=name,
+                                                  limit=limit,
+                                                  threshold=threshold)
+
+    return [schemas.SimilarDevice(**schemas.Device.from_orm(device).dict(), similarity=similarity)
+            for device, similarity in devices]
+
+
+@router.post("/{device_name:path}/merge", response_model=schemas.DeviceMergeResult)
+async def merge_devices(device_name: str,
+                        merge: schemas.DeviceMerge,
+                        db: AsyncSession = Depends(get_async_db)):
+    """
+    Merge duplicates into the device: their offers and prices are moved to it and the duplicates are deleted,
+    so prices of a single device are looked up instead of each duplicate.
+    """
+    duplicates = list(dict.fromkeys(merge.duplicates))
+
+    if device_name in duplicates:
+        raise HTTPException(status_code=400, detail="Device cannot be merged into itself.")
+
+    db_device = await crud.device.get_one_by_name_async(db=db, name=device_name)
+    device_not_found(db_device)
+    db_duplicates = await crud.device.get_many_by_names_async(db=db, names=duplicates)
+    missing = set(duplicates) - {device.name for device in db_duplicates}
+
+    if len(missing) > 0:
+        raise HTTPException(status_code=404, detail=f"Devices not found: {', '.join(sorted(missing))}.")
+
+    moved_offers, moved_prices = await crud.device.merge_async(db=db,
+                                                               name=device_name,
+                                                               duplicates=duplicates)
+    # Last price update could have been changed by the merge
+    await db.refresh(db_device)
+
+    return schemas.DeviceMergeResult(device=schemas.Device.from_orm(db_device),
+                                     merged=duplicates,
+                                     moved_offers=moved_offers,
+                                     moved_prices=moved_prices)
+
+
+@router.get("/{device_name:path}/price-stats", response_model=schemas.PriceStats)
+async def get_price_stats(device_name: str,
+                          window: str = "7d",
+                          db: AsyncSession = Depends(get_async_read_db)):
+    """
+    Get statistics of device prices from the last `window` days, refreshed whenever prices of the device are added.
+    """
+    window_days = parse_window(window)
+    db_stats = await crud.price_stats.get_one_async(db=db,
+                                                    device_name=device_name,
+                                                    window_days=window_days)
+
+    if db_stats is None:
+        device_not_found(await crud.device.get_one_by_name_async(db=db, name=device_name))
+        raise HTTPException(status_code=404, detail="Price statistics not found.")
+
+    return db_stats
+
+
 @router.post("/", response_model=schemas.Device, status_code=201)
 def create_device(device: schemas.DeviceCreate,
                   db: Session = Depends(get_db)):
@@ -0,0 +1,66 @@
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from stonks_types import schemas
+
+from stonks_api import crud
+from stonks_api.database import get_async_read_db
+from stonks_api.export import export_response
+
+router = APIRouter()
+
+
+@router.get("/offers")
+async def export_offers(format: schemas.ExportFormat = schemas.ExportFormat.ndjson,
+                        last_update_before: Optional[datetime] = None,
+                        last_update_after: Optional[datetime] = None,
+                        scraped_before: Optional[datetime] = None,
+                        scraped_after: Optional[datetime] = None,
+                        last_stonks_check_before: Optional[datetime] = None,
+                        has_device: Optional[bool] = None,
+                        is_active: Optional[bool] = True,
+                        db: AsyncSession = Depends(get_async_read_db)):
+    """
+    Export all offers matching the filters of `GET /offers` ordered by scrape date, as NDJSON or CSV.
+    Offers are streamed while they are read, instead of paging through them.
+    """
+    statement = crud.offer.select_export(last_update_before=last_update_before,
+                                         last_update_after=last_update_after,
+                                         scraped_before=scraped_before,
+                                         scraped_after=scraped_after,
+                                         last_stonks_check_before=last_stonks_check_before,
+                                         has_device=has_device,
+                                         is_active=is_active)
+
+    return export_response(db, statement, "offers", format)
+
+
+@router.get("/prices")
+async def export_prices(format: schemas.ExportFormat = schemas.ExportFormat.ndjson,
+                        device_name: Optional[str] = None,
+                        newer_than: Optional[datetime] = None,
+                        older_than: Optional[datetime] = None,
+                        db: AsyncSession = Depends(get_async_read_db)):
+    """
+    Export prices of the device, or of all devices if `device_name` is not given, as NDJSON or CSV.
+    Prices are not ordered.
+    """
+    statement = crud.price.select_export(device_name=device_name,
+                                         newer_than=newer_than,
+                                         older_than=older_than)
+
+    return export_response(db, statement, "prices", format)
+
+
+@router.get("/stonks")
+async def export_stonks(format: schemas.ExportFormat = schemas.ExportFormat.ndjson,
+                        is_active: Optional[bool] = True,
+                        db: AsyncSession = Depends(get_async_read_db)):
+    """
+    Export stonkses ordered by id, with category, device name and price of their offers, as NDJSON or CSV.
+    """
+    statement = crud.stonks.select_export(is_active=is_active)
+
+    return export_response(db, statement, "stonks", format)
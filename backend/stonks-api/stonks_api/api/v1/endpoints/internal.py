@@ -0,0 +1,18 @@
+from fastapi import APIRouter
+
+from stonks_api.database import engine, async_engine
+from stonks_api.pool import pool_status
+
+router = APIRouter()
+
+
+@router.get("/pool")
+def get_pool_status():
+    """
+    Connection pool usage of this worker.
+    `wait_*` is time spent getting a connection from the pool, including opening a new one.
+    """
+    return {
+        "sync": pool_status(engine),
+        "async": pool_status(async_engine.sync_engine),
+    }
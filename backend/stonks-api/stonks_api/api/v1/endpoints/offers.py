@@ -1,16 +1,19 @@
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Union
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response, Query
 from fastapi import Depends
 from requests import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.responses import JSONResponse
 from stonks_types import schemas
 
 # from stonks_api.api.v1.endpoints.device_recognizer import device_recognizer
 from stonks_api import crud
 from stonks_api.api.v1.endpoints.devices import device_not_found
-from stonks_api.database import get_db
+from stonks_api.database import get_db, get_async_db, get_read_db, get_async_read_db
+from stonks_api.pagination import InvalidCursor, invalid_cursor, set_next_cursor
+from stonks_api.views import summary_response
 
 router = APIRouter()
 
@@ -25,34 +28,99 @@ def delivery_not_found(delivery):
         raise HTTPException(status_code=404, detail="Delivery not found")
 
 
-@router.get("/", response_model=List[schemas.Offer])
-def get_offers(skip: int = 0,
-               limit: int = 50,
-               last_update_before: Optional[datetime] = None,
-               last_update_after: Optional[datetime] = None,
-               scraped_before: Optional[datetime] = None,
-               scraped_after: Optional[datetime] = None,
-               last_stonks_check_before: Optional[datetime] = None,
-               has_device: Optional[bool] = None,
-               is_active: Optional[bool] = True,
-               db: Session = Depends(get_db)):
-    offers = crud.offer.get_many(db=db,
-                                 skip=skip,
-                                 limit=limit,
-                                 last_update_before=last_update_before,
-                                 last_update_after=last_update_after,
-                                 scraped_before=scraped_before,
-                                 scraped_after=scraped_after,
-                                 last_stonks_check_before=last_stonks_check_before,
-                                 has_device=has_device,
-                                 is_active=is_active)
+# Summaries are serialized by `summary_response`, the union documents both views
+@router.get("/", response_model=Union[List[schemas.Offer], List[schemas.OfferSummary]])
+async def get_offers(response: Response,
+                     skip: int = 0,
+                     limit: int = 50,
+                     last_update_before: Optional[datetime] = None,
+                     last_update_after: Optional[datetime] = None,
+                     scraped_before: Optional[datetime] = None,
+                     scraped_after: Optional[datetime] = None,
+                     last_stonks_check_before: Optional[datetime] = None,
+                     has_device: Optional[bool] = None,
+                     is_active: Optional[bool] = True,
+                     cursor: Optional[str] = None,
+                     view: schemas.ResponseView = schemas.ResponseView.full,
+                     db: AsyncSession = Depends(get_async_read_db)):
+    """
+    Get offers ordered by scrape date.
+    If the page is full, `X-Next-Cursor` header contains a cursor which can be passed as `cursor`
+    to get the next page. Cursor pagination should be preferred over `skip`.
+    With `view=summary` offers are returned without description, photos, deliveries and device,
+    which are not read from the database either.
+    """
+    summary = view == schemas.ResponseView.summary
+
+    try:
+        offers = await crud.offer.get_many_async(db=db,
+                                                 skip=skip,
+                                                 limit=limit,
+                                                 last_update_before=last_update_before,
+                                                 last_update_after=last_update_after,
+                                                 scraped_before=scraped_before,
+                                                 scraped_after=scraped_after,
+                                                 last_stonks_check_before=last_stonks_check_before,
+                                                 has_device=has_device,
+                                                 is_active=is_active,
+                                                 cursor=cursor,
+                                                 load=crud.offer.summary_load_options if summary else None)
+    except InvalidCursor:
+        invalid_cursor()
+
+    set_next_cursor(response, offers, limit, crud.offer.cursor_key)
+
+    if summary:
+        return summary_response(response, schemas.OfferSummary, offers)
 
     return offers
 
 
+# Must be defined before `/{offer_id}`, otherwise it would be matched as an offer id
+@router.get("/search", response_model=List[schemas.Offer])
+async def search_offers(response: Response,
+                        q: str = Query(..., min_length=1, max_length=200),
+                        limit: int = 50,
+                        category: Optional[str] = None,
+                        min_price: Optional[float] = None,
+                        max_price: Optional[float] = None,
+                        is_active: Optional[bool] = True,
+                        cursor: Optional[str] = None,
+                        db: AsyncSession = Depends(get_async_read_db)):
+    """
+    Search offers by words of their title and description, best matches first.
+    `q` supports web search syntax: `"quoted phrases"`, `or` and `-excluded` words.
+    Words are matched exactly (case insensitive), without stemming.
+    If the page is full, `X-Next-Cursor` header contains a cursor of the next page.
+    """
+    try:
+        rows = await crud.offer.search_async(db=db,
+                                             q=q,
+                                             limit=limit,
+                                             category=category,
+                                             min_price=min_price,
+                                             max_price=max_price,
+                                             is_active=is_active,
+                                             cursor=cursor)
+    except InvalidCursor:
+        invalid_cursor()
+
+    set_next_cursor(response, rows, limit, crud.offer.search_cursor_key)
+
+    return [offer for offer, rank in rows]
+
+
 @router.get("/{offer_id}", response_model=schemas.Offer)
-def get_offer(offer_id: str, db: Session = Depends(get_db)):
-    offer = crud.offer.get_one(db=db, id=offer_id)
+async def get_offer(offer_id: str,
+                    include_archived: bool = False,
+                    db: AsyncSession = Depends(get_async_read_db)):
+    """
+    Get offer by id. Inactive offers moved to the archive are returned only if `include_archived` is true.
+    """
+    offer = await crud.offer.get_one_async(db=db, id=offer_id)
+
+    if offer is None and include_archived:
+        offer = await crud.offer_archive.get_one_async(db=db, id=offer_id)
 
     offer_not_found(offer)
 
@@ -84,16 +152,33 @@ def create_offer(offer: schemas.OfferCreate,
     return db_offer
 
 
+@router.post("/bulk", response_model=List[schemas.OfferBulkResult])
+def create_offers_bulk(offers: List[schemas.OfferCreate],
+                       on_conflict: schemas.OfferConflict = schemas.OfferConflict.update,
+                       db: Session = Depends(get_db)):
+    """
+    Create or update many offers with their deliveries in a single transaction.
+    Returns status of every offer in the order they were sent.
+    With `on_conflict=skip` existing offers are left untouched.
+    """
+    results = crud.offer.create_bulk(db=db,
+                                     new_models=offers,
+                                     update_existing=on_conflict == schemas.OfferConflict.update)
+
+    return results
+
+
 @router.put("/{offer_id}", response_model=schemas.Offer)
-def update_offer(offer_id: str,
-                 offer: schemas.OfferUpdate,
-                 get_device_model: bool = False,
-                 db: Session = Depends(get_db)):
+async def update_offer(offer_id: str,
+                       offer: schemas.OfferUpdate,
+                       get_device_model: bool = False,
+                       db: AsyncSession = Depends(get_async_db)):
     """
     Update offer information.
     Note that you cannot update delivery information from here, instead you must call /offers/id/deliveries/id
     """
-    db_offer = crud.offer.get_one(db=db, id=offer_id)
+    # Only existence is checked, updated offer is loaded with its relationships below
+    db_offer = await crud.offer.get_one_async(db=db, id=offer_id, load=())
 
     offer_not_found(db_offer)
 
@@ -102,9 +187,45 @@ def update_offer(offer_id: str,
     #     model = device_recognizer.get_info(offer.title).model.lower()
     #     offer.device_model = model if len(model) > 2 else None
 
-    db_offer = crud.offer.update(db=db,
-                                 id=offer_id,
-                                 update_model=offer)
+    db_offer = await crud.offer.update_async(db=db,
+                                             id=offer_id,
+                                             update_model=offer)
+
+    return db_offer
+
+
+@router.patch("/", response_model=List[schemas.OfferBulkResult])
+def patch_offers(patches: List[schemas.OfferPatchItem],
+                 db: Session = Depends(get_db)):
+    """
+    Partially update many offers in a single transaction.
+    Only fields which are sent are updated, `last_update_at` is not changed unless it is sent.
+    Returns status of every patch in the order they were sent.
+    """
+    results = crud.offer.patch_many(db=db,
+                                    patches=patches)
+
+    return results
+
+
+@router.patch("/{offer_id}", response_model=schemas.Offer)
+def patch_offer(offer_id: str,
+                offer: schemas.OfferPatch,
+                db: Session = Depends(get_db)):
+    """
+    Partially update offer.
+    Only fields which are sent are updated, `last_update_at` is not changed unless it is sent.
+    """
+    if offer.device_name is not None:
+        # Offers without recognized device are set to `_no_device`, which `get_one_by_name` does not return
+        if len(crud.device.get_existing_names(db=db, names=[offer.device_name.lower()])) == 0:
+            raise HTTPException(status_code=404, detail="Device not found.")
+
+    db_offer = crud.offer.patch(db=db,
+                                id=offer_id,
+                                patch_model=offer)
+
+    offer_not_found(db_offer)
 
     return db_offer
 
@@ -124,7 +245,7 @@ def delete_offer(offer_id: str, db: Session = Depends(get_db)):
 def get_deliveries_for_offer(offer_id: str,
                              skip: int = 0,
                              limit: int = 50,
-                             db: Session = Depends(get_db)):
+                             db: Session = Depends(get_read_db)):
     offer = crud.offer.get_one(db=db, id=offer_id)
     offer_not_found(offer)
 
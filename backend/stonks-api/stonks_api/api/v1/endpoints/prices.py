@@ -1,44 +1,67 @@
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Dict, List
 from urllib import parse
 
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from stonks_types import schemas
 
 from stonks_api import crud
 from stonks_api.api.v1.endpoints.devices import device_not_found
-from stonks_api.database import get_db
+from stonks_api.database import get_async_db, get_async_read_db
 
 router = APIRouter()
 
 
+@router.post("/bulk", response_model=schemas.PricesBulkResult, status_code=201)
+async def create_prices_bulk(prices: Dict[str, List[schemas.PriceCreate]],
+                             db: AsyncSession = Depends(get_async_db)):
+    """
+    Create prices of many devices in a single transaction, the body maps device names to their new prices.
+    Every existing device is marked as updated, even without new prices.
+    Returns number of created prices of every device and names of devices which do not exist.
+    """
+    result = await crud.price.create_bulk_async(db=db,
+                                                prices=prices,
+                                                commit=False)
+    await crud.price_stats.refresh_async(db=db,
+                                         device_names=[name for name, count in result.created.items() if count > 0],
+                                         commit=False)
+    await db.commit()
+
+    return result
+
+
 @router.get("/{device_name:path}", response_model=schemas.Prices)
-def get_prices_for_device(device_name: str,
-                          newer_than: Optional[datetime] = None,
-                          older_than: Optional[datetime] = None,
-                          db: Session = Depends(get_db)):
-    device = crud.device.get_one_by_name(db=db, name=device_name)
+async def get_prices_for_device(device_name: str,
+                                newer_than: Optional[datetime] = None,
+                                older_than: Optional[datetime] = None,
+                                db: AsyncSession = Depends(get_async_read_db)):
+    device = await crud.device.get_one_by_name_async(db=db, name=device_name)
     device_not_found(device)
 
-    db_prices = crud.price.get_many(db=db,
-                                    device_name=device_name,
-                                    newer_than=newer_than,
-                                    older_than=older_than)
+    db_prices = await crud.price.get_many_async(db=db,
+                                                device_name=device_name,
+                                                newer_than=newer_than,
+                                                older_than=older_than)
 
     return schemas.Prices(prices=db_prices)
 
 
 @router.post("/{device_name:path}", response_model=schemas.Prices, status_code=201)
-def create_prices(device_name: str,
-                  prices: schemas.PricesCreate,
-                  db: Session = Depends(get_db)):
-    device = crud.device.get_one_by_name(db=db, name=device_name)
+async def create_prices(device_name: str,
+                        prices: schemas.PricesCreate,
+                        db: AsyncSession = Depends(get_async_db)):
+    device = await crud.device.get_one_by_name_async(db=db, name=device_name)
     device_not_found(device)
-    db_prices = crud.price.create_many(db=db,
-                                       name=device_name,
-                                       prices=prices.prices)
+    db_prices = await crud.price.create_for_device_async(db=db,
+                                                         name=device_name,
+                                                         prices=prices.prices,
+                                                         commit=False)
+    await crud.price_stats.refresh_async(db=db,
+                                         device_names=[device_name],
+                                         commit=False)
     device.last_price_update = datetime.utcnow()
-    db.commit()
+    await db.commit()
 
     return schemas.Prices(prices=db_prices)
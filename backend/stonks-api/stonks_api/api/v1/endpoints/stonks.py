@@ -1,13 +1,19 @@
-from typing import List, Optional
+from decimal import Decimal
+from typing import List, Optional, Union
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.responses import StreamingResponse
 from stonks_types import schemas
 
 from stonks_api import crud
 from stonks_api.api.v1.endpoints.offers import offer_not_found
 from stonks_api.crud import crud_stonks
-from stonks_api.database import get_db
+from stonks_api.database import get_db, get_async_db, get_async_read_db
+from stonks_api.notifications import stonks_broadcaster, stonks_events
+from stonks_api.pagination import InvalidCursor, invalid_cursor, set_next_cursor
+from stonks_api.views import summary_response
 
 router = APIRouter()
 
@@ -17,38 +23,93 @@ def stonks_not_found(stonks):
         raise HTTPException(status_code=404, detail="Stonks not found")
 
 
-@router.get("/stonks", response_model=List[schemas.Stonks])
-def get_stonks_list(skip: int = 0,
-                    limit: int = 50,
-                    is_active: Optional[bool] = True,
-                    sort: schemas.StonksSortBy = schemas.StonksSortBy.stonks_amount_desc,
-                    db: Session = Depends(get_db)):
-    db_stonkses = crud.stonks.get_many(db=db,
-                                       skip=skip,
-                                       limit=limit)
+# Summaries are serialized by `summary_response`, the union documents both views
+@router.get("/stonks", response_model=Union[List[schemas.Stonks], List[schemas.StonksSummary]])
+async def get_stonks_list(response: Response,
+                          skip: int = 0,
+                          limit: int = 50,
+                          is_active: Optional[bool] = True,
+                          sort: schemas.StonksSortBy = schemas.StonksSortBy.stonks_amount_desc,
+                          cursor: Optional[str] = None,
+                          view: schemas.ResponseView = schemas.ResponseView.full,
+                          db: AsyncSession = Depends(get_async_read_db)):
+    """
+    Get stonkses ordered by `sort`.
+    Price sorts use statistics of device prices from the last 7 days, stonkses of devices without prices are last.
+    When sorting by `stonks_amount`, `X-Next-Cursor` header contains a cursor of the next page if the page is full.
+    With `view=summary` stonkses are returned without fees and with summaries of their offers.
+    """
+    summary = view == schemas.ResponseView.summary
+
+    if cursor is not None and sort not in crud_stonks.CURSOR_SORTS:
+        raise HTTPException(status_code=400, detail="Cursor pagination is supported only for stonks_amount sorts")
+
+    try:
+        db_stonkses = await crud.stonks.get_many_async(db=db,
+                                                       skip=skip,
+                                                       limit=limit,
+                                                       is_active=is_active,
+                                                       cursor=cursor,
+                                                       sort=sort,
+                                                       load=crud.stonks.summary_load_options if summary else None)
+    except InvalidCursor:
+        invalid_cursor()
+
+    if sort in crud_stonks.CURSOR_SORTS:
+        set_next_cursor(response, db_stonkses, limit, crud.stonks.cursor_key)
+
+    if summary:
+        return summary_response(response, schemas.StonksSummary, db_stonkses)
 
     return db_stonkses
 
 
+# Must be defined before `/stonks/{stonks_id}`, otherwise it would be matched as a stonks id
+@router.get("/stonks/stream")
+async def stream_stonks(category: Optional[str] = None,
+                        min_stonks_amount: Optional[Decimal] = None):
+    """
+    Stream new stonkses as server-sent events, instead of polling `/stonks`.
+    Every stonks is sent as a `stonks` event with the stonks as JSON data, as soon as it is created.
+    `category` matches its subcategories too. Keepalive comments are sent while there are no new stonkses.
+    """
+    subscription = stonks_broadcaster.subscribe(category=category, min_stonks_amount=min_stonks_amount)
+
+    return StreamingResponse(stonks_events(subscription),
+                             media_type="text/event-stream",
+                             # Proxies must not buffer the stream
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @router.get("/stonks/{stonks_id}", response_model=schemas.Stonks)
-def get_stonks(stonks_id: int,
-               db: Session = Depends(get_db)):
-    db_stonks = crud.stonks.get_one(db=db, id=stonks_id)
+async def get_stonks(stonks_id: int,
+                     db: AsyncSession = Depends(get_async_read_db)):
+    db_stonks = await crud.stonks.get_one_async(db=db, id=stonks_id)
     stonks_not_found(db_stonks)
 
     return db_stonks
 
 
+@router.post("/stonks/recompute", response_model=schemas.StonksRecomputeResult)
+async def recompute_stonks(recompute: schemas.StonksRecompute,
+                           db: AsyncSession = Depends(get_async_db)):
+    """
+    Find stonkses of all active offers with a device, which were not checked since `last_stonks_check_before`,
+    with a single statement. All such offers are marked checked, stonkses are created for the profitable ones.
+    """
+    return await crud.stonks.recompute_async(db=db, recompute=recompute)
+
+
 @router.post("/offers/{offer_id}/stonks", response_model=schemas.Stonks, status_code=201)
-def create_stonks(offer_id: str,
-                  stonks: schemas.StonksCreate,
-                  db: Session = Depends(get_db)):
-    offer = crud.offer.get_one(db=db, id=offer_id)
+async def create_stonks(offer_id: str,
+                        stonks: schemas.StonksCreate,
+                        db: AsyncSession = Depends(get_async_db)):
+    offer = await crud.offer.get_one_async(db=db, id=offer_id, load=())
     offer_not_found(offer)
 
-    db_stonks = crud.stonks.create_for_offer(db=db,
-                                             offer_id=offer_id,
-                                             stonks=stonks)
+    db_stonks = await crud.stonks.create_for_offer_async(db=db,
+                                                         offer_id=offer_id,
+                                                         stonks=stonks)
 
     return db_stonks
 
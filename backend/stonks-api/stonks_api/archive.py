@@ -0,0 +1,104 @@
+"""
+Archive of inactive offers.
+
+Offers which are inactive for longer than the retention are moved, together with their deliveries,
+stonkses and fees, to `*_archive` tables, so the hot tables keep only offers which can still be bought.
+Archived offers can still be fetched by id with `GET /v1/offers/{offer_id}?include_archived=true`.
+
+Offers are moved in batches, each in its own short transaction, optionally pausing between them.
+Locks are held only for a single batch and dead rows of every batch can be vacuumed
+while the next ones are moved, instead of a single long transaction holding back VACUUM until it ends.
+"""
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from loguru import logger
+from sqlalchemy import select, insert, delete, func, literal, DateTime
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Insert
+
+from stonks_api import models
+
+
+def _copy_statement(model, archive_model, where, archived_at: Optional[datetime] = None) -> Insert:
+    """
+    Copy rows of `model` matching `where` to `archive_model`, which has the same columns and optionally `archived_at`.
+    Generated columns and columns missing in the archive, e.g. statistics copied to stonkses, are not archived.
+    """
+    columns = [c for c in model.__table__.columns if c.computed is None and c.name in archive_model.__table__.columns]
+    names = [c.name for c in columns]
+
+    if archived_at is not None:
+        columns.append(literal(archived_at, DateTime))
+        names.append("archived_at")
+
+    return insert(archive_model).from_select(names, select(*columns).where(where))
+
+
+def archive_offers_batch(db: Session, cutoff: datetime, batch_size: int) -> int:
+    """
+    Move at most `batch_size` offers which are inactive since before `cutoff` to the archive.
+    :return: Number of archived offers.
+    """
+    last_update = func.coalesce(models.Offer.last_update_at, models.Offer.scraped_at)
+    # Offers locked by concurrent updates are left for the next run
+    ids = db.execute(select(models.Offer.id)
+                     .filter(models.Offer.is_active == False, last_update < cutoff)
+                     .order_by(last_update)
+                     .limit(batch_size)
+                     .with_for_update(skip_locked=True)).scalars().all()
+
+    if len(ids) == 0:
+        db.rollback()
+
+        return 0
+
+    stonks_ids = select(models.Stonks.id).where(models.Stonks.offer_id.in_(ids))
+
+    # Offer archived before, which became active and inactive again, is replaced by the newer copy
+    db.execute(delete(models.OfferArchive)
+               .where(models.OfferArchive.id.in_(ids))
+               .execution_options(synchronize_session=False))
+    db.execute(_copy_statement(models.Offer, models.OfferArchive, models.Offer.id.in_(ids),
+                               archived_at=datetime.utcnow()))
+    db.execute(_copy_statement(models.Delivery, models.DeliveryArchive, models.Delivery.offer_id.in_(ids)))
+    db.execute(_copy_statement(models.Stonks, models.StonksArchive, models.Stonks.offer_id.in_(ids)))
+    db.execute(_copy_statement(models.Fee, models.FeeArchive, models.Fee.stonks_id.in_(stonks_ids)))
+    # Deliveries, stonkses and fees are deleted by cascade
+    db.execute(delete(models.Offer)
+               .where(models.Offer.id.in_(ids))
+               .execution_options(synchronize_session=False))
+    db.commit()
+
+    return len(ids)
+
+
+def archive_offers(db: Session,
+                   older_than_days: int,
+                   batch_size: int = 500,
+                   max_batches: Optional[int] = None,
+                   pause: float = 0.0) -> int:
+    """
+    Archive offers which are inactive and were not updated for `older_than_days` days.
+    :param max_batches: Stop after that many batches, the rest is archived by the next run.
+    :param pause: Seconds to sleep between batches.
+    :return: Number of archived offers.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    archived = 0
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        moved = archive_offers_batch(db, cutoff, batch_size)
+        archived += moved
+        batches += 1
+
+        logger.info(f"Archived batch of {moved} offers, {archived} in total")
+
+        if moved < batch_size:
+            break
+
+        time.sleep(pause)
+
+    return archived
@@ -0,0 +1,122 @@
+"""
+Maintenance jobs of the stonks database, meant to be run periodically, e.g. by cron:
+
+    python -m stonks_api.cli price-partitions
+    python -m stonks_api.cli price-retention --keep-days 90
+    python -m stonks_api.cli archive-offers --older-than-days 30
+    python -m stonks_api.cli recompute-stonks --sell-fees sell_fees.json
+"""
+import argparse
+import json
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from loguru import logger
+from stonks_types import schemas
+
+from logger import configure_logging
+from stonks_api import archive, crud
+from stonks_api.database import SessionLocal
+from stonks_api.partitions import ensure_price_partitions, roll_up_prices
+
+
+def price_partitions(args: argparse.Namespace):
+    db = SessionLocal()
+
+    try:
+        ensure_price_partitions(db, months_ahead=args.months_ahead)
+    finally:
+        db.close()
+
+
+def price_retention(args: argparse.Namespace):
+    db = SessionLocal()
+
+    try:
+        roll_up_prices(db, keep_days=args.keep_days)
+    finally:
+        db.close()
+
+
+def archive_offers(args: argparse.Namespace):
+    db = SessionLocal()
+
+    try:
+        archive.archive_offers(db,
+                               older_than_days=args.older_than_days,
+                               batch_size=args.batch_size,
+                               max_batches=args.max_batches,
+                               pause=args.pause)
+    finally:
+        db.close()
+
+
+def recompute_stonks(args: argparse.Namespace):
+    with open(args.sell_fees) as file:
+        sell_fees = json.load(file)
+
+    recompute = schemas.StonksRecompute(
+        last_stonks_check_before=datetime.utcnow() - timedelta(minutes=args.older_than_minutes),
+        sell_fees=sell_fees,
+        window_days=args.window_days,
+        limit=args.limit
+    )
+    db = SessionLocal()
+
+    try:
+        result = crud.stonks.recompute(db, recompute)
+    finally:
+        db.close()
+
+    logger.info(f"Checked {result.checked_offers} offers, found {result.created_stonkses} stonkses")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m stonks_api.cli",
+                                     description="Maintenance jobs of the stonks database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("price-partitions",
+                                  help="Create monthly price partitions of the current and upcoming months.")
+    command.add_argument("--months-ahead", type=int, default=2)
+    command.set_defaults(func=price_partitions)
+
+    command = commands.add_parser("price-retention",
+                                  help="Roll up old prices into daily aggregates and drop them.")
+    command.add_argument("--keep-days", type=int, default=int(os.getenv("PRICE_RETENTION_DAYS", "90")))
+    command.set_defaults(func=price_retention)
+
+    command = commands.add_parser("archive-offers",
+                                  help="Move offers inactive for a long time with their stonkses to the archive.")
+    command.add_argument("--older-than-days", type=int, default=int(os.getenv("OFFER_ARCHIVE_DAYS", "30")))
+    command.add_argument("--batch-size", type=int, default=500)
+    command.add_argument("--max-batches", type=int, default=None)
+    command.add_argument("--pause", type=float, default=0.5, help="Seconds to sleep between batches.")
+    command.set_defaults(func=archive_offers)
+
+    command = commands.add_parser("recompute-stonks",
+                                  help="Find stonkses of all offers which were not checked recently.")
+    command.add_argument("--sell-fees", required=True,
+                         help="JSON file with sell fee of every category, e.g. {\"laptops\": 0.02}.")
+    command.add_argument("--older-than-minutes", type=int, default=1440)
+    command.add_argument("--window-days", type=int, default=7, help="Use device prices from that many days.")
+    command.add_argument("--limit", type=int, default=None)
+    command.set_defaults(func=recompute_stonks)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    configure_logging(os.getenv("LOG_LEVEL", "INFO"))
+
+    try:
+        args.func(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    main()
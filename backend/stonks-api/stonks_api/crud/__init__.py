@@ -5,3 +5,5 @@ from .crud_prices import price
 from .crud_categories import category
 from .crud_fees import fees
 from .crud_stonks import stonks
+from .crud_price_stats import price_stats
+from .crud_offer_archive import offer_archive
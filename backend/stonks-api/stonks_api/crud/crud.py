@@ -1,7 +1,11 @@
-from typing import TypeVar, Generic, List, Optional, Type, Union
+from typing import TypeVar, Generic, List, Optional, Type, Union, Sequence, Iterator
 
 from loguru import logger
+from sqlalchemy import select, insert, update, delete, inspect, Column
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select, Insert, Update
 
 TModel = TypeVar("TModel")
 CreateType = TypeVar("CreateType")
@@ -9,6 +13,11 @@ UpdateType = TypeVar("UpdateType")
 
 
 class CrudBase(Generic[TModel, CreateType, UpdateType]):
+    # Loader strategies of relationships serialized in responses, used unless `load` is given.
+    # Without them every row lazy loads its relationships with separate queries,
+    # which is not possible at all with AsyncSession.
+    load_options: Sequence = ()
+
     def __init__(self, t_model: Type[TModel]):
         self.model = t_model
 
@@ -25,39 +34,80 @@ class CrudBase(Generic[TModel, CreateType, UpdateType]):
 
     def create(self,
                db: Session,
-               new_model: Union[Type[CreateType], dict]) -> TModel:
+               new_model: Union[Type[CreateType], dict],
+               commit: bool = True) -> TModel:
         logger.debug(f"Creating model {new_model}")
 
-        # Support for both plain dictionaries and pydantic models
-        if type(new_model) == dict:
-            db_model = self.model(**new_model)
-        else:
-            db_model = self.model(**new_model.dict())
-
-        db.add(db_model)
-        db.commit()
-        db.refresh(db_model)
-
-        return db_model
+        return self.create_many(db=db, new_models=[new_model], commit=commit)[0]
 
     def update(self,
                db: Session,
                id: Union[int, str],
-               update_model: Union[Type[UpdateType], dict]) -> TModel:
+               update_model: Union[Type[UpdateType], dict],
+               commit: bool = True) -> Optional[TModel]:
         logger.debug(f"Updating model id={id} with {update_model}")
-        query = db.query(self.model).filter(self.model.id == id)
+        db_models = self.update_many(db=db, ids=[id], update_model=update_model, commit=commit)
 
-        if type(update_model) == dict:
-            update_dict = update_model
-        else:
-            update_dict = update_model.dict()
+        return db_models[0] if len(db_models) > 0 else None
 
-        query.update(update_dict)
-        db.commit()
+    def create_many(self,
+                    db: Session,
+                    new_models: Sequence[Union[CreateType, dict]],
+                    commit: bool = True,
+                    chunk_size: int = 1000) -> List[TModel]:
+        """
+        Create models with multi-row inserts, loading them from the inserted rows instead of refreshing each one.
+        With `commit=False` the caller is responsible for committing, so several operations can share a transaction.
+        """
+        db_models = []
+
+        for stmt in self._insert_statements(insert(self.model), new_models, chunk_size):
+            db_models += db.execute(self._returning(stmt)).scalars().all()
+
+        if commit:
+            db.commit()
+
+        return db_models
+
+    def update_many(self,
+                    db: Session,
+                    ids: Sequence[Union[int, str]],
+                    update_model: Union[UpdateType, dict],
+                    commit: bool = True) -> List[TModel]:
+        """
+        Set the same values on all models with given ids with a single statement.
+        :return: Updated models, models which do not exist are omitted.
+        """
+        db_models = db.execute(self._returning(self._update_statement(ids, update_model))).scalars().all()
+
+        if commit:
+            db.commit()
+
+        return db_models
+
+    def upsert_many(self,
+                    db: Session,
+                    new_models: Sequence[Union[CreateType, dict]],
+                    index_elements: Optional[Sequence[str]] = None,
+                    update_columns: Optional[Sequence[str]] = None,
+                    commit: bool = True,
+                    chunk_size: int = 1000) -> List[TModel]:
+        """
+        Create models or update the existing ones with `INSERT ... ON CONFLICT DO UPDATE`.
+        A model must not be repeated in `new_models`, a row cannot be updated twice by the same statement.
+        :param index_elements: Columns of the unique index detecting conflicts, the primary key by default.
+        :param update_columns: Columns updated on conflict, all inserted columns except `index_elements` by default.
+            Existing models are left untouched and not returned if there is nothing to update.
+        """
+        db_models = []
+
+        for stmt in self._upsert_statements(new_models, index_elements, update_columns, chunk_size):
+            db_models += db.execute(self._returning(stmt)).scalars().all()
 
-        db_offer = query.first()
+        if commit:
+            db.commit()
 
-        return db_offer
+        return db_models
 
     def remove(self,
                db: Session,
@@ -65,3 +115,182 @@ class CrudBase(Generic[TModel, CreateType, UpdateType]):
         logger.debug(f"Removing model id={id}")
         db.query(self.model).filter_by(id=id).delete()
         db.commit()
+
+    def _to_dict(self, model: Union[CreateType, UpdateType, dict]) -> dict:
+        # Support for both plain dictionaries and pydantic models
+        return model if type(model) == dict else model.dict()
+
+    def _returning(self, stmt: Union[Insert, Update]) -> Select:
+        """
+        Select models from rows returned by `stmt`, replacing state of models already in the session.
+        Generated columns are deferred and not returned. Relationships are not loaded.
+        """
+        columns = [column for column in self.model.__table__.columns if column.computed is None]
+
+        return select(self.model)\
+            .from_statement(stmt.returning(*columns))\
+            .execution_options(populate_existing=True)
+
+    def _insert_statements(self,
+                           stmt: Insert,
+                           new_models: Sequence[Union[CreateType, dict]],
+                           chunk_size: int) -> Iterator[Insert]:
+        # Chunks keep a single statement below the limit of bind parameters
+        rows = [self._to_dict(new_model) for new_model in new_models]
+
+        for chunk_start in range(0, len(rows), chunk_size):
+            yield stmt.values(rows[chunk_start:chunk_start + chunk_size])
+
+    def _upsert_statements(self,
+                           new_models: Sequence[Union[CreateType, dict]],
+                           index_elements: Optional[Sequence[str]],
+                           update_columns: Optional[Sequence[str]],
+                           chunk_size: int) -> Iterator[Insert]:
+        if index_elements is None:
+            index_elements = [column.name for column in self.model.__table__.primary_key]
+
+        if update_columns is None and len(new_models) > 0:
+            update_columns = [name for name in self._to_dict(new_models[0]) if name not in index_elements]
+
+        for stmt in self._insert_statements(postgresql.insert(self.model), new_models, chunk_size):
+            if update_columns:
+                yield stmt.on_conflict_do_update(index_elements=index_elements,
+                                                 set_={name: stmt.excluded[name] for name in update_columns})
+            else:
+                yield stmt.on_conflict_do_nothing(index_elements=index_elements)
+
+    @property
+    def _primary_key(self) -> Column:
+        # Not always `id`, e.g. devices are identified by name
+        primary_key, = inspect(self.model).primary_key
+
+        return primary_key
+
+    def _update_statement(self, ids: Sequence[Union[int, str]], update_model: Union[UpdateType, dict]) -> Update:
+        return update(self.model)\
+            .where(self._primary_key.in_(ids))\
+            .values(self._to_dict(update_model))\
+            .execution_options(synchronize_session=False)
+
+    def _options(self, load: Optional[Sequence] = None) -> Sequence:
+        return self.load_options if load is None else load
+
+    def _select_one(self, id: Union[int, str], load: Optional[Sequence] = None) -> Select:
+        return select(self.model)\
+            .where(self._primary_key == id)\
+            .options(*self._options(load))\
+            .execution_options(populate_existing=True)
+
+    async def get_one_async(self,
+                            db: AsyncSession,
+                            id: Union[int, str],
+                            load: Optional[Sequence] = None) -> Optional[TModel]:
+        """
+        :param load: Loader options replacing `load_options`, e.g. `()` if relationships are not needed.
+        """
+        logger.debug(f"Downloading one from db with id={id}")
+        result = await db.execute(self._select_one(id, load))
+
+        return result.scalars().first()
+
+    async def get_many_async(self,
+                             db: AsyncSession,
+                             skip: int,
+                             limit: int,
+                             load: Optional[Sequence] = None) -> List[TModel]:
+        logger.debug(f"Getting many models of {type(self.model)}")
+        result = await db.execute(select(self.model).options(*self._options(load)).offset(skip).limit(limit))
+
+        return result.scalars().all()
+
+    async def create_async(self,
+                           db: AsyncSession,
+                           new_model: Union[Type[CreateType], dict],
+                           commit: bool = True) -> TModel:
+        """
+        Create model and return it with relationships from `load_options`.
+        """
+        logger.debug(f"Creating model {new_model}")
+        db_model, = await self.create_many_async(db=db, new_models=[new_model], commit=commit)
+
+        return await self.get_one_async(db=db, id=inspect(db_model).identity[0])
+
+    async def update_async(self,
+                           db: AsyncSession,
+                           id: Union[int, str],
+                           update_model: Union[Type[UpdateType], dict],
+                           commit: bool = True) -> Optional[TModel]:
+        """
+        Update model and return it with relationships from `load_options`.
+        With `commit=False` the change is only flushed and the caller is responsible for committing.
+        """
+        logger.debug(f"Updating model id={id} with {update_model}")
+        db_models = await self.update_many_async(db=db, ids=[id], update_model=update_model, commit=commit)
+
+        if len(db_models) == 0:
+            return None
+
+        return await self.get_one_async(db=db, id=id)
+
+    async def create_many_async(self,
+                                db: AsyncSession,
+                                new_models: Sequence[Union[CreateType, dict]],
+                                commit: bool = True,
+                                chunk_size: int = 1000) -> List[TModel]:
+        """
+        Asynchronous `create_many`, relationships of returned models are not loaded.
+        """
+        db_models = []
+
+        for stmt in self._insert_statements(insert(self.model), new_models, chunk_size):
+            result = await db.execute(self._returning(stmt))
+            db_models += result.scalars().all()
+
+        if commit:
+            await db.commit()
+
+        return db_models
+
+    async def update_many_async(self,
+                                db: AsyncSession,
+                                ids: Sequence[Union[int, str]],
+                                update_model: Union[UpdateType, dict],
+                                commit: bool = True) -> List[TModel]:
+        """
+        Asynchronous `update_many`, relationships of returned models are not loaded.
+        """
+        result = await db.execute(self._returning(self._update_statement(ids, update_model)))
+        db_models = result.scalars().all()
+
+        if commit:
+            await db.commit()
+
+        return db_models
+
+    async def upsert_many_async(self,
+                                db: AsyncSession,
+                                new_models: Sequence[Union[CreateType, dict]],
+                                index_elements: Optional[Sequence[str]] = None,
+                                update_columns: Optional[Sequence[str]] = None,
+                                commit: bool = True,
+                                chunk_size: int = 1000) -> List[TModel]:
+        """
+        Asynchronous `upsert_many`, relationships of returned models are not loaded.
+        """
+        db_models = []
+
+        for stmt in self._upsert_statements(new_models, index_elements, update_columns, chunk_size):
+            result = await db.execute(self._returning(stmt))
+            db_models += result.scalars().all()
+
+        if commit:
+            await db.commit()
+
+        return db_models
+
+    async def remove_async(self,
+                           db: AsyncSession,
+                           id: Union[int, str]):
+        logger.debug(f"Removing model id={id}")
+        await db.execute(delete(self.model).where(self._primary_key == id))
+        await db.commit()
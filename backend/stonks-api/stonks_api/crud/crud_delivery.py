@@ -12,14 +12,13 @@ class CrudDelivery(CrudBase[models.Delivery, schemas.DeliveryCreate, schemas.Del
     def create_deliveries_for_offer(self,
                                     db: Session,
                                     offer_id: str,
-                                    deliveries: List[schemas.DeliveryCreate]) -> List[models.Delivery]:
+                                    deliveries: List[schemas.DeliveryCreate],
+                                    commit: bool = True) -> List[models.Delivery]:
         logger.debug(f"Creating deliveries for offer id={offer_id}")
-        db_deliveries = [self.model(**delivery.dict(),
-                                    offer_id=offer_id) for delivery in deliveries]
-        db.add_all(db_deliveries)
-        db.commit()
 
-        return db_deliveries
+        return self.create_many(db=db,
+                                new_models=[{**delivery.dict(), "offer_id": offer_id} for delivery in deliveries],
+                                commit=commit)
 
     def get_deliveries_for_offer(self,
                                  db: Session,
@@ -1,11 +1,15 @@
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Tuple, Iterable, Set
 from loguru import logger
+from sqlalchemy import func, select, update, delete, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from stonks_types import schemas
 
-from stonks_api import models
+from stonks_api import models, crud
 from stonks_api.crud.crud import CrudBase
+from stonks_api.pagination import decode_cursor
 
 
 class CrudDevice(CrudBase[models.Device, schemas.DeviceCreate, schemas.DeviceUpdate]):
@@ -14,21 +18,145 @@ class CrudDevice(CrudBase[models.Device, schemas.DeviceCreate, schemas.DeviceUpd
         return db.query(models.Device).filter((models.Device.name == name) &
                                               (models.Device.name != "_no_device")).first()
 
+    async def get_one_by_name_async(self, db: AsyncSession, name: str) -> Optional[models.Device]:
+        logger.debug(f"Getting device with name={name}")
+        result = await db.execute(select(models.Device).filter((models.Device.name == name) &
+                                                               (models.Device.name != "_no_device")))
+
+        return result.scalars().first()
+
+    def get_existing_names(self, db: Session, names: Iterable[str]) -> Set[str]:
+        """
+        Get which of `names` exist, unlike `get_one_by_name` including `_no_device` which offers can be set to.
+        """
+        names = set(names)
+
+        if len(names) == 0:
+            return set()
+
+        return {name for name, in db.query(models.Device.name).filter(models.Device.name.in_(names))}
+
+    async def get_many_by_names_async(self, db: AsyncSession, names: List[str]) -> List[models.Device]:
+        result = await db.execute(select(models.Device).filter(models.Device.name.in_(names),
+                                                               models.Device.name != "_no_device"))
+
+        return result.scalars().all()
+
+    async def get_similar_async(self,
+                                db: AsyncSession,
+                                name: str,
+                                limit: int = 10,
+                                threshold: float = 0.3) -> List[Tuple[models.Device, float]]:
+        """
+        Get devices with names similar to `name`, the most similar first. Requires pg_trgm extension.
+        :param threshold: Minimal trigram similarity of names, from 0 to 1.
+        :return: Devices with similarity of their names.
+        """
+        name = name.lower()
+        similarity = func.similarity(models.Device.name, name)
+
+        # `%` operator can use the trigram index, unlike comparing similarity, but its threshold is a setting
+        await db.execute(select(func.set_config("pg_trgm.similarity_threshold", str(threshold), True)))
+        result = await db.execute(select(models.Device, similarity.label("similarity"))
+                                  .filter(models.Device.name.op("%")(name), models.Device.name != "_no_device")
+                                  .order_by(similarity.desc(), models.Device.name)
+                                  .limit(limit))
+
+        return [(device, similarity) for device, similarity in result.all()]
+
+    async def merge_async(self,
+                          db: AsyncSession,
+                          name: str,
+                          duplicates: List[str]) -> Tuple[int, int]:
+        """
+        Move offers, prices and price aggregates of `duplicates` to device `name` and delete the duplicates,
+        in a single transaction. Devices must exist.
+        :return: Number of moved offers and prices.
+        """
+        logger.debug(f"Merging devices {duplicates} into {name}")
+
+        moved_offers = 0
+
+        for offer_model in (models.Offer, models.OfferArchive):
+            result = await db.execute(update(offer_model)
+                                      .where(offer_model.device_name.in_(duplicates))
+                                      .values(device_name=name)
+                                      .execution_options(synchronize_session=False))
+
+            if offer_model is models.Offer:
+                moved_offers = result.rowcount
+
+        result = await db.execute(update(models.Price)
+                                  .where(models.Price.device_name.in_(duplicates))
+                                  .values(device_name=name)
+                                  .execution_options(synchronize_session=False))
+        moved_prices = result.rowcount
+
+        daily = models.PriceDaily
+        stmt = insert(daily).from_select(
+            ["device_name", "day", "currency", "sample_count", "min_price", "max_price", "sum_price"],
+            select(literal(name), daily.day, daily.currency, func.sum(daily.sample_count), func.min(daily.min_price),
+                   func.max(daily.max_price), func.sum(daily.sum_price))
+            .where(daily.device_name.in_(duplicates))
+            .group_by(daily.day, daily.currency)
+        )
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[daily.device_name, daily.day, daily.currency],
+            set_={"sample_count": daily.sample_count + stmt.excluded.sample_count,
+                  "min_price": func.least(daily.min_price, stmt.excluded.min_price),
+                  "max_price": func.greatest(daily.max_price, stmt.excluded.max_price),
+                  "sum_price": daily.sum_price + stmt.excluded.sum_price}
+        ))
+
+        # Prices of the merged device are as fresh as the freshest prices of the duplicates
+        last_price_update = select(func.max(models.Device.last_price_update))\
+            .where(models.Device.name.in_([name, *duplicates]))\
+            .scalar_subquery()
+        await db.execute(update(models.Device)
+                         .where(models.Device.name == name)
+                         .values(last_price_update=last_price_update)
+                         .execution_options(synchronize_session=False))
+
+        # Price aggregates and statistics of the duplicates are deleted by cascade
+        await db.execute(delete(models.Device)
+                         .where(models.Device.name.in_(duplicates))
+                         .execution_options(synchronize_session=False))
+        await crud.price_stats.refresh_async(db=db, device_names=[name], commit=False)
+        await db.commit()
+
+        return moved_offers, moved_prices
+
     def get_many(self,
                  db: Session,
                  skip: int,
                  limit: int,
-                 last_price_update_before: Optional[datetime] = None) -> List[models.Device]:
+                 last_price_update_before: Optional[datetime] = None,
+                 cursor: Optional[str] = None) -> List[models.Device]:
+        """
+        Get devices ordered by name.
+        If `cursor` is given, `skip` is ignored and devices after the cursor are returned.
+        """
         q = db.query(models.Device).filter((models.Device.name != "_no_device"))
 
         if last_price_update_before is not None:
-            q = q.filter((models.Device.last_price_update < last_price_update_before) |
-                         (models.Device.last_price_update == None))
+            q = q.filter(func.coalesce(models.Device.last_price_update, models.NEGATIVE_INFINITY) <
+                         last_price_update_before)
+
+        q = q.order_by(models.Device.name)
 
-        devices = q.offset(skip).limit(limit).all()
+        if cursor is not None:
+            name, = decode_cursor(cursor, str)
+            q = q.filter(models.Device.name > name)
+        else:
+            q = q.offset(skip)
+
+        devices = q.limit(limit).all()
 
         return devices
 
+    def cursor_key(self, db_device: models.Device):
+        return db_device.name,
+
     def create(self,
                db: Session,
                new_model: schemas.DeviceCreate) -> models.Device:
@@ -1,5 +1,6 @@
 from typing import List
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from stonks_types import schemas
 
@@ -8,23 +9,23 @@ from stonks_api.crud.crud import CrudBase
 
 
 class CrudFees(CrudBase[models.Fee, schemas.FeeCreate, schemas.FeeUpdate]):
-    def create_many(self,
-                    db: Session,
-                    stonks_id: int,
-                    fees: List[schemas.FeeCreate]):
-        db_fees = []
-
-        for fee in fees:
-            db_fee = self.model(**fee.dict(),
-                                stonks_id=stonks_id)
-            db.add(db_fee)
-            db.flush()
-            db.refresh(db_fee)
-            db_fees.append(db_fee)
-
-        db.commit()
-
-        return db_fees
+    def create_for_stonks(self,
+                          db: Session,
+                          stonks_id: int,
+                          fees: List[schemas.FeeCreate],
+                          commit: bool = True) -> List[models.Fee]:
+        return self.create_many(db=db,
+                                new_models=[{**fee.dict(), "stonks_id": stonks_id} for fee in fees],
+                                commit=commit)
+
+    async def create_for_stonks_async(self,
+                                      db: AsyncSession,
+                                      stonks_id: int,
+                                      fees: List[schemas.FeeCreate],
+                                      commit: bool = True) -> List[models.Fee]:
+        return await self.create_many_async(db=db,
+                                            new_models=[{**fee.dict(), "stonks_id": stonks_id} for fee in fees],
+                                            commit=commit)
 
 
 fees = CrudFees(models.Fee)
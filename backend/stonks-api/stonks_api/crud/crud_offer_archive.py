@@ -0,0 +1,15 @@
+from sqlalchemy.orm import selectinload, joinedload
+from stonks_types import schemas
+
+from stonks_api import models
+from stonks_api.crud.crud import CrudBase
+
+
+class CrudOfferArchive(CrudBase[models.OfferArchive, schemas.OfferCreate, schemas.OfferUpdate]):
+    """
+    Read only access to offers moved to the archive by `stonks_api.archive`.
+    """
+    load_options = (selectinload(models.OfferArchive.deliveries), joinedload(models.OfferArchive.device))
+
+
+offer_archive = CrudOfferArchive(models.OfferArchive)
@@ -1,27 +1,39 @@
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple, Sequence
 
-from sqlalchemy.orm import Session
+from sqlalchemy import tuple_, func, literal_column, Boolean, String, values, column, update, cast, select
+from sqlalchemy.dialects.postgresql import insert, REAL
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload, joinedload, load_only
+from sqlalchemy.sql import Select
 from stonks_types import schemas
 
 from stonks_api import models, crud
 from stonks_api.crud.crud import CrudBase
+from stonks_api.pagination import decode_cursor, parse_datetime
 
 
 class CrudOffers(CrudBase[models.Offer, schemas.OfferCreate, schemas.OfferUpdate]):
-    def get_many(self,
-                 db: Session,
-                 skip: int,
-                 limit: int,
-                 last_update_before: Optional[datetime] = None,
-                 last_update_after: Optional[datetime] = None,
-                 scraped_before: Optional[datetime] = None,
-                 scraped_after: Optional[datetime] = None,
-                 last_stonks_check_before: Optional[datetime] = None,
-                 has_device: Optional[bool] = None,
-                 is_active: bool = True,
-                 ) -> List[models.Offer]:
-        q = db.query(models.Offer)
+    # Device is many-to-one, so it is joined to the offers query; deliveries are loaded with a single extra query
+    load_options = (selectinload(models.Offer.deliveries), joinedload(models.Offer.device))
+    # Columns of `schemas.OfferSummary`, without relationships and large columns like description and photos
+    summary_columns = (models.Offer.id, models.Offer.url, models.Offer.title, models.Offer.category,
+                       models.Offer.price, models.Offer.currency, models.Offer.is_active, models.Offer.device_name,
+                       models.Offer.scraped_at, models.Offer.last_update_at, models.Offer.last_stonks_check)
+    summary_load_options = (load_only(*summary_columns),)
+
+    def _filter(self,
+                q: Select,
+                last_update_before: Optional[datetime] = None,
+                last_update_after: Optional[datetime] = None,
+                scraped_before: Optional[datetime] = None,
+                scraped_after: Optional[datetime] = None,
+                last_stonks_check_before: Optional[datetime] = None,
+                has_device: Optional[bool] = None,
+                is_active: bool = True) -> Select:
+        """
+        Filter offers selected by `q`, the same filters are used to list and to export offers.
+        """
         q = q.filter(models.Offer.is_active == is_active)
 
         if has_device:
@@ -36,20 +48,124 @@ class CrudOffers(CrudBase[models.Offer, schemas.OfferCreate, schemas.OfferUpdate
             q = q.filter(models.Offer.scraped_at >= scraped_after)
 
         if last_update_before is not None:
-            q = q.filter((models.Offer.last_update_at <= last_update_before) |
-                         ((models.Offer.last_update_at == None) & (models.Offer.scraped_at <= last_update_before)))
+            # Offers that were never updated are compared by their scrape date
+            q = q.filter(func.coalesce(models.Offer.last_update_at, models.Offer.scraped_at) <= last_update_before)
 
         if last_update_after is not None:
             q = q.filter(models.Offer.last_update_at >= last_update_after)
 
         if last_stonks_check_before is not None:
-            q = q.filter((models.Offer.last_stonks_check < last_stonks_check_before) |
-                         (models.Offer.last_stonks_check == None))
+            q = q.filter(func.coalesce(models.Offer.last_stonks_check, models.NEGATIVE_INFINITY) <
+                         last_stonks_check_before)
+
+        return q
+
+    def _select_many(self,
+                     skip: int,
+                     limit: int,
+                     cursor: Optional[str] = None,
+                     **filters) -> Select:
+        """
+        Build query selecting offers ordered by (scraped_at, id), see `_filter` for filters.
+        If `cursor` is given, `skip` is ignored and offers after the cursor are selected,
+        so the page cost does not grow with its depth.
+        """
+        q = self._filter(select(models.Offer), **filters).order_by(models.Offer.scraped_at, models.Offer.id)
+
+        if cursor is not None:
+            scraped_at, id = decode_cursor(cursor, parse_datetime, str)
+            q = q.filter(tuple_(models.Offer.scraped_at, models.Offer.id) > tuple_(scraped_at, id))
+        else:
+            q = q.offset(skip)
+
+        return q.limit(limit)
+
+    def select_export(self, **filters) -> Select:
+        """
+        Build query selecting columns of all offers matching `filters` ordered by (scraped_at, id),
+        see `_filter` for filters.
+        """
+        columns = [column for column in models.Offer.__table__.columns if column.name != "search_vector"]
+
+        return self._filter(select(*columns), **filters).order_by(models.Offer.scraped_at, models.Offer.id)
+
+    def get_many(self,
+                 db: Session,
+                 load: Optional[Sequence] = None,
+                 **filters) -> List[models.Offer]:
+        """
+        Get offers ordered by (scraped_at, id), see `_select_many` for filters.
+        :param load: Loader options replacing `load_options`.
+        """
+        return db.execute(self._select_many(**filters).options(*self._options(load))).scalars().all()
+
+    async def get_many_async(self,
+                             db: AsyncSession,
+                             load: Optional[Sequence] = None,
+                             **filters) -> List[models.Offer]:
+        result = await db.execute(self._select_many(**filters).options(*self._options(load)))
+
+        return result.scalars().all()
+
+    def cursor_key(self, db_offer: models.Offer):
+        return db_offer.scraped_at, db_offer.id
+
+    def _select_search(self,
+                       q: str,
+                       limit: int,
+                       category: Optional[str] = None,
+                       min_price: Optional[float] = None,
+                       max_price: Optional[float] = None,
+                       is_active: Optional[bool] = True,
+                       cursor: Optional[str] = None) -> Select:
+        """
+        Build query selecting offers matching web search query `q` (e.g. `pixel 3a -uszkodzony`) with their rank,
+        ordered by (rank, id) descending. Offers of subcategories of `category` match it too.
+        :raises InvalidCursor: if the cursor is invalid.
+        """
+        query = func.websearch_to_tsquery(literal_column(f"'{models.SEARCH_CONFIG}'::regconfig"), q)
+        rank = func.ts_rank_cd(models.Offer.search_vector, query, type_=REAL)
+
+        stmt = select(models.Offer, rank.label("rank")).filter(models.Offer.search_vector.op("@@")(query))
 
-        q = q.offset(skip).limit(limit)
-        offers = q.all()
+        if is_active is not None:
+            stmt = stmt.filter(models.Offer.is_active == is_active)
 
-        return offers
+        if category is not None:
+            stmt = stmt.filter((models.Offer.category == category) |
+                               models.Offer.category.startswith(f"{category}/", autoescape=True))
+
+        if min_price is not None:
+            stmt = stmt.filter(models.Offer.price >= min_price)
+
+        if max_price is not None:
+            stmt = stmt.filter(models.Offer.price <= max_price)
+
+        if cursor is not None:
+            after_rank, after_id = decode_cursor(cursor, float, str)
+            # Compared as real, the rank would not be equal to itself after a round trip through double precision
+            stmt = stmt.filter(tuple_(rank, models.Offer.id) < tuple_(cast(after_rank, REAL), after_id))
+
+        return stmt.order_by(rank.desc(), models.Offer.id.desc()).limit(limit)
+
+    async def search_async(self,
+                           db: AsyncSession,
+                           q: str,
+                           limit: int,
+                           load: Optional[Sequence] = None,
+                           **filters) -> List[Tuple[models.Offer, float]]:
+        """
+        Search offers, see `_select_search` for filters.
+        :return: Offers with their rank.
+        """
+        result = await db.execute(self._select_search(q, limit, **filters).options(*self._options(load)))
+
+        return [(offer, rank) for offer, rank in result.all()]
+
+    def search_cursor_key(self, row: Tuple[models.Offer, float]):
+        offer, rank = row
+
+        return rank, offer.id
 
     def create(self,
                db: Session,
@@ -59,12 +175,14 @@ class CrudOffers(CrudBase[models.Offer, schemas.OfferCreate, schemas.OfferUpdate
         offer_dict = new_model.dict(exclude={"deliveries", "device_name"})
 
         db_offer = super().create(db=db,
-                                  new_model=offer_dict)
+                                  new_model=offer_dict,
+                                  commit=False)
 
         if new_model.deliveries is not None:
             crud.delivery.create_deliveries_for_offer(db=db,
                                                       offer_id=new_model.id,
-                                                      deliveries=new_model.deliveries)
+                                                      deliveries=new_model.deliveries,
+                                                      commit=False)
 
         if new_model.device_name is not None:
             db_offer.device = crud.device.get_one_by_name(db=db,
@@ -74,28 +192,213 @@ class CrudOffers(CrudBase[models.Offer, schemas.OfferCreate, schemas.OfferUpdate
 
         return db_offer
 
-    def update(self,
-               db: Session,
-               id: str,
-               update_model: schemas.OfferUpdate) -> models.Offer:
-        update_dict = {
+    def create_bulk(self,
+                    db: Session,
+                    new_models: List[schemas.OfferCreate],
+                    update_existing: bool = True,
+                    chunk_size: int = 500) -> List[schemas.OfferBulkResult]:
+        """
+        Insert offers with their deliveries in a single transaction.
+        Existing offers are updated (deliveries are replaced if given) or skipped if `update_existing` is False.
+        Offers with unknown device and all but the last occurrence of duplicated ids are skipped.
+        :return: Result for every offer, in the same order as `new_models`.
+        """
+        results: List[Optional[schemas.OfferBulkResult]] = [None] * len(new_models)
+        last_occurrence = {offer.id: i for i, offer in enumerate(new_models)}
+
+        existing_devices = crud.device.get_existing_names(db=db, names=(offer.device_name for offer in new_models
+                                                                         if offer.device_name is not None))
+
+        offers: List[schemas.OfferCreate] = []
+
+        for i, offer in enumerate(new_models):
+            if last_occurrence[offer.id] != i:
+                detail = "Offer is duplicated in the request."
+            elif offer.device_name is not None and offer.device_name not in existing_devices:
+                detail = "Device not found."
+            else:
+                offers.append(offer)
+                continue
+
+            results[i] = schemas.OfferBulkResult(id=offer.id, status=schemas.BulkStatus.skipped, detail=detail)
+
+        # xmax of a freshly inserted row is 0, otherwise the row has been updated
+        created = literal_column("xmax = 0", Boolean).label("created")
+        statuses = {}
+
+        for chunk_start in range(0, len(offers), chunk_size):
+            chunk = offers[chunk_start:chunk_start + chunk_size]
+            stmt = insert(models.Offer).values([offer.dict(exclude={"deliveries"}) for offer in chunk])
+
+            if update_existing:
+                stmt = stmt.on_conflict_do_update(index_elements=[models.Offer.id], set_={
+                    **{column: stmt.excluded[column] for column in ("url", "title", "description", "category",
+                                                                    "price", "currency", "photos", "is_active")},
+                    # Do not lose already recognized device
+                    "device_name": func.coalesce(stmt.excluded.device_name, models.Offer.device_name),
+                    "last_update_at": datetime.utcnow(),
+                })
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=[models.Offer.id])
+
+            for id, is_created in db.execute(stmt.returning(models.Offer.id, created)):
+                statuses[id] = schemas.BulkStatus.created if is_created else schemas.BulkStatus.updated
+
+        # Replace deliveries of written offers
+        with_deliveries = [offer for offer in offers if offer.id in statuses and offer.deliveries is not None]
+        updated_ids = [offer.id for offer in with_deliveries if statuses[offer.id] == schemas.BulkStatus.updated]
+
+        if len(updated_ids) > 0:
+            db.query(models.Delivery)\
+                .filter(models.Delivery.offer_id.in_(updated_ids))\
+                .delete(synchronize_session=False)
+
+        deliveries = [{**delivery.dict(), "offer_id": offer.id}
+                      for offer in with_deliveries for delivery in offer.deliveries]
+
+        if len(deliveries) > 0:
+            db.execute(insert(models.Delivery), deliveries)
+
+        db.commit()
+
+        for i, offer in enumerate(new_models):
+            if results[i] is None:
+                results[i] = schemas.OfferBulkResult(id=offer.id,
+                                                     status=statuses.get(offer.id, schemas.BulkStatus.skipped),
+                                                     detail=None if offer.id in statuses else "Offer already exists.")
+
+        return results
+
+    def _update_dict(self, update_model: schemas.OfferUpdate) -> dict:
+        return {
             **update_model.dict(exclude={"device_name"}),
             # Convert to lower if not none, otherwise supply none
             "device_name": update_model.device_name.lower() if update_model.device_name is not None else None,
             "last_update_at": datetime.utcnow()
         }
+
+    def update(self,
+               db: Session,
+               id: str,
+               update_model: schemas.OfferUpdate,
+               commit: bool = True) -> Optional[models.Offer]:
         return super(CrudOffers, self).update(db=db,
                                               id=id,
-                                              update_model=update_dict)
+                                              update_model=self._update_dict(update_model),
+                                              commit=commit)
+
+    async def update_async(self,
+                           db: AsyncSession,
+                           id: str,
+                           update_model: schemas.OfferUpdate,
+                           commit: bool = True) -> Optional[models.Offer]:
+        return await super(CrudOffers, self).update_async(db=db,
+                                                          id=id,
+                                                          update_model=self._update_dict(update_model),
+                                                          commit=commit)
+
+    def _patch_dict(self, patch_model: schemas.OfferPatch) -> dict:
+        patch_dict = patch_model.dict(exclude_unset=True)
+
+        if patch_dict.get("device_name") is not None:
+            patch_dict["device_name"] = patch_dict["device_name"].lower()
+
+        return patch_dict
+
+    def patch(self,
+              db: Session,
+              id: str,
+              patch_model: schemas.OfferPatch) -> Optional[models.Offer]:
+        """
+        Update only fields which are set in `patch_model`.
+        """
+        patch_dict = self._patch_dict(patch_model)
+
+        if len(patch_dict) > 0:
+            return super().update(db=db, id=id, update_model=patch_dict)
+
+        return self.get_one(db=db, id=id)
+
+    def patch_many(self,
+                   db: Session,
+                   patches: List[schemas.OfferPatchItem]) -> List[schemas.OfferBulkResult]:
+        """
+        Apply many partial updates in a single transaction.
+        Patches setting the same fields are applied with a single `UPDATE ... FROM (VALUES ...)` statement.
+        Patches setting an unknown device are skipped.
+        :return: Result for every patch, in the same order as `patches`.
+        """
+        last_occurrence = {patch.id: i for i, patch in enumerate(patches)}
+        patch_dicts = [self._patch_dict(patch.fields) for patch in patches]
+        existing_devices = crud.device.get_existing_names(db=db, names=(patch_dict["device_name"]
+                                                                        for patch_dict in patch_dicts
+                                                                        if patch_dict.get("device_name") is not None))
+        groups: Dict[Tuple[str, ...], List[Tuple[str, dict]]] = {}
+        skipped = {}
+
+        for i, (patch, patch_dict) in enumerate(zip(patches, patch_dicts)):
+            if last_occurrence[patch.id] != i:
+                skipped[i] = "Offer is duplicated in the request."
+            elif len(patch_dict) == 0:
+                skipped[i] = "No fields to update."
+            elif patch_dict.get("device_name") is not None and patch_dict["device_name"] not in existing_devices:
+                skipped[i] = "Device not found."
+            else:
+                groups.setdefault(tuple(sorted(patch_dict)), []).append((patch.id, patch_dict))
+
+        updated_ids = set()
+
+        for fields, group in groups.items():
+            columns = self.model.__table__.c
+            patch_values = values(column("id", String),
+                                  *[column(field, columns[field].type) for field in fields],
+                                  name="patch")\
+                .data([(id, *[patch_dict[field] for field in fields]) for id, patch_dict in group])
+
+            # Cast explicitly, otherwise a column of only NULLs is typed as text
+            stmt = update(self.model)\
+                .where(self.model.id == patch_values.c.id)\
+                .values({field: cast(patch_values.c[field], columns[field].type) for field in fields})\
+                .returning(self.model.id)\
+                .execution_options(synchronize_session=False)
+
+            updated_ids.update(id for id, in db.execute(stmt))
+
+        db.commit()
+
+        results = []
+
+        for i, patch in enumerate(patches):
+            if patch.id in updated_ids and i not in skipped:
+                results.append(schemas.OfferBulkResult(id=patch.id, status=schemas.BulkStatus.updated))
+            else:
+                results.append(schemas.OfferBulkResult(id=patch.id,
+                                                       status=schemas.BulkStatus.skipped,
+                                                       detail=skipped.get(i, "Offer not found")))
+
+        return results
 
     def update_stonks_check_date(self,
                                  db: Session,
-                                 id: str):
+                                 id: str,
+                                 commit: bool = True):
         return super().update(db=db,
                               id=id,
                               update_model={
                                   "last_stonks_check": datetime.utcnow(),
-                              })
+                              },
+                              commit=commit)
+
+    async def update_stonks_check_date_async(self,
+                                             db: AsyncSession,
+                                             id: str,
+                                             commit: bool = True):
+        return await super().update_async(db=db,
+                                          id=id,
+                                          update_model={
+                                              "last_stonks_check": datetime.utcnow(),
+                                          },
+                                          commit=commit)
 
 
 offer = CrudOffers(models.Offer)
@@ -0,0 +1,128 @@
+from datetime import datetime
+from typing import List, Optional
+
+from loguru import logger
+from sqlalchemy import select, func, values, column, literal, Integer, Interval, DateTime, true
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Insert, Select
+
+from stonks_api import models
+
+# Windows (in days) for which statistics are kept
+PRICE_STATS_WINDOWS = (7, 30)
+# Window used for sorting stonkses, the same as the watcher uses for finding stonkses.
+# Its statistics are copied to stonkses by database triggers, see migration d3b7f9a2c5e1
+DEFAULT_WINDOW = 7
+# Fraction of the lowest and of the highest prices left out of the trimmed mean
+TRIMMED_FRACTION = 0.1
+
+STATS_COLUMNS = ("min_price", "max_price", "mean_price", "trimmed_mean_price", "median_price", "q1_price",
+                 "q3_price", "harmonic_price", "sample_count", "last_price_at", "updated_at")
+
+
+class CrudPriceStats:
+    model = models.DevicePriceStats
+
+    def _refresh_statement(self, device_names: List[str]) -> Insert:
+        """
+        Recompute statistics of all windows of given devices with a single statement.
+        """
+        windows = values(column("window_days", Integer), name="windows")\
+            .data([(window,) for window in PRICE_STATS_WINDOWS])
+        now = datetime.utcnow()
+        window_start = now - func.make_interval(0, 0, 0, windows.c.window_days, type_=Interval)
+        partition = (models.Device.name, windows.c.window_days)
+
+        # Prices of every window ranked by amount, so the outliers can be trimmed when aggregating
+        windowed = select(models.Device.name.label("device_name"),
+                          windows.c.window_days,
+                          models.Price.price,
+                          models.Price.date,
+                          func.row_number().over(partition_by=partition, order_by=models.Price.price).label("rank"),
+                          func.count(models.Price.price).over(partition_by=partition).label("total"))\
+            .select_from(models.Device)\
+            .join(windows, true())\
+            .outerjoin(models.Price, (models.Price.device_name == models.Device.name) &
+                                     (models.Price.date > window_start))\
+            .where(models.Device.name.in_(device_names))\
+            .subquery()
+
+        price = windowed.c.price
+        not_zero = func.nullif(price, 0)
+        trimmed = func.floor(windowed.c.total * TRIMMED_FRACTION)
+
+        stats = select(windowed.c.device_name,
+                       windowed.c.window_days,
+                       func.min(price),
+                       func.max(price),
+                       func.avg(price),
+                       func.avg(price).filter((windowed.c.rank > trimmed) &
+                                              (windowed.c.rank <= windowed.c.total - trimmed)),
+                       func.percentile_cont(0.5).within_group(price),
+                       func.percentile_cont(0.25).within_group(price),
+                       func.percentile_cont(0.75).within_group(price),
+                       func.count(not_zero) / func.sum(1 / not_zero),
+                       func.count(price),
+                       func.max(windowed.c.date),
+                       literal(now, DateTime))\
+            .group_by(windowed.c.device_name, windowed.c.window_days)
+
+        stmt = insert(self.model).from_select(["device_name", "window_days", *STATS_COLUMNS], stats)
+
+        return stmt.on_conflict_do_update(
+            index_elements=[self.model.device_name, self.model.window_days],
+            set_={name: stmt.excluded[name] for name in STATS_COLUMNS}
+        )
+
+    def refresh(self,
+                db: Session,
+                device_names: List[str],
+                commit: bool = True):
+        logger.debug(f"Refreshing price statistics of {len(device_names)} devices")
+        db.execute(self._refresh_statement(device_names))
+
+        if commit:
+            db.commit()
+
+    async def refresh_async(self,
+                            db: AsyncSession,
+                            device_names: List[str],
+                            commit: bool = True):
+        logger.debug(f"Refreshing price statistics of {len(device_names)} devices")
+        await db.execute(self._refresh_statement(device_names))
+
+        if commit:
+            await db.commit()
+
+    def get_one(self,
+                db: Session,
+                device_name: str,
+                window_days: int = DEFAULT_WINDOW) -> Optional[models.DevicePriceStats]:
+        return db.get(self.model, (device_name, window_days))
+
+    def _select_many(self, device_names: List[str], window_days: int) -> Select:
+        return select(self.model)\
+            .filter(self.model.device_name.in_(device_names), self.model.window_days == window_days)\
+            .order_by(self.model.device_name)
+
+    async def get_one_async(self,
+                            db: AsyncSession,
+                            device_name: str,
+                            window_days: int = DEFAULT_WINDOW) -> Optional[models.DevicePriceStats]:
+        return await db.get(self.model, (device_name, window_days))
+
+    async def get_many_async(self,
+                             db: AsyncSession,
+                             device_names: List[str],
+                             window_days: int = DEFAULT_WINDOW) -> List[models.DevicePriceStats]:
+        """
+        Get statistics of many devices, devices without statistics are left out.
+        """
+        result = await db.execute(self._select_many(device_names, window_days))
+
+        return result.scalars().all()
+
+
+price_stats = CrudPriceStats()
@@ -1,8 +1,11 @@
 import logging
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict
 
+from sqlalchemy import select, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
 from stonks_types import schemas
 
 from stonks_api import models
@@ -10,12 +13,13 @@ from stonks_api.crud.crud import CrudBase
 
 
 class CrudPrices(CrudBase[models.Price, schemas.PriceCreate, schemas.PriceCreate]):
-    def get_many(self,
-                 db: Session,
-                 device_name: str,
-                 newer_than: Optional[datetime] = None,
-                 older_than: Optional[datetime] = None) -> List[models.Price]:
-        q = db.query(models.Price).filter(models.Price.device_name == device_name)
+    def _filter(self,
+                q: Select,
+                device_name: Optional[str] = None,
+                newer_than: Optional[datetime] = None,
+                older_than: Optional[datetime] = None) -> Select:
+        if device_name is not None:
+            q = q.filter(models.Price.device_name == device_name)
 
         if newer_than is not None:
             q = q.filter(models.Price.date > newer_than)
@@ -23,23 +27,97 @@ class CrudPrices(CrudBase[models.Price, schemas.PriceCreate, schemas.PriceCreate
         if older_than is not None:
             q = q.filter(models.Price.date < older_than)
 
-        devices = q.all()
+        return q
+
+    def _select_many(self,
+                     device_name: str,
+                     newer_than: Optional[datetime] = None,
+                     older_than: Optional[datetime] = None) -> Select:
+        return self._filter(select(models.Price), device_name, newer_than, older_than)
+
+    def select_export(self,
+                      device_name: Optional[str] = None,
+                      newer_than: Optional[datetime] = None,
+                      older_than: Optional[datetime] = None) -> Select:
+        """
+        Build query selecting columns of prices matching the filters, of all devices if `device_name` is not given.
+        Prices are not ordered, so partitions are read one after another without sorting.
+        """
+        return self._filter(select(*models.Price.__table__.columns), device_name, newer_than, older_than)
+
+    def get_many(self,
+                 db: Session,
+                 device_name: str,
+                 newer_than: Optional[datetime] = None,
+                 older_than: Optional[datetime] = None) -> List[models.Price]:
+        devices = db.execute(self._select_many(device_name, newer_than, older_than)).scalars().all()
 
         logging.debug(f"Got list of prices for device {device_name}")
 
         return devices
 
-    def create_many(self,
-                    db: Session,
-                    name: str,
-                    prices: List[schemas.PriceCreate]) -> List[models.Price]:
-        db_prices = [self.model(**price.dict(),
-                                device_name=name) for price in prices]
-        db.add_all(db_prices)
-        db.commit()
-        [db.refresh(db_price) for db_price in db_prices]
-
-        return db_prices
+    async def get_many_async(self,
+                             db: AsyncSession,
+                             device_name: str,
+                             newer_than: Optional[datetime] = None,
+                             older_than: Optional[datetime] = None) -> List[models.Price]:
+        result = await db.execute(self._select_many(device_name, newer_than, older_than))
+
+        logging.debug(f"Got list of prices for device {device_name}")
+
+        return result.scalars().all()
+
+    def create_for_device(self,
+                          db: Session,
+                          name: str,
+                          prices: List[schemas.PriceCreate],
+                          commit: bool = True) -> List[models.Price]:
+        return self.create_many(db=db,
+                                new_models=[{**price.dict(), "device_name": name} for price in prices],
+                                commit=commit)
+
+    async def create_for_device_async(self,
+                                      db: AsyncSession,
+                                      name: str,
+                                      prices: List[schemas.PriceCreate],
+                                      commit: bool = True) -> List[models.Price]:
+        return await self.create_many_async(db=db,
+                                            new_models=[{**price.dict(), "device_name": name} for price in prices],
+                                            commit=commit)
+
+    async def create_bulk_async(self,
+                                db: AsyncSession,
+                                prices: Dict[str, List[schemas.PriceCreate]],
+                                chunk_size: int = 5000,
+                                commit: bool = True) -> schemas.PricesBulkResult:
+        """
+        Create prices of many devices with multi-row inserts and mark all of them as updated with a single statement.
+        Devices without new prices are marked as updated too, prices of devices which do not exist are not created.
+        """
+        names = list(prices)
+        result = await db.execute(select(models.Device.name).filter(models.Device.name.in_(names)))
+        found = set(result.scalars().all())
+        rows = [dict(price.dict(), device_name=name)
+                for name in names if name in found
+                for price in prices[name]]
+
+        # Chunks keep a single statement below the limit of bind parameters
+        for chunk_start in range(0, len(rows), chunk_size):
+            await db.execute(insert(self.model).values(rows[chunk_start:chunk_start + chunk_size]))
+
+        if len(found) > 0:
+            await db.execute(update(models.Device)
+                             .where(models.Device.name.in_(found))
+                             .values(last_price_update=datetime.utcnow())
+                             .execution_options(synchronize_session=False))
+
+        if commit:
+            await db.commit()
+
+        logging.debug(f"Created {len(rows)} prices of {len(found)} devices")
+
+        return schemas.PricesBulkResult(created={name: len(prices[name]) for name in names if name in found},
+                                        not_found=[name for name in names if name not in found])
 
 
 price = CrudPrices(models.Price)
@@ -1,28 +1,214 @@
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Optional, List, Sequence
 
 from loguru import logger
-from sqlalchemy.orm import Session
+from sqlalchemy import tuple_, select, text, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload, joinedload, load_only
+from sqlalchemy.sql import Select
 from stonks_types import schemas
 
 from stonks_api import models, crud
 from stonks_api.crud.crud import CrudBase
+from stonks_api.pagination import decode_cursor, InvalidCursor
+
+
+# Sorts which can be paginated with a cursor, other sorts use nullable statistics of devices
+CURSOR_SORTS = (schemas.StonksSortBy.stonks_amount_asc, schemas.StonksSortBy.stonks_amount_desc)
+
+# Statistics of offer devices copied to stonkses, every one has an index per sort direction
+PRICE_SORT_COLUMNS = {
+    "low_price": models.Stonks.device_min_price,
+    "high_price": models.Stonks.device_max_price,
+    "average_price": models.Stonks.device_mean_price,
+    "median_price": models.Stonks.device_median_price,
+    "harmonic_price": models.Stonks.device_harmonic_price,
+}
+
+
+# Finds stonkses of offers not checked since `last_stonks_check_before` with a single statement.
+# The same computation as `find_stonks` task of stonks-watcher, done for all offers at once.
+RECOMPUTE_STATEMENT = text("""
+    WITH fees AS (
+        SELECT * FROM unnest(CAST(:categories AS varchar[]), CAST(:fees AS numeric[])) AS fees (category, fee)
+    ),
+    eligible AS (
+        SELECT offer.id, offer.device_name, offer.category, offer.price
+        FROM offer
+        WHERE offer.is_active AND offer.device_name IS NOT NULL AND offer.device_name <> '_no_device'
+          AND coalesce(offer.last_stonks_check, '-infinity'::timestamp) < :last_stonks_check_before
+        ORDER BY coalesce(offer.last_stonks_check, '-infinity'::timestamp)
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    ),
+    medians AS (
+        SELECT price.device_name, percentile_cont(0.5) WITHIN GROUP (ORDER BY price.price) AS median_price
+        FROM price
+        WHERE price.date > :window_start AND price.device_name IN (SELECT device_name FROM eligible)
+        GROUP BY price.device_name
+    ),
+    computed AS (
+        SELECT eligible.id AS offer_id,
+               sell.sell_price * fees.fee AS sell_fee,
+               sell.sell_price * (1 - fees.fee) - eligible.price
+                   - coalesce((SELECT min(delivery.price) FROM delivery WHERE delivery.offer_id = eligible.id),
+                              :default_delivery_price) AS stonks_amount
+        FROM eligible
+        JOIN medians ON medians.device_name = eligible.device_name
+        JOIN fees ON fees.category = eligible.category
+        CROSS JOIN LATERAL (SELECT medians.median_price * :price_factor AS sell_price) AS sell
+    ),
+    new_stonks AS (
+        INSERT INTO stonks (offer_id, stonks_amount, created_at, is_active)
+        SELECT offer_id, stonks_amount, :now, true FROM computed WHERE stonks_amount > 0
+        RETURNING id, offer_id
+    ),
+    new_fees AS (
+        INSERT INTO fee (stonks_id, title, amount, currency)
+        SELECT new_stonks.id, :fee_title, computed.sell_fee, :currency
+        FROM new_stonks JOIN computed ON computed.offer_id = new_stonks.offer_id
+    ),
+    checked AS (
+        UPDATE offer SET last_stonks_check = :now
+        FROM eligible
+        WHERE offer.id = eligible.id
+        RETURNING offer.id
+    )
+    SELECT (SELECT count(*) FROM checked) AS checked_offers, (SELECT count(*) FROM new_stonks) AS created_stonkses
+""")
 
 
 class CrudStonks(CrudBase[models.Stonks, schemas.StonksCreate, schemas.StonksUpdate]):
+    # Every stonks has an offer, so it is inner joined together with its device
+    load_options = (selectinload(models.Stonks.fees),
+                    joinedload(models.Stonks.offer, innerjoin=True).options(*crud.offer.load_options))
+    # Columns of `schemas.StonksSummary`, fees are not loaded
+    summary_load_options = (load_only(models.Stonks.id, models.Stonks.stonks_amount, models.Stonks.created_at,
+                                      models.Stonks.offer_id),
+                            joinedload(models.Stonks.offer, innerjoin=True).load_only(*crud.offer.summary_columns))
+
+    def _select_many(self,
+                     skip: int,
+                     limit: int,
+                     is_active: Optional[bool] = True,
+                     cursor: Optional[str] = None,
+                     sort: schemas.StonksSortBy = schemas.StonksSortBy.stonks_amount_desc) -> Select:
+        """
+        Build query selecting stonkses ordered by `sort` and id.
+        Price sorts use statistics of offer devices from the last `DEFAULT_WINDOW` days copied to stonkses,
+        stonkses of devices without prices are last.
+        If `cursor` is given, `skip` is ignored and stonkses after the cursor are selected.
+        :raises InvalidCursor: if cursor is given for a sort which is not in `CURSOR_SORTS`.
+        """
+        logger.debug(f"Getting many models of {type(self.model)}")
+        q = select(self.model)
+
+        if is_active is not None:
+            q = q.filter(self.model.is_active == is_active)
+
+        key, direction = sort.value.rsplit("_", 1)
+        descending = direction == "desc"
+
+        if key == "stonks_amount":
+            columns = (self.model.stonks_amount, self.model.id)
+            q = q.order_by(*[column.desc() if descending else column.asc() for column in columns])
+
+            if cursor is not None:
+                after = tuple_(*decode_cursor(cursor, Decimal, int))
+                q = q.filter(tuple_(*columns) < after if descending else tuple_(*columns) > after)
+            else:
+                q = q.offset(skip)
+        else:
+            if cursor is not None:
+                raise InvalidCursor(cursor)
+
+            stat = PRICE_SORT_COLUMNS[key]
+            q = q\
+                .order_by(*([stat.desc().nullslast(), self.model.id.desc()] if descending else
+                            [stat.asc().nullslast(), self.model.id.asc()]))\
+                .offset(skip)
+
+        return q.limit(limit)
+
     def get_many(self,
                  db: Session,
                  skip: int,
                  limit: int,
-                 is_active: bool = True) -> models.Stonks:
-        logger.debug(f"Getting many models of {type(self.model)}")
-        return db\
-            .query(self.model)\
-            .filter(self.model.is_active == is_active)\
-            .order_by(self.model.stonks_amount.desc())\
-            .offset(skip)\
+                 is_active: Optional[bool] = True,
+                 cursor: Optional[str] = None,
+                 sort: schemas.StonksSortBy = schemas.StonksSortBy.stonks_amount_desc,
+                 load: Optional[Sequence] = None) -> List[models.Stonks]:
+        q = self._select_many(skip, limit, is_active, cursor, sort).options(*self._options(load))
+
+        return db.execute(q).scalars().all()
+
+    async def get_many_async(self,
+                             db: AsyncSession,
+                             skip: int,
+                             limit: int,
+                             is_active: Optional[bool] = True,
+                             cursor: Optional[str] = None,
+                             sort: schemas.StonksSortBy = schemas.StonksSortBy.stonks_amount_desc,
+                             load: Optional[Sequence] = None) -> List[models.Stonks]:
+        q = self._select_many(skip, limit, is_active, cursor, sort).options(*self._options(load))
+        result = await db.execute(q)
+
+        return result.scalars().all()
+
+    def cursor_key(self, db_stonks: models.Stonks):
+        return db_stonks.stonks_amount, db_stonks.id
+
+    def select_export(self, is_active: Optional[bool] = True) -> Select:
+        """
+        Build query selecting columns of all stonkses ordered by id, with category, device and price of their offers.
+        """
+        q = select(*self.model.__table__.columns,
+                   models.Offer.category,
+                   models.Offer.device_name,
+                   models.Offer.price.label("offer_price"))\
+            .join(models.Offer, models.Offer.id == self.model.offer_id)\
+            .order_by(self.model.id)
+
+        if is_active is not None:
+            q = q.filter(self.model.is_active == is_active)
+
+        return q
+
+    async def get_many_by_ids_async(self,
+                                    db: AsyncSession,
+                                    ids: Sequence[int]) -> List[models.Stonks]:
+        """
+        Get stonkses with given ids ordered by id, missing ones are left out.
+        """
+        q = select(self.model).where(self.model.id.in_(ids)).order_by(self.model.id).options(*self.load_options)
+        result = await db.execute(q)
+
+        return result.scalars().all()
+
+    async def get_last_id_async(self, db: AsyncSession) -> int:
+        """
+        Get id of the last created stonks, 0 if there are none.
+        """
+        result = await db.execute(select(func.coalesce(func.max(self.model.id), 0)))
+
+        return result.scalar()
+
+    async def get_created_after_async(self,
+                                      db: AsyncSession,
+                                      after_id: int,
+                                      limit: int) -> List[models.Stonks]:
+        """
+        Get stonkses created after the stonks with `after_id`, ordered by id.
+        """
+        q = select(self.model)\
+            .where(self.model.id > after_id)\
+            .order_by(self.model.id)\
             .limit(limit)\
-            .all()
+            .options(*self.load_options)
+        result = await db.execute(q)
+
+        return result.scalars().all()
 
     def create_for_offer(self,
                          db: Session,
@@ -31,17 +217,78 @@ class CrudStonks(CrudBase[models.Stonks, schemas.StonksCreate, schemas.StonksUpd
         # Stonks dictionary without fees with offer id
         stonks_dict = {**stonks.dict(exclude={"fees"}), "offer_id": offer_id}
         db_stonks = super().create(db=db,
-                                   new_model=stonks_dict)
+                                   new_model=stonks_dict,
+                                   commit=False)
 
         if stonks.fees is not None:
-            crud.fees.create_many(db=db,
-                                  stonks_id=db_stonks.id,
-                                  fees=stonks.fees)
+            crud.fees.create_for_stonks(db=db,
+                                        stonks_id=db_stonks.id,
+                                        fees=stonks.fees,
+                                        commit=False)
 
-        crud.offer.update_stonks_check_date(db=db, id=offer_id)
+        crud.offer.update_stonks_check_date(db=db, id=offer_id, commit=False)
+        db.commit()
 
         return db_stonks
 
+    async def create_for_offer_async(self,
+                                     db: AsyncSession,
+                                     offer_id: str,
+                                     stonks: schemas.StonksCreate) -> models.Stonks:
+        """
+        Create stonks with its fees and update stonks check date of the offer in a single transaction.
+        """
+        db_stonks, = await self.create_many_async(db=db,
+                                                  new_models=[{**stonks.dict(exclude={"fees"}), "offer_id": offer_id}],
+                                                  commit=False)
+
+        if stonks.fees is not None:
+            await crud.fees.create_for_stonks_async(db=db,
+                                                    stonks_id=db_stonks.id,
+                                                    fees=stonks.fees,
+                                                    commit=False)
+
+        await crud.offer.update_stonks_check_date_async(db=db, id=offer_id, commit=False)
+        await db.commit()
+
+        return await self.get_one_async(db=db, id=db_stonks.id)
+
+    def _recompute_params(self, recompute: schemas.StonksRecompute) -> dict:
+        now = datetime.utcnow()
+
+        return {"categories": list(recompute.sell_fees.keys()),
+                "fees": list(recompute.sell_fees.values()),
+                "last_stonks_check_before": recompute.last_stonks_check_before,
+                "limit": recompute.limit,
+                "window_start": now - timedelta(days=recompute.window_days),
+                "price_factor": recompute.price_factor,
+                "default_delivery_price": recompute.default_delivery_price,
+                "fee_title": recompute.fee_title,
+                "currency": recompute.currency,
+                "now": now}
+
+    def recompute(self,
+                  db: Session,
+                  recompute: schemas.StonksRecompute) -> schemas.StonksRecomputeResult:
+        """
+        Find stonkses of all offers not checked since `last_stonks_check_before`, see `RECOMPUTE_STATEMENT`.
+        """
+        row = db.execute(RECOMPUTE_STATEMENT, self._recompute_params(recompute)).one()
+        db.commit()
+
+        return schemas.StonksRecomputeResult(checked_offers=row.checked_offers,
+                                             created_stonkses=row.created_stonkses)
+
+    async def recompute_async(self,
+                              db: AsyncSession,
+                              recompute: schemas.StonksRecompute) -> schemas.StonksRecomputeResult:
+        result = await db.execute(RECOMPUTE_STATEMENT, self._recompute_params(recompute))
+        row = result.one()
+        await db.commit()
+
+        return schemas.StonksRecomputeResult(checked_offers=row.checked_offers,
+                                             created_stonkses=row.created_stonkses)
+
 
 stonks = CrudStonks(models.Stonks)
 
@@ -0,0 +1,94 @@
+"""
+Export of whole tables as NDJSON or CSV, streamed to the client while rows are read.
+
+Rows are read with a server-side cursor in batches of `EXPORT_BATCH_SIZE`, as plain rows instead of ORM objects,
+and every batch is sent as soon as it is serialized, so memory use does not depend on the number of exported rows.
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime, date
+from decimal import Decimal
+from typing import AsyncIterator, Any, List
+
+from sqlalchemy import ARRAY
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+from starlette.responses import StreamingResponse
+from stonks_types import schemas
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 5000))
+
+MEDIA_TYPES = {
+    schemas.ExportFormat.ndjson: "application/x-ndjson",
+    schemas.ExportFormat.csv: "text/csv",
+}
+
+
+def _json_default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+
+    if isinstance(value, Decimal):
+        return float(value)
+
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _json_arrays(row: Row, arrays: List[int]) -> list:
+    values = list(row)
+
+    for index in arrays:
+        values[index] = json.dumps(values[index])
+
+    return values
+
+
+async def stream_batches(db: AsyncSession, statement: Select, batch_size: int) -> AsyncIterator[List[Row]]:
+    result = await db.stream(statement.execution_options(yield_per=batch_size))
+
+    async for rows in result.partitions(batch_size):
+        yield rows
+
+
+async def ndjson_chunks(db: AsyncSession,
+                        statement: Select,
+                        batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[str]:
+    """
+    Rows of `statement` as JSON objects, one per line, a chunk per batch of rows.
+    """
+    async for rows in stream_batches(db, statement, batch_size):
+        yield "".join(json.dumps(dict(row._mapping), default=_json_default) + "\n" for row in rows)
+
+
+async def csv_chunks(db: AsyncSession,
+                     statement: Select,
+                     batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[str]:
+    """
+    Rows of `statement` as CSV with a header, a chunk per batch of rows.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(statement.selected_columns.keys())
+    # Arrays, e.g. photos of offers, are written as JSON, other values are written as strings by the csv module
+    arrays = [index for index, column in enumerate(statement.selected_columns) if isinstance(column.type, ARRAY)]
+
+    async for rows in stream_batches(db, statement, batch_size):
+        writer.writerows([_json_arrays(row, arrays) for row in rows] if arrays else rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    # Header of an empty export
+    if buffer.tell() > 0:
+        yield buffer.getvalue()
+
+
+def export_response(db: AsyncSession, statement: Select, name: str, format: schemas.ExportFormat) -> StreamingResponse:
+    chunks = csv_chunks(db, statement) if format == schemas.ExportFormat.csv else ndjson_chunks(db, statement)
+
+    return StreamingResponse(chunks,
+                             media_type=MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="{name}.{format.value}"'})
@@ -0,0 +1,146 @@
+"""
+Prometheus metrics of requests, SQL queries and connection pools.
+
+With several uvicorn workers set PROMETHEUS_MULTIPROC_DIR to an empty directory shared by the workers.
+Every worker writes its metrics there and `/metrics` aggregates all of them,
+so it returns the same numbers whichever worker serves the scrape.
+"""
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import Counter, Histogram, Gauge, CollectorRegistry, REGISTRY, generate_latest, \
+    CONTENT_TYPE_LATEST, multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.responses import Response
+
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ or "prometheus_multiproc_dir" in os.environ
+
+REQUESTS = Counter("stonks_api_requests_total",
+                   "Handled requests",
+                   ["method", "route", "status"])
+REQUEST_DURATION = Histogram("stonks_api_request_duration_seconds",
+                             "Request duration",
+                             ["method", "route"])
+REQUESTS_IN_PROGRESS = Gauge("stonks_api_requests_in_progress",
+                             "Requests being handled",
+                             ["method"],
+                             multiprocess_mode="livesum")
+
+SQL_QUERIES = Counter("stonks_api_sql_queries_total",
+                      "SQL statements executed while handling requests",
+                      ["route"])
+SQL_DURATION = Counter("stonks_api_sql_duration_seconds_total",
+                       "Time spent executing SQL statements while handling requests",
+                       ["route"])
+
+DB_POOL_SIZE = Gauge("stonks_api_db_pool_size",
+                     "Connections kept open by the pool",
+                     ["engine"],
+                     multiprocess_mode="livesum")
+DB_POOL_IN_USE = Gauge("stonks_api_db_pool_connections_in_use",
+                       "Connections checked out from the pool",
+                       ["engine"],
+                       multiprocess_mode="livesum")
+DB_POOL_WAIT = Histogram("stonks_api_db_pool_checkout_wait_seconds",
+                         "Time spent getting a connection from the pool",
+                         ["engine"],
+                         buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+DB_POOL_TIMEOUTS = Counter("stonks_api_db_pool_timeouts_total",
+                           "Connection requests which timed out waiting for the pool",
+                           ["engine"])
+
+# Side is `primary` or `replica`
+DB_QUERIES = Counter("stonks_api_db_queries_total",
+                     "SQL statements executed by the primary database or its read replica",
+                     ["side"])
+DB_READ_SESSIONS = Counter("stonks_api_db_read_sessions_total",
+                           "Sessions of read requests by the database they were routed to",
+                           ["side"])
+
+
+class RequestStats:
+    """
+    SQL statements executed while handling a single request.
+    """
+    __slots__ = ("queries", "sql_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+
+
+# Stats of the request being handled. The object is mutated in place,
+# so statements executed in threadpool or greenlets (which get a copy of the context) are counted too.
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def instrument_engine(engine: Engine, name: str, side: str = "primary"):
+    """
+    Export pool usage of an engine using `InstrumentedQueuePool` and count SQL statements per request
+    and per `side` of the database.
+    """
+    DB_POOL_SIZE.labels(name).set(engine.pool.size())
+
+    in_use = DB_POOL_IN_USE.labels(name)
+    wait = DB_POOL_WAIT.labels(name)
+    timeouts = DB_POOL_TIMEOUTS.labels(name)
+    queries = DB_QUERIES.labels(side)
+
+    def on_wait(seconds: float, timed_out: bool):
+        wait.observe(seconds)
+
+        if timed_out:
+            timeouts.inc()
+
+    engine.pool.stats.on_wait = on_wait
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        in_use.inc()
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        in_use.dec()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        queries.inc()
+        stats = request_stats.get()
+
+        if stats is not None:
+            stats.queries += 1
+            stats.sql_time += time.perf_counter() - context._query_start
+
+
+def observe_request(method: str, route: str, status: int, duration: float, stats: RequestStats):
+    REQUESTS.labels(method, route, status).inc()
+    REQUEST_DURATION.labels(method, route).observe(duration)
+
+    if stats.queries > 0:
+        SQL_QUERIES.labels(route).inc(stats.queries)
+        SQL_DURATION.labels(route).inc(stats.sql_time)
+
+
+def mark_process_dead():
+    """
+    Drop live gauges of this worker, must be called when a worker exits in multiprocess mode.
+    """
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def metrics_response() -> Response:
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
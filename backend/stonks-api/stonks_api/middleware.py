@@ -0,0 +1,154 @@
+import random
+import time
+from typing import Callable, Dict, Optional, Iterable
+
+from loguru import logger
+from starlette.datastructures import MutableHeaders
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.routing import BaseRoute
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from stonks_api.metrics import RequestStats, request_stats, observe_request, REQUESTS_IN_PROGRESS
+from stonks_api.profiling import ProfileMode, SqlProfiler, should_profile
+
+# Route of requests which did not match any route, so unknown paths do not flood the logs with distinct values
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class TimingMiddleware:
+    """
+    Log method, route template, status and duration of every request and export them as metrics,
+    together with count and duration of SQL statements executed while handling it.
+
+    Request bodies are logged only for a sampled fraction of requests and only if they are not larger than
+    `max_body_size`. The body is never read by the middleware itself, chunks are copied
+    while the endpoint receives them, so requests which are not sampled cost nothing extra.
+
+    Profiled requests (see `stonks_api.profiling`) get `SqlProfiler` in `request.state.sql_profiler`,
+    which is attached to their sessions by `get_db`, and `Server-Timing` header in the response.
+    """
+
+    def __init__(self,
+                 app: ASGIApp,
+                 body_sample_rate: float = 0.0,
+                 max_body_size: int = 10_000,
+                 sql_profile: ProfileMode = ProfileMode.off,
+                 slow_query_threshold: float = 0.1):
+        self.app = app
+        self.body_sample_rate = body_sample_rate
+        self.max_body_size = max_body_size
+        self.sql_profile = sql_profile
+        self.slow_query_threshold = slow_query_threshold
+        self._routes: Optional[Dict[Callable, str]] = None
+
+    def route_template(self, scope: Scope) -> str:
+        """
+        Path template of the route which handled the request, e.g. `/v1/offers/{offer_id}`.
+        """
+        endpoint = scope.get("endpoint")
+
+        if endpoint is None:
+            return UNMATCHED_ROUTE
+
+        # Routes are added on startup, so endpoint to path mapping is built on the first request
+        if self._routes is None:
+            routes: Dict[Callable, str] = {}
+
+            for route in scope["app"].routes:  # type: BaseRoute
+                if hasattr(route, "endpoint") and hasattr(route, "path"):
+                    routes.setdefault(route.endpoint, route.path)
+
+            self._routes = routes
+
+        return self._routes.get(endpoint, UNMATCHED_ROUTE)
+
+    def _should_log_body(self, scope: Scope) -> bool:
+        if self.body_sample_rate <= 0 or random.random() >= self.body_sample_rate:
+            return False
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    return int(value) <= self.max_body_size
+                except ValueError:
+                    # Malformed header, the size of the body is unknown
+                    return False
+
+        # Size of chunked bodies is not known upfront, they are logged only if they turn out small enough
+        return True
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        stats = RequestStats()
+        stats_token = request_stats.set(stats)
+        in_progress = REQUESTS_IN_PROGRESS.labels(scope["method"])
+        in_progress.inc()
+        body: Optional[bytearray] = bytearray() if self._should_log_body(scope) else None
+        profiler: Optional[SqlProfiler] = None
+
+        if should_profile(self.sql_profile, scope["headers"]):
+            profiler = SqlProfiler(self.slow_query_threshold)
+            scope.setdefault("state", {})["sql_profiler"] = profiler
+
+        async def receive_wrapper() -> Message:
+            nonlocal body
+            message = await receive()
+
+            if body is not None and message["type"] == "http.request":
+                body += message.get("body", b"")
+
+                if len(body) > self.max_body_size:
+                    body = None
+
+            return message
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+                if profiler is not None:
+                    app_duration = (time.perf_counter() - start) * 1000
+                    MutableHeaders(scope=message).append("Server-Timing",
+                                                         f"app;dur={app_duration:.1f}, {profiler.server_timing()}")
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper if body is not None else receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            route = self.route_template(scope)
+            in_progress.dec()
+            request_stats.reset(stats_token)
+            observe_request(scope["method"], route, status, duration, stats)
+
+            logger.info(f"{scope['method']} {route} {status} {duration * 1000:.1f}ms "
+                        f"({stats.queries} queries, {stats.sql_time * 1000:.1f}ms)")
+
+            if body is not None:
+                logger.debug(f"{scope['method']} {scope['path']} body: {bytes(body)}")
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compress responses of at least `minimum_size` bytes with gzip, if the client accepts it.
+    Streams of events are never compressed, compressed chunks are held back until enough data is buffered.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1000, exclude_paths: Iterable[str] = ()):
+        super().__init__(app, minimum_size=minimum_size)
+        self.exclude_paths = set(exclude_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        await super().__call__(scope, receive, send)
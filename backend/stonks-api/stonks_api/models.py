@@ -1,19 +1,28 @@
 from datetime import datetime
 
-from sqlalchemy import Column, Integer, String, Numeric, DateTime, ForeignKey, Boolean
-from sqlalchemy.dialects.postgresql import ARRAY
-from sqlalchemy.orm import declarative_base, relationship, backref
+from sqlalchemy import Column, Integer, String, Numeric, Date, DateTime, ForeignKey, Boolean, Index, Computed, func, \
+    literal_column, text
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
+from sqlalchemy.orm import declarative_base, relationship, backref, deferred
 from sqlalchemy.orm.collections import attribute_mapped_collection
 
 Base = declarative_base()
 
+# Used in place of NULL dates (never checked/updated), so such rows compare lower than any date
+# and filters like `date < x OR date IS NULL` can be served by a single expression index.
+NEGATIVE_INFINITY = literal_column("'-infinity'::timestamp")
+
+# Text search configuration of offers. Offers are mostly Polish, which has no built-in dictionary,
+# so words are only lowercased without stemming.
+SEARCH_CONFIG = "simple"
+
 
 class Fee(Base):
     __tablename__ = "fee"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
 
-    stonks_id = Column(Integer, ForeignKey("stonks.id", ondelete="CASCADE"), nullable=False)
+    stonks_id = Column(Integer, ForeignKey("stonks.id", ondelete="CASCADE"), nullable=False, index=True)
     stonks = relationship("Stonks", back_populates="fees")
 
     title = Column(String, nullable=False)
@@ -26,7 +35,7 @@ class Delivery(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
 
-    offer_id = Column(String, ForeignKey("offer.id", ondelete="CASCADE"), nullable=False)
+    offer_id = Column(String, ForeignKey("offer.id", ondelete="CASCADE"), nullable=False, index=True)
     offer = relationship("Offer", back_populates="deliveries")
 
     title = Column(String, nullable=True)
@@ -44,7 +53,7 @@ class Offer(Base):
     title = Column(String, nullable=False)
     description = Column(String, nullable=True)
     category = Column(String(32), nullable=False)
-    device_name = Column(String, ForeignKey("device.name", ondelete="SET NULL"), nullable=True)
+    device_name = Column(String, ForeignKey("device.name", ondelete="SET NULL"), nullable=True, index=True)
     device = relationship("Device", back_populates="offer", uselist=False)
 
     price = Column(Numeric(15, 4), nullable=False)
@@ -59,6 +68,25 @@ class Offer(Base):
     last_update_at = Column(DateTime, nullable=True)
     last_stonks_check = Column(DateTime)
 
+    # Words of the title rank higher than words of the description.
+    # Deferred, it is only used for filtering and ranking in the database.
+    search_vector = deferred(Column(TSVECTOR, Computed(
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B')",
+        persisted=True
+    )))
+
+    # Indexes matching filters of `CrudOffers.get_many`
+    __table_args__ = (
+        Index("ix_offer_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_offer_is_active_scraped_at", is_active, scraped_at, id),
+        Index("ix_offer_is_active_last_update", is_active, func.coalesce(last_update_at, scraped_at)),
+        Index("ix_offer_without_device_scraped_at", is_active, scraped_at, id,
+              postgresql_where=text("device_name IS NULL OR device_name = '_no_device'")),
+        Index("ix_offer_with_device_last_stonks_check", func.coalesce(last_stonks_check, NEGATIVE_INFINITY),
+              postgresql_where=text("is_active AND device_name IS NOT NULL AND device_name <> '_no_device'")),
+    )
+
 
 class Device(Base):
     __tablename__ = "device"
@@ -70,8 +98,17 @@ class Device(Base):
     price = relationship("Price", back_populates="device")
     offer = relationship("Offer", back_populates="device")
 
+    __table_args__ = (
+        Index("ix_device_last_price_update", func.coalesce(last_price_update, NEGATIVE_INFINITY)),
+        # Trigram index for finding devices with similar names, requires pg_trgm extension
+        Index("ix_device_name_trgm", name, postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+    )
+
 
 class Price(Base):
+    """
+    Range partitioned by month of `date`, see `stonks_api.partitions`.
+    """
     __tablename__ = "price"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -79,9 +116,126 @@ class Price(Base):
     source = Column(String(32), nullable=False)
     price = Column(Numeric(15, 4), nullable=False)
     currency = Column(String(3), nullable=False)
-    date = Column(DateTime, nullable=False, default=datetime.utcnow())
+    # Part of the primary key, because unique constraints of a partitioned table must include the partition key
+    date = Column(DateTime, primary_key=True, nullable=False, default=datetime.utcnow)
     device = relationship("Device", back_populates="price")
 
+    __table_args__ = (
+        Index("ix_price_device_name_date", device_name, date),
+        Index("ix_price_date_brin", date, postgresql_using="brin"),
+        {"postgresql_partition_by": "RANGE (date)"},
+    )
+
+
+class PriceDaily(Base):
+    """
+    Daily aggregates of prices which were removed by the retention, see `stonks_api.partitions`.
+    """
+    __tablename__ = "price_daily"
+
+    device_name = Column(String, ForeignKey("device.name", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    currency = Column(String(3), primary_key=True)
+
+    sample_count = Column(Integer, nullable=False)
+    min_price = Column(Numeric(15, 4), nullable=False)
+    max_price = Column(Numeric(15, 4), nullable=False)
+    # Sum instead of the mean, so prices of the same day rolled up at different times can be merged
+    sum_price = Column(Numeric(20, 4), nullable=False)
+
+
+class DevicePriceStats(Base):
+    """
+    Statistics of device prices from the last `window_days` days, refreshed whenever prices of the device are added.
+    """
+    __tablename__ = "device_price_stats"
+
+    device_name = Column(String, ForeignKey("device.name", ondelete="CASCADE"), primary_key=True)
+    window_days = Column(Integer, primary_key=True)
+
+    # Statistics are NULL if there are no prices in the window
+    min_price = Column(Numeric(15, 4))
+    max_price = Column(Numeric(15, 4))
+    mean_price = Column(Numeric(15, 4))
+    # Mean of prices without the lowest and the highest 10%, so single outliers do not skew it
+    trimmed_mean_price = Column(Numeric(15, 4))
+    median_price = Column(Numeric(15, 4))
+    q1_price = Column(Numeric(15, 4))
+    q3_price = Column(Numeric(15, 4))
+    harmonic_price = Column(Numeric(15, 4))
+    sample_count = Column(Integer, nullable=False)
+
+    # Date of the newest price in the window
+    last_price_at = Column(DateTime)
+    updated_at = Column(DateTime, nullable=False)
+
+
+class OfferArchive(Base):
+    """
+    Inactive offers moved out of `offer` together with their deliveries and stonkses, see `stonks_api.archive`.
+    """
+    __tablename__ = "offer_archive"
+
+    id = Column(String, primary_key=True, nullable=False)
+
+    url = Column(String)
+
+    title = Column(String, nullable=False)
+    description = Column(String, nullable=True)
+    category = Column(String(32), nullable=False)
+    device_name = Column(String, ForeignKey("device.name", ondelete="SET NULL"), nullable=True)
+    device = relationship("Device", uselist=False)
+
+    price = Column(Numeric(15, 4), nullable=False)
+    currency = Column(String(3), nullable=False)
+
+    deliveries = relationship("DeliveryArchive")
+
+    photos = Column(ARRAY(String))
+    is_active = Column(Boolean, nullable=False)
+
+    scraped_at = Column(DateTime, nullable=False)
+    last_update_at = Column(DateTime, nullable=True)
+    last_stonks_check = Column(DateTime)
+
+    archived_at = Column(DateTime, nullable=False)
+
+
+class DeliveryArchive(Base):
+    __tablename__ = "delivery_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+
+    offer_id = Column(String, ForeignKey("offer_archive.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    title = Column(String, nullable=True)
+    price = Column(Numeric(15, 4), nullable=False)
+    currency = Column(String(3), nullable=False)
+
+
+class StonksArchive(Base):
+    __tablename__ = "stonks_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    stonks_amount = Column(Numeric(15, 4), nullable=False)
+
+    offer_id = Column(String, ForeignKey("offer_archive.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    created_at = Column(DateTime, nullable=False)
+    is_active = Column(Boolean, nullable=False)
+
+
+class FeeArchive(Base):
+    __tablename__ = "fee_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+
+    stonks_id = Column(Integer, ForeignKey("stonks_archive.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    title = Column(String, nullable=False)
+    amount = Column(Numeric(15, 4), nullable=False)
+    currency = Column(String(3), nullable=False)
+
 
 class Category(Base):
     __tablename__ = "category"
@@ -101,9 +255,27 @@ class Stonks(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     stonks_amount = Column(Numeric(15, 4), nullable=False)
 
-    offer_id = Column(String, ForeignKey("offer.id", ondelete="CASCADE"), nullable=False)
+    offer_id = Column(String, ForeignKey("offer.id", ondelete="CASCADE"), nullable=False, index=True)
     offer = relationship("Offer", uselist=False)
     fees = relationship("Fee", back_populates="stonks")
 
-    created_at = Column(DateTime, nullable=False, default=datetime.utcnow())
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     is_active = Column(Boolean, nullable=False, default=True)
+
+    # Statistics of the offer device from the last 7 days copied by triggers, so stonkses are sorted by an index
+    device_min_price = deferred(Column(Numeric(15, 4)))
+    device_max_price = deferred(Column(Numeric(15, 4)))
+    device_mean_price = deferred(Column(Numeric(15, 4)))
+    device_median_price = deferred(Column(Numeric(15, 4)))
+    device_harmonic_price = deferred(Column(Numeric(15, 4)))
+
+    __table_args__ = (
+        Index("ix_stonks_is_active_stonks_amount", is_active, stonks_amount, id),
+    )
+
+
+# Stonkses of devices without prices are last in both directions, so every statistic needs an index per direction
+for _column in (Stonks.device_min_price, Stonks.device_max_price, Stonks.device_mean_price, Stonks.device_median_price,
+                Stonks.device_harmonic_price):
+    Index(f"ix_stonks_is_active_{_column.key}", Stonks.is_active, _column, Stonks.id)
+    Index(f"ix_stonks_is_active_{_column.key}_desc", Stonks.is_active, _column.desc().nullslast(), Stonks.id.desc())
@@ -0,0 +1,206 @@
+"""
+Stream of new stonkses to subscribed clients, without polling the database.
+
+A trigger on `stonks` sends `NOTIFY stonks_created` with id of every inserted stonks.
+Every worker holds a single connection listening to the notifications, loads notified stonkses
+in batches and sends them to all subscriptions whose filters they match.
+"""
+import asyncio
+import os
+from decimal import Decimal
+from typing import Optional, Set, List, Tuple, AsyncIterator
+
+import asyncpg
+from loguru import logger
+from sqlalchemy.engine import make_url
+from stonks_types import schemas
+
+from stonks_api import crud, models
+from stonks_api.database import AsyncSessionLocal, DATABASE_URL
+
+CHANNEL = "stonks_created"
+# LISTEN needs a session level connection, with PgBouncer in transaction mode point it directly at the database
+DATABASE_LISTEN_URL = os.getenv("DATABASE_LISTEN_URL", DATABASE_URL)
+# Seconds between keepalive comments of streams without new stonkses, which keep proxies from closing them
+KEEPALIVE_INTERVAL = float(os.getenv("STONKS_STREAM_KEEPALIVE", 15))
+# Subscriptions with more stonkses waiting to be sent are closed, the client is too slow
+MAX_QUEUED = 1000
+# Maximum number of stonkses created while the listener was reconnecting which are sent after it reconnects
+MAX_CATCH_UP = 1000
+
+# Id and JSON of a stonks, or None when the subscription is closed
+Event = Optional[Tuple[int, str]]
+
+
+class Subscription:
+    """
+    Stonkses waiting to be sent to a single client, filtered by category and minimum stonks amount.
+    Category matches its subcategories too, e.g. `smartphones` matches `smartphones/other`.
+    """
+
+    def __init__(self, category: Optional[str] = None, min_stonks_amount: Optional[Decimal] = None):
+        self.category = category
+        self.min_stonks_amount = min_stonks_amount
+        self.queue: "asyncio.Queue[Event]" = asyncio.Queue()
+
+    def matches(self, stonks: models.Stonks) -> bool:
+        if self.min_stonks_amount is not None and stonks.stonks_amount < self.min_stonks_amount:
+            return False
+
+        if self.category is not None:
+            category = stonks.offer.category
+
+            return category == self.category or category.startswith(f"{self.category}/")
+
+        return True
+
+
+class StonksBroadcaster:
+    """
+    Listen to notifications of new stonkses with a single connection and send them to all subscriptions.
+    The connection is opened with the first subscription and reopened whenever it is lost,
+    stonkses created in the meantime are sent after reconnecting.
+    """
+
+    def __init__(self, dsn: str, reconnect_delay: float = 1.0, keepalive_interval: float = KEEPALIVE_INTERVAL):
+        self.dsn = dsn
+        self.reconnect_delay = reconnect_delay
+        self.keepalive_interval = keepalive_interval
+        self.subscriptions: Set[Subscription] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._last_id: Optional[int] = None
+        # Set while the connection is listening, created with the listener on the running event loop
+        self.listening: Optional[asyncio.Event] = None
+
+    def subscribe(self, category: Optional[str] = None, min_stonks_amount: Optional[Decimal] = None) -> Subscription:
+        if self._task is None or self._task.done():
+            self.listening = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+        subscription = Subscription(category, min_stonks_amount)
+        self.subscriptions.add(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscriptions.discard(subscription)
+
+    async def stop(self):
+        for subscription in self.subscriptions:
+            subscription.queue.put_nowait(None)
+
+        self.subscriptions.clear()
+
+        if self._task is not None:
+            self._task.cancel()
+
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"Listening to {CHANNEL} failed, reconnecting in {self.reconnect_delay}s")
+
+            self.listening.clear()
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def _listen(self):
+        ids: "asyncio.Queue[int]" = asyncio.Queue()
+        connection: asyncpg.Connection = await asyncpg.connect(self.dsn)
+
+        try:
+            await connection.add_listener(CHANNEL, lambda conn, pid, channel, payload: ids.put_nowait(int(payload)))
+
+            if self._last_id is None:
+                # Stonkses created from now on are notified, and caught up with if the connection is lost,
+                # even if none has been published before
+                async with AsyncSessionLocal() as db:
+                    self._last_id = await crud.stonks.get_last_id_async(db=db)
+
+                self.listening.set()
+            else:
+                self.listening.set()
+                await self._catch_up()
+
+            while True:
+                try:
+                    batch = [await asyncio.wait_for(ids.get(), timeout=self.keepalive_interval)]
+                except asyncio.TimeoutError:
+                    # Notifications do not arrive on a broken connection, it is noticed only by a query
+                    await connection.execute("SELECT 1")
+                    continue
+
+                # Stonkses inserted by a single statement are notified together, they are loaded at once
+                while not ids.empty():
+                    batch.append(ids.get_nowait())
+
+                async with AsyncSessionLocal() as db:
+                    stonkses = await crud.stonks.get_many_by_ids_async(db=db, ids=batch)
+
+                self.publish(stonkses)
+        finally:
+            await connection.close()
+
+    async def _catch_up(self):
+        async with AsyncSessionLocal() as db:
+            stonkses = await crud.stonks.get_created_after_async(db=db, after_id=self._last_id, limit=MAX_CATCH_UP)
+
+        self.publish(stonkses)
+
+    def publish(self, stonkses: List[models.Stonks]):
+        for stonks in stonkses:
+            self._last_id = max(self._last_id or 0, stonks.id)
+            data: Optional[str] = None
+
+            for subscription in list(self.subscriptions):
+                if not subscription.matches(stonks):
+                    continue
+
+                if subscription.queue.qsize() >= MAX_QUEUED:
+                    logger.warning("Closing stonks stream of a client which does not keep up")
+                    subscription.queue.put_nowait(None)
+                    self.unsubscribe(subscription)
+                    continue
+
+                # Serialized once for all subscriptions
+                if data is None:
+                    data = schemas.Stonks.from_orm(stonks).json()
+
+                subscription.queue.put_nowait((stonks.id, data))
+
+
+stonks_broadcaster = StonksBroadcaster(make_url(DATABASE_LISTEN_URL)
+                                       .set(drivername="postgresql")
+                                       .render_as_string(hide_password=False))
+
+
+async def stonks_events(subscription: Subscription,
+                        broadcaster: StonksBroadcaster = stonks_broadcaster) -> AsyncIterator[str]:
+    """
+    Server-sent events of stonkses of the subscription, with keepalive comments while there are none.
+    `StreamingResponse` cancels the iteration when the client disconnects.
+    """
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout=broadcaster.keepalive_interval)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+
+            if event is None:
+                return
+
+            stonks_id, data = event
+            yield f"id: {stonks_id}\nevent: stonks\ndata: {data}\n\n"
+    finally:
+        broadcaster.unsubscribe(subscription)
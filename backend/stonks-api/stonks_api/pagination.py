@@ -0,0 +1,69 @@
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Callable, List, Sequence, Tuple
+
+from fastapi import HTTPException
+from starlette.responses import Response
+
+# Name of the response header carrying the cursor of the next page.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    if isinstance(value, Decimal):
+        return str(value)
+
+    return value
+
+
+def encode_cursor(*values: Any) -> str:
+    """
+    Encode key values of the last row of a page into an opaque, url-safe cursor.
+    """
+    payload = json.dumps([_encode_value(value) for value in values], separators=(",", ":"))
+
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str, *types: Callable[[Any], Any]) -> Tuple:
+    """
+    Decode cursor created with `encode_cursor` and convert its values with `types`.
+    :raises InvalidCursor: if the cursor is malformed or does not match `types`.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+        if not isinstance(values, list) or len(values) != len(types):
+            raise InvalidCursor(cursor)
+
+        return tuple(_type(value) for _type, value in zip(types, values))
+    except (ValueError, TypeError, ArithmeticError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def parse_datetime(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def invalid_cursor():
+    raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def set_next_cursor(response: Response,
+                    items: List[Any],
+                    limit: int,
+                    key: Callable[[Any], Sequence[Any]]):
+    """
+    Set `X-Next-Cursor` header if the page is full, so there may be more items to fetch.
+    """
+    if len(items) > 0 and len(items) >= limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key(items[-1]))
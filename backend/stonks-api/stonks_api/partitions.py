@@ -0,0 +1,133 @@
+"""
+Monthly partitions of the `price` table.
+
+Prices are range partitioned by `date`. Every month has its own partition named `price_YYYY_MM`,
+prices outside of them are kept in `price_default`. Queries filtered by date scan only the matching partitions.
+
+`ensure_price_partitions` creates partitions of the upcoming months before prices of them arrive.
+`roll_up_prices` aggregates prices older than the retention period into `price_daily` and removes them,
+old months are removed by dropping their whole partition. Both are run periodically with `stonks_api.cli`.
+"""
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from stonks_api.crud.crud_price_stats import PRICE_STATS_WINDOWS
+
+DEFAULT_PARTITION = "price_default"
+PARTITION_NAME = re.compile(r"^price_(\d{4})_(\d{2})$")
+
+# Move prices of a source query to the daily aggregates, merged with aggregates of the day rolled up before
+ROLL_UP_STATEMENT = """
+    WITH rolled_up AS ({source})
+    INSERT INTO price_daily (device_name, day, currency, sample_count, min_price, max_price, sum_price)
+    SELECT device_name, date::date, currency, count(*), min(price), max(price), sum(price)
+    FROM rolled_up
+    GROUP BY device_name, date::date, currency
+    ON CONFLICT (device_name, day, currency) DO UPDATE
+    SET sample_count = price_daily.sample_count + excluded.sample_count,
+        min_price = least(price_daily.min_price, excluded.min_price),
+        max_price = greatest(price_daily.max_price, excluded.max_price),
+        sum_price = price_daily.sum_price + excluded.sum_price
+"""
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"price_{month:%Y_%m}"
+
+
+def get_price_partitions(db: Session) -> Dict[date, str]:
+    """
+    Monthly partitions of prices by the first day of their month, without the default partition.
+    """
+    names = db.execute(text("SELECT child.relname "
+                            "FROM pg_inherits JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid "
+                            "WHERE pg_inherits.inhparent = 'price'::regclass")).scalars()
+    partitions: Dict[date, str] = {}
+
+    for name in names:
+        match = PARTITION_NAME.match(name)
+
+        if match is not None:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+
+    return partitions
+
+
+def create_price_partition(db: Session, month: date) -> str:
+    """
+    Create partition of prices from the month starting with `month`.
+    Prices of the month which are already in the default partition are moved to the new one.
+    """
+    name = partition_name(month)
+    end = add_months(month, 1)
+
+    # Partition can not be attached while the default partition contains its rows, so it is filled before
+    db.execute(text(f"CREATE TABLE {name} (LIKE price INCLUDING DEFAULTS)"))
+    db.execute(text(f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+                    f"              WHERE date >= :start AND date < :end RETURNING *) "
+                    f"INSERT INTO {name} SELECT * FROM moved"),
+               {"start": month, "end": end})
+    db.execute(text(f"ALTER TABLE price ATTACH PARTITION {name} FOR VALUES FROM ('{month}') TO ('{end}')"))
+    db.commit()
+
+    logger.info(f"Created price partition {name}")
+
+    return name
+
+
+def ensure_price_partitions(db: Session, months_ahead: int = 2) -> List[str]:
+    """
+    Create missing partitions of the current month and of `months_ahead` following months.
+    :return: Names of created partitions.
+    """
+    existing = get_price_partitions(db)
+    current = datetime.utcnow().date().replace(day=1)
+    months = [add_months(current, i) for i in range(months_ahead + 1)]
+
+    return [create_price_partition(db, month) for month in months if month not in existing]
+
+
+def roll_up_prices(db: Session, keep_days: int) -> List[str]:
+    """
+    Roll up prices older than `keep_days` days into daily aggregates and remove them.
+    Monthly partitions are dropped once all their prices are older, so at most a month more is kept.
+    :return: Names of dropped partitions.
+    """
+    if keep_days < max(PRICE_STATS_WINDOWS):
+        raise ValueError(f"Prices must be kept for at least {max(PRICE_STATS_WINDOWS)} days, "
+                         f"price statistics are computed from them")
+
+    cutoff = datetime.utcnow() - timedelta(days=keep_days)
+    dropped: List[str] = []
+
+    for month, name in sorted(get_price_partitions(db).items()):
+        if add_months(month, 1) > cutoff.date():
+            break
+
+        db.execute(text(ROLL_UP_STATEMENT.format(source=f"SELECT * FROM {name}")))
+        db.execute(text(f"DROP TABLE {name}"))
+        db.commit()
+
+        logger.info(f"Rolled up and dropped price partition {name}")
+        dropped.append(name)
+
+    # Prices outside of monthly partitions, e.g. with dates before the table was partitioned
+    result = db.execute(text(ROLL_UP_STATEMENT.format(source=f"DELETE FROM {DEFAULT_PARTITION} "
+                                                             f"WHERE date < :cutoff RETURNING *")),
+                        {"cutoff": cutoff})
+    db.commit()
+
+    logger.info(f"Rolled up {result.rowcount} daily aggregates of prices from {DEFAULT_PARTITION}")
+
+    return dropped
@@ -0,0 +1,123 @@
+import threading
+import time
+from typing import Callable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+
+class PoolStats:
+    """
+    Usage counters of a connection pool.
+    Updated by `InstrumentedQueuePool` and by pool events registered with `track_usage`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        # Called with wait time and whether it timed out, e.g. to export it as a metric
+        self.on_wait: Optional[Callable[[float, bool], None]] = None
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+        if self.on_wait is not None:
+            self.on_wait(seconds, timed_out)
+
+    def checked_out(self):
+        with self._lock:
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def checked_in(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+
+            return {
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": self.wait_total / attempts * 1000 if attempts > 0 else 0.0,
+                "wait_max_ms": self.wait_max * 1000,
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool measuring how long getting a connection takes, including waiting for a free one.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+
+        try:
+            connection = super()._do_get()
+        except TimeoutError:
+            self.stats.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+
+        self.stats.record_wait(time.perf_counter() - start)
+
+        return connection
+
+    def recreate(self):
+        # Keep counters when the engine is disposed
+        pool = super().recreate()
+        pool.stats = self.stats
+
+        return pool
+
+
+class InstrumentedAsyncAdaptedQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    pass
+
+
+def track_usage(engine: Engine):
+    """
+    Count connections in use of an engine using `InstrumentedQueuePool`.
+    """
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        engine.pool.stats.checked_out()
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        engine.pool.stats.checked_in()
+
+
+def pool_status(engine: Engine) -> dict:
+    pool: InstrumentedQueuePool = engine.pool
+
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        # Overflow counter is negative until the pool is full
+        "overflow": max(pool.overflow(), 0),
+        "timeout": pool.timeout(),
+        **pool.stats.as_dict(),
+    }
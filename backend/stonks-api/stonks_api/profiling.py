@@ -0,0 +1,141 @@
+"""
+Opt-in profiling of SQL statements executed by a request.
+
+Profiled requests return a summary of their statements in `Server-Timing` header,
+statements slower than the threshold are logged with their `EXPLAIN (ANALYZE, BUFFERS)` plan.
+Note that analyzing a statement runs it once more, so profiling should not be enabled for all requests
+when the database is under load.
+"""
+import time
+import weakref
+from enum import Enum
+from typing import List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from starlette.requests import Request
+
+# Header which enables profiling of a single request if profiling mode is `header`, lowercase as in ASGI scope
+PROFILE_HEADER = "x-sql-profile"
+
+
+class ProfileMode(str, Enum):
+    off = "off"
+    # Profile only requests with `X-SQL-Profile: 1` header
+    header = "header"
+    on = "on"
+
+
+class ProfiledStatement:
+    __slots__ = ("statement", "duration")
+
+    def __init__(self, statement: str, duration: float):
+        self.statement = statement
+        self.duration = duration
+
+
+class SqlProfiler:
+    """
+    Record statements executed by sessions attached with `attach`.
+    """
+
+    def __init__(self, slow_threshold: float):
+        """
+        :param slow_threshold: Statements running at least that many seconds are explained.
+        """
+        self.slow_threshold = slow_threshold
+        self.statements: List[ProfiledStatement] = []
+        self._connections = weakref.WeakSet()
+
+    def attach(self, session: Session):
+        """
+        Profile all statements of the session. Async sessions must be attached by their `sync_session`.
+        """
+        event.listen(session, "after_begin", self._on_begin)
+
+    def _on_begin(self, session: Session, transaction, connection: Connection):
+        # Every transaction may run on a different connection
+        if connection in self._connections:
+            return
+
+        self._connections.add(connection)
+        event.listen(connection, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(connection, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._profile_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn: Connection, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - context._profile_start
+        self.statements.append(ProfiledStatement(statement, duration))
+
+        if duration >= self.slow_threshold:
+            self._explain(conn, statement, parameters[0] if executemany else parameters, duration)
+
+    def _explain(self, conn: Connection, statement: str, parameters, duration: float):
+        """
+        Log plan of a slow statement. Only selects are analyzed, other statements would be applied twice.
+        """
+        options = "(ANALYZE, BUFFERS)" if statement.lstrip()[:6].upper() == "SELECT" else ""
+
+        # A separate cursor, rows of the original one may not have been fetched yet
+        cursor = conn.connection.cursor()
+        # Failed statement aborts the whole transaction, the savepoint keeps the request going
+        cursor.execute("SAVEPOINT sql_profile_explain")
+
+        try:
+            cursor.execute(f"EXPLAIN {options} {statement}", parameters)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+            cursor.execute("RELEASE SAVEPOINT sql_profile_explain")
+        except Exception as e:
+            plan = f"Could not explain statement: {e!r}"
+            cursor.execute("ROLLBACK TO SAVEPOINT sql_profile_explain")
+        finally:
+            cursor.close()
+
+        logger.bind(explain=True).debug(f"Slow statement ({duration * 1000:.1f}ms):\n{statement}\n{plan}")
+
+    @property
+    def total_duration(self) -> float:
+        return sum(statement.duration for statement in self.statements)
+
+    def server_timing(self) -> str:
+        """
+        Summary of recorded statements in `Server-Timing` header format.
+        """
+        timings = [f'sql;dur={self.total_duration * 1000:.1f};desc="{len(self.statements)} queries"']
+
+        if len(self.statements) > 0:
+            slowest = max(statement.duration for statement in self.statements)
+            timings.append(f'sql-slowest;dur={slowest * 1000:.1f}')
+
+        return ", ".join(timings)
+
+
+def should_profile(mode: ProfileMode, headers: List[Tuple[bytes, bytes]]) -> bool:
+    """
+    :param headers: Raw headers of ASGI scope.
+    """
+    if mode == ProfileMode.header:
+        return (PROFILE_HEADER.encode(), b"1") in headers
+
+    return mode == ProfileMode.on
+
+
+def get_profiler(request: Request) -> Optional[SqlProfiler]:
+    return getattr(request.state, "sql_profiler", None)
+
+
+def configure_explain_log(path: str):
+    """
+    Write plans of slow statements to a rotating log file, created with the first slow statement.
+    """
+    logger.add(path,
+               level="DEBUG",
+               filter=lambda record: "explain" in record["extra"],
+               rotation="10 MB",
+               retention=5,
+               delay=True,
+               enqueue=True)
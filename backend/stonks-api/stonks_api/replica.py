@@ -0,0 +1,127 @@
+"""
+Read-your-writes consistency of reads served by a read replica.
+
+The replica applies writes of the primary with a lag, so a client reading right after its own write could miss it.
+Every write request (any method except GET, HEAD and OPTIONS) marks its client as a recent writer
+and reads of recent writers are served by the primary for `lag_window` seconds.
+
+A client is identified by `X-Client-Id` header, or by its address when it does not send one.
+Recent writers are remembered by the worker which handled the write and in `stonks-last-write` cookie,
+so clients which keep cookies are recognized by any uvicorn worker.
+"""
+import math
+import time
+from collections import OrderedDict
+from http.cookies import SimpleCookie
+from typing import Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+CLIENT_ID_HEADER = b"x-client-id"
+LAST_WRITE_COOKIE = "stonks-last-write"
+# Clients remembered by a single worker, the least recent writers are forgotten first
+MAX_WRITERS = 10_000
+
+
+class RecentWriters:
+    """
+    Time of the last write of every client, within `lag_window` seconds.
+    """
+
+    def __init__(self, lag_window: float, max_writers: int = MAX_WRITERS):
+        self.lag_window = lag_window
+        self.max_writers = max_writers
+        self._writes: "OrderedDict[str, float]" = OrderedDict()
+
+    def mark(self, client: str, now: float):
+        self._writes[client] = now
+        self._writes.move_to_end(client)
+
+        while len(self._writes) > self.max_writers:
+            self._writes.popitem(last=False)
+
+    def is_recent(self, client: str, now: float) -> bool:
+        written_at = self._writes.get(client)
+
+        if written_at is None:
+            return False
+
+        if now - written_at >= self.lag_window:
+            del self._writes[client]
+            return False
+
+        return True
+
+
+def client_key(scope: Scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == CLIENT_ID_HEADER:
+            return f"id:{value.decode('latin-1')}"
+
+    client = scope.get("client")
+
+    return f"address:{client[0]}" if client else None
+
+
+def last_write_from_cookie(scope: Scope) -> Optional[float]:
+    for name, value in scope["headers"]:
+        if name == b"cookie":
+            morsel = SimpleCookie(value.decode("latin-1")).get(LAST_WRITE_COOKIE)
+
+            try:
+                return float(morsel.value) if morsel is not None else None
+            except ValueError:
+                return None
+
+    return None
+
+
+class ReadYourWritesMiddleware:
+    """
+    Set `request.state.read_from_primary` of read requests of clients which have written recently,
+    `get_read_db` and `get_async_read_db` give such requests a session of the primary.
+    """
+
+    def __init__(self, app: ASGIApp, lag_window: float = 5.0):
+        self.app = app
+        self.lag_window = lag_window
+        self.writers = RecentWriters(lag_window)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        now = time.time()
+        client = client_key(scope)
+
+        if scope["method"] in READ_METHODS:
+            last_write = last_write_from_cookie(scope)
+            recent = ((client is not None and self.writers.is_recent(client, now))
+                      or (last_write is not None and now - last_write < self.lag_window))
+            scope.setdefault("state", {})["read_from_primary"] = recent
+
+            await self.app(scope, receive, send)
+            return
+
+        # Marked before the write is handled too, so reads sent while it is in progress go to the primary
+        if client is not None:
+            self.writers.mark(client, now)
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                # The lag window starts when the write is committed, not when it started
+                written_at = time.time()
+
+                if client is not None:
+                    self.writers.mark(client, written_at)
+
+                MutableHeaders(scope=message).append("Set-Cookie",
+                                                     f"{LAST_WRITE_COOKIE}={written_at:.3f}; "
+                                                     f"Max-Age={math.ceil(self.lag_window)}; Path=/; HttpOnly")
+
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
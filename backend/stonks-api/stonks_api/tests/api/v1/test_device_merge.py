@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta
+from typing import List
+
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import parse_obj_as
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from stonks_types import schemas
+
+from stonks_api import crud, models
+from stonks_api.database import SessionLocal
+
+now = datetime.utcnow()
+CANONICAL = "merge iphone 8"
+DUPLICATES = ["merge iphone8", "merge iphone 8 64gb"]
+
+
+def has_pg_trgm() -> bool:
+    db: Session = SessionLocal()
+
+    try:
+        return db.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar() is not None
+    finally:
+        db.close()
+
+
+requires_pg_trgm = pytest.mark.skipif(not has_pg_trgm(), reason="pg_trgm extension is not installed")
+
+
+@pytest.fixture
+def db():
+    """
+    Seed the canonical device and its duplicates, each with an offer, a price and a daily price aggregate.
+    """
+    names = [CANONICAL, *DUPLICATES]
+    db: Session = SessionLocal()
+    db.bulk_insert_mappings(models.Device, [
+        {"name": name, "last_price_update": now - timedelta(days=i)} for i, name in enumerate(names)
+    ])
+    db.bulk_insert_mappings(models.Offer, [
+        {"id": f"merge-{i}",
+         "url": "https://example.org",
+         "title": f"Merge offer {i}",
+         "category": "smartphones/iphone",
+         "device_name": name,
+         "price": 100,
+         "currency": "PLN",
+         "photos": [],
+         "is_active": True,
+         "scraped_at": now}
+        for i, name in enumerate(names)
+    ])
+    db.bulk_insert_mappings(models.Price, [
+        {"device_name": name, "source": "test source", "price": 100 * (i + 1), "currency": "PLN", "date": now}
+        for i, name in enumerate(names)
+    ])
+    db.bulk_insert_mappings(models.PriceDaily, [
+        {"device_name": name, "day": now.date() - timedelta(days=200), "currency": "PLN", "sample_count": 2,
+         "min_price": 10 * (i + 1), "max_price": 20 * (i + 1), "sum_price": 30 * (i + 1)}
+        for i, name in enumerate(names)
+    ])
+    db.commit()
+    crud.price_stats.refresh(db, names)
+
+    yield db
+
+    db.rollback()
+    db.query(models.Offer).filter(models.Offer.id.like("merge-%")).delete(synchronize_session=False)
+    db.query(models.Device).filter(models.Device.name.like("merge %")).delete(synchronize_session=False)
+    db.commit()
+    db.close()
+
+
+def test_merge_devices(client: TestClient, db: Session):
+    r = client.post(f"/v1/devices/{CANONICAL}/merge", json={"duplicates": DUPLICATES})
+
+    assert r.status_code == 200
+
+    result = schemas.DeviceMergeResult(**r.json())
+
+    assert result.device.name == CANONICAL
+    assert result.merged == DUPLICATES
+    assert result.moved_offers == 2
+    assert result.moved_prices == 2
+
+    assert db.query(models.Device).filter(models.Device.name.in_(DUPLICATES)).count() == 0
+    assert {offer.device_name for offer in db.query(models.Offer).filter(models.Offer.id.like("merge-%"))} == \
+           {CANONICAL}
+
+    stats = crud.price_stats.get_one(db, CANONICAL)
+
+    assert stats.sample_count == 3
+    assert stats.median_price == 200
+
+    daily = db.query(models.PriceDaily).filter(models.PriceDaily.device_name == CANONICAL).one()
+
+    assert (daily.sample_count, daily.min_price, daily.max_price, daily.sum_price) == (6, 10, 60, 180)
+
+
+def test_merge_devices_invalid(client: TestClient, db: Session):
+    r = client.post(f"/v1/devices/{CANONICAL}/merge", json={"duplicates": [CANONICAL]})
+
+    assert r.status_code == 400
+
+    r = client.post(f"/v1/devices/{CANONICAL}/merge", json={"duplicates": [*DUPLICATES, "THIS DOES NOT EXIST"]})
+
+    assert r.status_code == 404
+    assert db.query(models.Device).filter(models.Device.name.in_(DUPLICATES)).count() == 2
+
+    r = client.post("/v1/devices/THIS DOES NOT EXIST/merge", json={"duplicates": DUPLICATES})
+
+    assert r.status_code == 404
+
+
+@requires_pg_trgm
+def test_get_similar_devices(client: TestClient, db: Session):
+    r = client.get("/v1/devices/similar", params={"name": "Merge iPhone 8", "threshold": 0.5})
+
+    assert r.status_code == 200
+
+    devices = parse_obj_as(List[schemas.SimilarDevice], r.json())
+
+    assert devices[0].name == CANONICAL
+    assert devices[0].similarity == 1
+    assert {device.name for device in devices} == {CANONICAL, *DUPLICATES}
+    assert [device.similarity for device in devices] == sorted([device.similarity for device in devices],
+                                                               reverse=True)
@@ -1,18 +1,34 @@
 from typing import List
 
+import pytest
 from fastapi.testclient import TestClient
 from pydantic import parse_obj_as
 from stonks_types import schemas
 from stonks_types.schemas import Device
 
-from stonks_api.tests.utils import delete_devices
+from stonks_api import models
 
 device = schemas.DeviceCreate(name="Test device")
 device_name_lowercase = device.name.lower()
 
 
+@pytest.fixture
+def client(isolated_client: TestClient, isolated_db) -> TestClient:
+    # Every test starts without devices, they are deleted only in its own transaction
+    isolated_db(lambda db: db.query(models.Device).delete(synchronize_session=False))
+
+    return isolated_client
+
+
+@pytest.fixture
+def created_device(client: TestClient):
+    r = client.post("v1/devices/",
+                    data=device.json())
+
+    assert r.status_code == 201
+
+
 def test_create_device(client: TestClient):
-    delete_devices()
     r = client.post("v1/devices/",
                     data=device.json())
     device_response = Device(**r.json())
@@ -23,7 +39,7 @@ def test_create_device(client: TestClient):
     assert device.dict(exclude={"name"}).items() <= device_response.dict(exclude={"name"}).items()
 
 
-def test_create_device_already_exists(client: TestClient):
+def test_create_device_already_exists(client: TestClient, created_device):
     r = client.post("v1/devices/",
                     data=device.json())
 
@@ -36,7 +52,7 @@ def test_create_device_invalid(client: TestClient):
     assert r.status_code == 422
 
 
-def test_get_devices(client: TestClient):
+def test_get_devices(client: TestClient, created_device):
     r = client.get("v1/devices/", params={"limit": 500,
                                           "skip": 0})
 
@@ -49,7 +65,7 @@ def test_get_devices(client: TestClient):
     assert device.dict(exclude={"name"}).items() <= device_response.dict(exclude={"name"}).items()
 
 
-def test_delete_device(client: TestClient):
+def test_delete_device(client: TestClient, created_device):
     r = client.delete(f"v1/devices/{device_name_lowercase}")
 
     assert r.status_code == 200
@@ -68,3 +84,33 @@ def test_delete_device_not_found(client: TestClient):
     assert r.json() == {
         "detail": "Device not found."
     }
+
+
+def test_get_devices_cursor(client: TestClient):
+    names = ["cursor device a", "cursor device b", "cursor device c"]
+
+    for name in names:
+        client.post("v1/devices/", data=schemas.DeviceCreate(name=name).json())
+
+    r = client.get("v1/devices/", params={"limit": 2})
+    devices = parse_obj_as(List[schemas.Device], r.json())
+
+    assert r.status_code == 200
+    assert [d.name for d in devices] == names[:2]
+
+    r = client.get("v1/devices/", params={"limit": 2,
+                                          "cursor": r.headers["X-Next-Cursor"]})
+    devices = parse_obj_as(List[schemas.Device], r.json())
+
+    assert r.status_code == 200
+    assert [d.name for d in devices] == names[2:]
+    assert "X-Next-Cursor" not in r.headers
+
+
+def test_get_devices_invalid_cursor(client: TestClient):
+    r = client.get("v1/devices/", params={"cursor": "THIS IS NOT A CURSOR"})
+
+    assert r.status_code == 400
+    assert r.json() == {
+        "detail": "Invalid cursor"
+    }
@@ -0,0 +1,16 @@
+from fastapi.testclient import TestClient
+
+
+def test_get_pool_status(client: TestClient):
+    client.get("v1/offers/")
+    client.get("v1/devices/")
+
+    r = client.get("v1/_internal/pool")
+    pools = r.json()
+
+    assert r.status_code == 200
+
+    for name in ("sync", "async"):
+        assert pools[name]["checkouts"] > 0
+        assert pools[name]["peak_in_use"] >= 1
+        assert pools[name]["timeouts"] == 0
@@ -0,0 +1,105 @@
+from datetime import datetime
+from typing import List
+
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import parse_obj_as
+from sqlalchemy.orm import Session
+from stonks_types import schemas
+
+from stonks_api import models
+from stonks_api.database import SessionLocal
+
+now = datetime.utcnow()
+# Id, title, description, category, price, is_active
+OFFERS = [
+    ("search-1", "Pixel 3a 64GB", "Telefon w dobrym stanie", "smartphones/google", 500, True),
+    ("search-2", "Etui na telefon", "Pasuje do pixel 3a", "smartphones/accessories", 20, True),
+    ("search-3", "Pixel 3a uszkodzony", None, "smartphones/google", 150, True),
+    ("search-4", "Pixel 3a", "Sprzedany", "smartphones/google", 450, False),
+    ("search-5", "Laptop", "Nie ma tu zadnego telefonu", "laptops", 2000, True),
+]
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    db: Session = SessionLocal()
+    db.bulk_insert_mappings(models.Offer, [
+        {"id": id,
+         "url": "https://example.org",
+         "title": title,
+         "description": description,
+         "category": category,
+         "price": price,
+         "currency": "PLN",
+         "photos": [],
+         "is_active": is_active,
+         "scraped_at": now}
+        for id, title, description, category, price, is_active in OFFERS
+    ])
+    db.commit()
+
+    yield db
+
+    db.query(models.Offer).filter(models.Offer.id.like("search-%")).delete(synchronize_session=False)
+    db.commit()
+    db.close()
+
+
+def search(client: TestClient, **params) -> List[str]:
+    r = client.get("/v1/offers/search", params=params)
+
+    assert r.status_code == 200
+
+    return [offer.id for offer in parse_obj_as(List[schemas.Offer], r.json())]
+
+
+def test_search_offers(client: TestClient, seeded: Session):
+    ids = search(client, q="pixel 3a")
+
+    # Title matches rank higher than description matches
+    assert set(ids[:2]) == {"search-1", "search-3"}
+    assert ids[2:] == ["search-2"]
+
+
+def test_search_offers_web_syntax(client: TestClient, seeded: Session):
+    assert set(search(client, q="pixel -uszkodzony")) == {"search-1", "search-2"}
+    assert search(client, q='"dobrym stanie"') == ["search-1"]
+
+
+def test_search_offers_filters(client: TestClient, seeded: Session):
+    assert set(search(client, q="pixel", category="smartphones/google")) == {"search-1", "search-3"}
+    assert set(search(client, q="pixel", category="smartphones")) == {"search-1", "search-2", "search-3"}
+    assert search(client, q="pixel", min_price=100, max_price=200) == ["search-3"]
+    assert search(client, q="pixel", is_active=False) == ["search-4"]
+
+
+def test_search_offers_cursor(client: TestClient, seeded: Session):
+    expected = search(client, q="pixel")
+    ids = []
+    cursor = None
+
+    while True:
+        params = {"q": "pixel", "limit": 1}
+
+        if cursor is not None:
+            params["cursor"] = cursor
+
+        r = client.get("/v1/offers/search", params=params)
+        ids += [offer["id"] for offer in r.json()]
+        cursor = r.headers.get("X-Next-Cursor")
+
+        if cursor is None:
+            break
+
+    assert ids == expected
+
+
+def test_search_offers_invalid(client: TestClient):
+    r = client.get("/v1/offers/search", params={"q": "pixel", "cursor": "THIS IS NOT A CURSOR"})
+
+    assert r.status_code == 400
+
+    r = client.get("/v1/offers/search")
+
+    assert r.status_code == 422
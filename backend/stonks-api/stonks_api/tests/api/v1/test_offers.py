@@ -1,13 +1,14 @@
+import json
 from datetime import datetime, timedelta
 from typing import List
 
+import pytest
 from fastapi.testclient import TestClient
 from pydantic import parse_obj_as, BaseModel
+from pydantic.json import pydantic_encoder
 from stonks_types import schemas
 from stonks_types.schemas import Offer, OfferCreate, DeliveryCreate, Delivery, OfferUpdate
 
-from stonks_api.tests.utils import delete_offers, delete_devices
-
 data_offer_create = schemas.OfferCreate(
     id="test_offer",
     url="https://example.org",
@@ -32,10 +33,39 @@ deliveries: List[DeliveryCreate] = [
 month_ago = datetime.utcnow() - timedelta(days=40)
 
 
+def offer_create(offer_id: str, **kwargs) -> OfferCreate:
+    return OfferCreate(**{**data_offer_create.dict(exclude={"id"}),
+                          "id": offer_id,
+                          **kwargs})
+
+
+@pytest.fixture
+def client(isolated_client: TestClient) -> TestClient:
+    # Every test starts without offers of the other ones
+    return isolated_client
+
+
+@pytest.fixture
+def device(client: TestClient) -> schemas.DeviceCreate:
+    device = schemas.DeviceCreate(name="test device")
+    r = client.post(f"/v1/devices/", data=device.json())
+
+    assert r.status_code == 201
+
+    return device
+
+
+@pytest.fixture
+def offer(client: TestClient) -> Offer:
+    r = client.post(f"/v1/offers/", data=offer_create("test_offer", deliveries=deliveries).json())
+
+    assert r.status_code == 201
+
+    return Offer(**r.json())
+
+
 # CREATE OFFER
 def test_create_offer(client: TestClient):
-    delete_offers()
-
     r = client.post(f"/v1/offers/", data=data_offer_create.json())
 
     assert r.status_code == 201
@@ -63,14 +93,14 @@ def test_create_offer_error(client: TestClient):
     assert r.status_code == 422
 
 
-def test_create_offer_already_exists(client: TestClient):
+def test_create_offer_already_exists(client: TestClient, offer: Offer):
     r = client.post(f"/v1/offers/", data=data_offer_create.json())
 
     assert r.status_code == 409
 
 
 # UPDATE OFFER
-def test_update_offer(client: TestClient):
+def test_update_offer(client: TestClient, offer: Offer):
     offer_update = OfferUpdate(**data_offer_create.dict())
     offer_update.title = "edited title"
 
@@ -100,12 +130,11 @@ def test_update_offer_invalid(client: TestClient):
 
 
 # GET OFFER
-def test_get_offer(client: TestClient):
+def test_get_offer(client: TestClient, offer: Offer):
     r = client.get(f"/v1/offers/test_offer")
 
     assert r.status_code == 200
-    offer = Offer(**r.json())
-    assert offer.title == "edited title"
+    assert Offer(**r.json()) == offer
 
     # params
     # get scraped after month ago
@@ -170,7 +199,7 @@ def test_get_offer_not_found(client: TestClient):
 
 
 # GET OFFERS
-def test_get_offers(client: TestClient):
+def test_get_offers(client: TestClient, offer: Offer):
     r = client.get(f"/v1/offers")
 
     assert r.status_code == 200
@@ -180,7 +209,52 @@ def test_get_offers(client: TestClient):
     assert len(offers) > 0
 
 
-def test_delete_offer(client: TestClient):
+def test_get_offers_summary(client: TestClient, offer: Offer):
+    client.post(f"/v1/offers/", data=offer_create("test summary").json())
+    r = client.get(f"/v1/offers", params={"view": "summary", "limit": 1})
+
+    assert r.status_code == 200
+    assert r.headers.get("X-Next-Cursor") is not None
+
+    offers = r.json()
+
+    assert len(offers) == 1
+    assert set(offers[0]) == set(schemas.OfferSummary.__fields__)
+
+
+def test_get_offers_cursor(client: TestClient):
+    ids = ["test cursor 1", "test cursor 2"]
+
+    for i, offer_id in enumerate(ids):
+        client.post(f"/v1/offers/", data=OfferCreate(**data_offer_create.dict(exclude={"id", "scraped_at"}),
+                                                     id=offer_id,
+                                                     scraped_at=datetime.utcnow() + timedelta(days=i + 1)).json())
+
+    seen = []
+    cursor = None
+
+    while True:
+        params = {"limit": 1}
+
+        if cursor is not None:
+            params["cursor"] = cursor
+
+        r = client.get(f"/v1/offers", params=params)
+
+        assert r.status_code == 200
+
+        seen += [offer.id for offer in parse_obj_as(List[Offer], r.json())]
+        cursor = r.headers.get("X-Next-Cursor")
+
+        if cursor is None:
+            break
+
+    # Every active offer is returned exactly once, ordered by scrape date
+    assert seen[-2:] == ids
+    assert len(seen) == len(set(seen))
+
+
+def test_delete_offer(client: TestClient, offer: Offer):
     offers_count_before = len(client.get(f"/v1/offers").json())
     r = client.delete(f"/v1/offers/test_offer")
 
@@ -201,19 +275,16 @@ def test_delete_offer_not_found(client: TestClient):
 
 # DELIVERIES
 def test_create_offer_with_deliveries(client: TestClient):
-    delete_offers()
-
-    offer_create = data_offer_create
-    offer_create.deliveries = deliveries
+    offer_with_deliveries = offer_create("test_offer", deliveries=deliveries)
 
-    r = client.post(f"/v1/offers/", data=offer_create.json())
+    r = client.post(f"/v1/offers/", data=offer_with_deliveries.json())
 
     assert r.status_code == 201
 
     offer = Offer(**r.json())
 
     assert offer.deliveries[0].id is not None
-    assert schemas.OfferCreate(**offer.dict()) == offer_create
+    assert schemas.OfferCreate(**offer.dict()) == offer_with_deliveries
 
 
 class DeliveryCreateList(BaseModel):
@@ -226,7 +297,7 @@ delivery = DeliveryCreate(title="testowa oferta 2",
 delivery_create = DeliveryCreateList(__root__=[delivery])
 
 
-def test_create_delivery(client: TestClient):
+def test_create_delivery(client: TestClient, offer: Offer):
     r = client.post(f"/v1/offers/test_offer/deliveries", data=delivery_create.json())
 
     assert r.status_code == 201
@@ -244,25 +315,20 @@ def test_create_delivery_not_found(client: TestClient):
     assert r.status_code == 404
 
 
-def test_create_delivery_invalid(client: TestClient):
+def test_create_delivery_invalid(client: TestClient, offer: Offer):
     r = client.post(f"/v1/offers/test_offer/deliveries", json={})
 
     assert r.status_code == 422
 
 
-test_deliveries: List[schemas.Delivery]
-
-
-def test_get_deliveries(client: TestClient):
-    global test_deliveries
+def test_get_deliveries(client: TestClient, offer: Offer):
     r = client.get(f"/v1/offers/test_offer/deliveries")
 
     assert r.status_code == 200
 
     test_deliveries = parse_obj_as(List[schemas.Delivery], r.json())
 
-    assert test_deliveries is not None
-    assert len(test_deliveries) > 0
+    assert test_deliveries == offer.deliveries
 
 
 def test_get_deliveries_not_found(client: TestClient):
@@ -276,9 +342,8 @@ delivery_update = schemas.DeliveryUpdate(title="updated delivery",
                                          currency="PLN")
 
 
-def test_update_delivery(client: TestClient):
-    global test_deliveries
-    test_delivery = test_deliveries[0]
+def test_update_delivery(client: TestClient, offer: Offer):
+    test_delivery = offer.deliveries[0]
 
     r = client.put(f"/v1/offers/test_offer/deliveries/{test_delivery.id}", data=delivery_update.json())
 
@@ -294,9 +359,8 @@ def test_update_delivery(client: TestClient):
     assert DeliveryCreate(**response_delivery.dict()) == delivery_update
 
 
-def test_update_delivery_invalid(client: TestClient):
-    global test_deliveries
-    test_delivery = test_deliveries[0]
+def test_update_delivery_invalid(client: TestClient, offer: Offer):
+    test_delivery = offer.deliveries[0]
 
     r = client.put(f"/v1/offers/test_offer/deliveries/{test_delivery.id}", data={})
 
@@ -310,13 +374,13 @@ def test_update_delivery_offer_not_found(client: TestClient):
     assert r.status_code == 404
 
 
-def test_update_delivery_delivery_not_found(client: TestClient):
+def test_update_delivery_delivery_not_found(client: TestClient, offer: Offer):
     r = client.put(f"/v1/offers/test_offer/deliveries/-1", data=delivery_update.json())
 
     assert r.status_code == 404
 
 
-def test_delete_deliveries(client: TestClient):
+def test_delete_deliveries(client: TestClient, offer: Offer):
     r = client.delete(f"/v1/offers/test_offer/deliveries")
 
     assert r.status_code == 200
@@ -332,31 +396,204 @@ def test_delete_deliveries_offer_not_found(client: TestClient):
     assert r.status_code == 404
 
 
-def test_create_offer_with_device(client: TestClient):
-    delete_offers()
-    delete_devices()
+def test_create_offer_with_device(client: TestClient, device: schemas.DeviceCreate):
+    offer_with_device = offer_create("test_offer", device_name=device.name)
 
-    data_offer_create.device_name = "test device"
-    device = schemas.DeviceCreate(name=data_offer_create.device_name)
-
-    client.post(f"/v1/devices/", data=device.json())
-    r = client.post(f"/v1/offers/", data=data_offer_create.json())
+    r = client.post(f"/v1/offers/", data=offer_with_device.json())
     offer_response = Offer(**r.json())
 
     assert r.status_code == 201
 
     # check device
     assert offer_response.device.dict(exclude={"last_price_update"}) == device.dict()
-    assert data_offer_create.dict(exclude={"device_name", "deliveries"}).items() <= \
+    assert offer_with_device.dict(exclude={"device_name", "deliveries"}).items() <= \
            offer_response.dict(exclude={"device", "deliveries"}).items()
 
 
 def test_create_offer_with_device_not_found(client: TestClient):
-    data_offer_create.id = "ADLNAJKDNJKAD"
-    data_offer_create.device_name = "THIS DOES NOT EXIST"
-    r = client.post(f"/v1/offers/", data=data_offer_create.json())
+    r = client.post(f"/v1/offers/", data=offer_create("ADLNAJKDNJKAD", device_name="THIS DOES NOT EXIST").json())
+
+    assert r.status_code == 404
+    assert r.json() == {
+        "detail": "Device not found."
+    }
+
+
+def test_create_offers_bulk(client: TestClient, device: schemas.DeviceCreate):
+    offers = [
+        offer_create("test bulk 1", deliveries=deliveries),
+        offer_create("test bulk 2", device_name="test device"),
+        offer_create("test bulk 3", device_name="THIS DOES NOT EXIST"),
+    ]
+
+    r = client.post(f"/v1/offers/bulk", data=json.dumps(offers, default=pydantic_encoder))
+
+    assert r.status_code == 200
+
+    results = parse_obj_as(List[schemas.OfferBulkResult], r.json())
+
+    assert [(result.id, result.status) for result in results] == [
+        ("test bulk 1", schemas.BulkStatus.created),
+        ("test bulk 2", schemas.BulkStatus.created),
+        ("test bulk 3", schemas.BulkStatus.skipped),
+    ]
+
+    offer = Offer(**client.get(f"/v1/offers/test bulk 1").json())
+    assert len(offer.deliveries) == 1
+
+    offer = Offer(**client.get(f"/v1/offers/test bulk 2").json())
+    assert offer.device.name == "test device"
+
+
+def test_create_offers_bulk_update(client: TestClient, device: schemas.DeviceCreate):
+    client.post(f"/v1/offers/bulk", data=json.dumps([offer_create("test bulk 1", deliveries=deliveries),
+                                                     offer_create("test bulk 2", device_name="test device")],
+                                                    default=pydantic_encoder))
+    new_deliveries = [DeliveryCreate(title="updated delivery", price=1, currency="PLN"),
+                      DeliveryCreate(title="another delivery", price=2, currency="PLN")]
+    offers = [
+        offer_create("test bulk 1", title="bulk title", deliveries=new_deliveries),
+        # Last occurrence wins
+        offer_create("test bulk 2", title="first title"),
+        offer_create("test bulk 2", title="second title"),
+    ]
+
+    r = client.post(f"/v1/offers/bulk", data=json.dumps(offers, default=pydantic_encoder))
+    results = parse_obj_as(List[schemas.OfferBulkResult], r.json())
+
+    assert [result.status for result in results] == [schemas.BulkStatus.updated,
+                                                     schemas.BulkStatus.skipped,
+                                                     schemas.BulkStatus.updated]
+
+    offer = Offer(**client.get(f"/v1/offers/test bulk 1").json())
+    assert offer.title == "bulk title"
+    assert offer.last_update_at is not None
+    assert sorted(delivery.title for delivery in offer.deliveries) == ["another delivery", "updated delivery"]
+
+    offer = Offer(**client.get(f"/v1/offers/test bulk 2").json())
+    assert offer.title == "second title"
+    # Device is kept if it is not sent
+    assert offer.device.name == "test device"
+
+
+def test_create_offers_bulk_skip_existing(client: TestClient, offer: Offer):
+    offers = [offer_create("test_offer", title="skipped title")]
+
+    r = client.post(f"/v1/offers/bulk",
+                    params={"on_conflict": "skip"},
+                    data=json.dumps(offers, default=pydantic_encoder))
+    results = parse_obj_as(List[schemas.OfferBulkResult], r.json())
+
+    assert results[0].status == schemas.BulkStatus.skipped
+    assert Offer(**client.get(f"/v1/offers/test_offer").json()).title == offer.title
+
+
+@pytest.fixture
+def patched_offers(client: TestClient):
+    client.post(f"/v1/offers/bulk", data=json.dumps([offer_create("test patch 1"), offer_create("test patch 2")],
+                                                     default=pydantic_encoder))
+
+
+def test_patch_offer(client: TestClient, patched_offers):
+    last_stonks_check = datetime.utcnow().replace(microsecond=0)
+
+    r = client.patch(f"/v1/offers/test patch 1",
+                     data=schemas.OfferPatch(last_stonks_check=last_stonks_check).json(exclude_unset=True))
+
+    assert r.status_code == 200
+
+    offer = Offer(**r.json())
+
+    assert offer.last_stonks_check == last_stonks_check
+    assert offer.title == data_offer_create.title
+    assert offer.last_update_at is None
+
+
+def test_patch_offer_not_found(client: TestClient):
+    r = client.patch(f"/v1/offers/THIS DOES NOT EXIST", json={"title": "edited title"})
+
+    assert r.status_code == 404
+
+
+def test_patch_offer_device(client: TestClient, patched_offers, device: schemas.DeviceCreate):
+    for device_name in [device.name, "_no_device"]:
+        r = client.patch(f"/v1/offers/test patch 1",
+                         data=schemas.OfferPatch(device_name=device_name).json(exclude_unset=True))
+
+        assert r.status_code == 200
+        assert Offer(**r.json()).device.name == device_name
+
+
+def test_patch_offer_device_not_found(client: TestClient, patched_offers):
+    r = client.patch(f"/v1/offers/test patch 1", json={"device_name": "THIS DOES NOT EXIST"})
 
     assert r.status_code == 404
     assert r.json() == {
         "detail": "Device not found."
     }
+
+
+def test_patch_offer_invalid(client: TestClient, patched_offers):
+    r = client.patch(f"/v1/offers/test patch 1", json={"title": None})
+
+    assert r.status_code == 422
+
+
+def test_patch_offers(client: TestClient, patched_offers):
+    last_stonks_check = datetime.utcnow().replace(microsecond=0)
+    patches = [
+        schemas.OfferPatchItem(id="test patch 1", fields=schemas.OfferPatch(last_stonks_check=None)),
+        schemas.OfferPatchItem(id="test patch 2", fields=schemas.OfferPatch(last_stonks_check=last_stonks_check,
+                                                                            price=10)),
+        schemas.OfferPatchItem(id="THIS DOES NOT EXIST", fields=schemas.OfferPatch(price=10)),
+        schemas.OfferPatchItem(id="test patch 2", fields=schemas.OfferPatch()),
+    ]
+
+    r = client.patch(f"/v1/offers/", data=json.dumps([json.loads(patch.json(exclude_unset=True)) for patch in patches]))
+
+    assert r.status_code == 200
+
+    results = parse_obj_as(List[schemas.OfferBulkResult], r.json())
+
+    assert [result.status for result in results] == [schemas.BulkStatus.updated,
+                                                     schemas.BulkStatus.skipped,
+                                                     schemas.BulkStatus.skipped,
+                                                     schemas.BulkStatus.skipped]
+
+    r = client.patch(f"/v1/offers/", data=json.dumps([json.loads(patch.json(exclude_unset=True))
+                                                      for patch in patches[:2]]))
+    results = parse_obj_as(List[schemas.OfferBulkResult], r.json())
+
+    assert [result.status for result in results] == [schemas.BulkStatus.updated, schemas.BulkStatus.updated]
+
+    offer = Offer(**client.get(f"/v1/offers/test patch 1").json())
+    assert offer.last_stonks_check is None
+
+    offer = Offer(**client.get(f"/v1/offers/test patch 2").json())
+    assert offer.last_stonks_check == last_stonks_check
+    assert offer.price == 10
+    assert offer.title == data_offer_create.title
+
+
+def test_patch_offers_device_not_found(client: TestClient, patched_offers, device: schemas.DeviceCreate):
+    patches = [
+        schemas.OfferPatchItem(id="test patch 1", fields=schemas.OfferPatch(device_name=device.name)),
+        schemas.OfferPatchItem(id="test patch 2", fields=schemas.OfferPatch(device_name="THIS DOES NOT EXIST")),
+    ]
+
+    r = client.patch(f"/v1/offers/", data=json.dumps([json.loads(patch.json(exclude_unset=True)) for patch in patches]))
+
+    assert r.status_code == 200
+
+    results = parse_obj_as(List[schemas.OfferBulkResult], r.json())
+
+    assert [(result.status, result.detail) for result in results] == [
+        (schemas.BulkStatus.updated, None),
+        (schemas.BulkStatus.skipped, "Device not found."),
+    ]
+
+    offer = Offer(**client.get(f"/v1/offers/test patch 1").json())
+    assert offer.device.name == device.name
+
+    offer = Offer(**client.get(f"/v1/offers/test patch 2").json())
+    assert offer.device is None
@@ -0,0 +1,77 @@
+from typing import List
+
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import parse_obj_as
+from stonks_types import schemas
+
+device = schemas.DeviceCreate(name="stats device/128gb")
+other_device = schemas.DeviceCreate(name="stats device without prices")
+# The last price is an outlier which is left out of the trimmed mean
+prices = schemas.PricesCreate(prices=[
+    schemas.PriceCreate(source="test source", price=price, currency="PLN")
+    for price in [10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 10000]
+])
+
+
+@pytest.fixture
+def client(isolated_client: TestClient) -> TestClient:
+    for _device in (device, other_device):
+        isolated_client.post("v1/devices/", data=_device.json())
+
+    r = isolated_client.post(f"v1/prices/{device.name}", data=prices.json())
+
+    assert r.status_code == 201
+
+    return isolated_client
+
+
+def test_get_price_stats(client: TestClient):
+    r = client.get(f"v1/devices/{device.name}/price-stats", params={"window": "7d"})
+
+    assert r.status_code == 200
+
+    stats = schemas.PriceStats(**r.json())
+
+    assert stats.device_name == device.name
+    assert stats.window_days == 7
+    assert stats.sample_count == 11
+    assert stats.min_price == 10
+    assert stats.max_price == 10000
+    assert stats.trimmed_mean_price == 60
+    assert stats.median_price == 60
+    assert stats.q1_price == 35
+    assert stats.q3_price == 85
+    assert stats.last_price_at is not None
+
+
+def test_get_price_stats_invalid_window(client: TestClient):
+    r = client.get(f"v1/devices/{device.name}/price-stats", params={"window": "5d"})
+
+    assert r.status_code == 400
+
+
+def test_get_price_stats_not_found(client: TestClient):
+    r = client.get(f"v1/devices/THIS DOES NOT EXIST/price-stats")
+
+    assert r.status_code == 404
+    assert r.json() == {
+        "detail": "Device not found."
+    }
+
+    r = client.get(f"v1/devices/{other_device.name}/price-stats")
+
+    assert r.status_code == 404
+
+
+def test_get_many_price_stats(client: TestClient):
+    r = client.get("v1/devices/price-stats", params={"name": [device.name, other_device.name, "THIS DOES NOT EXIST"],
+                                                     "window": "30d"})
+
+    assert r.status_code == 200
+
+    stats = parse_obj_as(List[schemas.PriceStats], r.json())
+
+    assert [s.device_name for s in stats] == [device.name]
+    assert stats[0].window_days == 30
+    assert stats[0].median_price == 60
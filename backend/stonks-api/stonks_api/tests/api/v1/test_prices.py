@@ -1,6 +1,15 @@
+import json
+import time
+from datetime import datetime
+
+import pytest
 from fastapi.testclient import TestClient
-from stonks_types.schemas import PriceCreate, PricesCreate, Prices
+from sqlalchemy.orm import Session
+from stonks_types.schemas import PriceCreate, PricesCreate, Prices, PricesBulkResult
+
+from stonks_api import models
 
+DEVICE_NAME = "test prices device"
 prices: PricesCreate = PricesCreate(prices=[
     PriceCreate(source="test source",
                 price=69,
@@ -8,8 +17,24 @@ prices: PricesCreate = PricesCreate(prices=[
 ])
 
 
+def create_device(db: Session):
+    db.add(models.Device(name=DEVICE_NAME))
+    db.commit()
+
+
+@pytest.fixture
+def client(isolated_client: TestClient, isolated_db) -> TestClient:
+    isolated_db(create_device)
+
+    return isolated_client
+
+
+def last_price_update(isolated_db):
+    return isolated_db(lambda db: db.get(models.Device, DEVICE_NAME).last_price_update)
+
+
 def test_create_prices(client: TestClient):
-    r = client.post(f"/v1/prices/test device", data=prices.json())
+    r = client.post(f"/v1/prices/{DEVICE_NAME}", data=prices.json())
     response_prices: Prices = Prices(**r.json())
 
     assert r.status_code == 201
@@ -20,6 +45,24 @@ def test_create_prices(client: TestClient):
     assert price.dict(exclude={"date"}).items() == response_price.dict(exclude={"date", "id"}).items()
 
 
+def test_create_prices_without_date(client: TestClient):
+    created_after = datetime.utcnow()
+    r = client.post(f"/v1/prices/{DEVICE_NAME}", json={
+        "prices": [{"source": "test source", "price": 69, "currency": "PLN"}]
+    })
+
+    assert r.status_code == 201
+    assert Prices(**r.json()).prices[0].date >= created_after
+
+
+def test_price_date_defaults_to_creation_time():
+    first = PriceCreate(source="test source", price=69, currency="PLN")
+    time.sleep(1)
+    second = PriceCreate(source="test source", price=69, currency="PLN")
+
+    assert (second.date - first.date).total_seconds() >= 1
+
+
 def test_create_prices_device_not_found(client: TestClient):
     r = client.post(f"/v1/prices/THIS DOES NOT EXIST", data=prices.json())
 
@@ -27,7 +70,9 @@ def test_create_prices_device_not_found(client: TestClient):
 
 
 def test_get_prices_for_device(client: TestClient):
-    r = client.get(f"/v1/prices/test device")
+    client.post(f"/v1/prices/{DEVICE_NAME}", data=prices.json())
+
+    r = client.get(f"/v1/prices/{DEVICE_NAME}")
     response_prices: Prices = Prices(**r.json())
 
     assert r.status_code == 200
@@ -42,3 +87,29 @@ def test_get_prices_for_device_not_found(client: TestClient):
     r = client.get(f"/v1/prices/HIS DOES NOT EXIST")
 
     assert r.status_code == 404
+
+
+def test_create_prices_bulk(client: TestClient, isolated_db):
+    client.post(f"/v1/prices/{DEVICE_NAME}", data=prices.json())
+    last_price_update_before = last_price_update(isolated_db)
+
+    r = client.post("/v1/prices/bulk", data=json.dumps({
+        DEVICE_NAME: [json.loads(price.json()) for price in prices.prices * 2],
+        "THIS DOES NOT EXIST": [json.loads(prices.prices[0].json())],
+    }))
+
+    assert r.status_code == 201
+
+    result = PricesBulkResult(**r.json())
+
+    assert result.created == {DEVICE_NAME: 2}
+    assert result.not_found == ["THIS DOES NOT EXIST"]
+
+    assert last_price_update(isolated_db) > last_price_update_before
+
+
+def test_create_prices_bulk_empty(client: TestClient):
+    r = client.post("/v1/prices/bulk", data=json.dumps({DEVICE_NAME: []}))
+
+    assert r.status_code == 201
+    assert PricesBulkResult(**r.json()).created == {DEVICE_NAME: 0}
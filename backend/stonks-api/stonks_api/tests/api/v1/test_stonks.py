@@ -1,10 +1,15 @@
+from datetime import datetime
 from typing import List
 
+import pytest
 from fastapi.testclient import TestClient
 from pydantic import parse_obj_as
+from sqlalchemy.orm import Session
 from stonks_types import schemas
 
-from stonks_api.tests.utils import delete_stonks
+from stonks_api import models
+
+OFFER_ID = "test stonks offer"
 
 fees: List[schemas.FeeCreate] = [
     schemas.FeeCreate(title="test fee",
@@ -15,15 +20,37 @@ stonks_create: schemas.StonksCreate = schemas.StonksCreate(stonks_amount=100,
                                                            fees=fees)
 
 
-stonks_response: schemas.Stonks
+def create_offer(db: Session):
+    db.add(models.Offer(id=OFFER_ID,
+                        url="https://example.org",
+                        title="Example title",
+                        category="smartphone",
+                        price=500.59,
+                        currency="PLN",
+                        photos=[],
+                        is_active=True,
+                        scraped_at=datetime.utcnow()))
+    db.commit()
 
 
-def test_create_stonks(client: TestClient):
-    global stonks_response
+@pytest.fixture
+def client(isolated_client: TestClient, isolated_db) -> TestClient:
+    isolated_db(create_offer)
+
+    return isolated_client
+
+
+@pytest.fixture
+def stonks_response(client: TestClient) -> schemas.Stonks:
+    r = client.post(f"/v1/offers/{OFFER_ID}/stonks", data=stonks_create.json())
+
+    assert r.status_code == 201
+
+    return schemas.Stonks(**r.json())
 
-    delete_stonks()
 
-    r = client.post(f"/v1/offers/test_offer/stonks", data=stonks_create.json())
+def test_create_stonks(client: TestClient):
+    r = client.post(f"/v1/offers/{OFFER_ID}/stonks", data=stonks_create.json())
 
     assert r.status_code == 201
 
@@ -33,8 +60,6 @@ def test_create_stonks(client: TestClient):
     assert response_stonks.fees[0].id is not None
     assert schemas.StonksCreate(**response_stonks.dict()) == stonks_create
 
-    stonks_response = response_stonks
-
 
 def test_create_stonks_offer_not_found(client: TestClient):
     r = client.post(f"/v1/offers/THIS DOES NOT EXIST/stonks", data=stonks_create.json())
@@ -42,7 +67,7 @@ def test_create_stonks_offer_not_found(client: TestClient):
     assert r.status_code == 404
 
 
-def test_get_stonkses(client: TestClient):
+def test_get_stonkses(client: TestClient, stonks_response: schemas.Stonks):
     r = client.get(f"/v1/stonks")
 
     assert r.status_code == 200
@@ -52,7 +77,20 @@ def test_get_stonkses(client: TestClient):
     assert len(stonkses) > 0
 
 
-def test_get_stonks(client: TestClient):
+def test_get_stonkses_summary(client: TestClient, stonks_response: schemas.Stonks):
+    r = client.get(f"/v1/stonks", params={"view": "summary"})
+
+    assert r.status_code == 200
+
+    stonkses = parse_obj_as(List[schemas.StonksSummary], r.json())
+    stonks = next(stonks for stonks in stonkses if stonks.id == stonks_response.id)
+
+    assert "fees" not in r.json()[0]
+    assert stonks.stonks_amount == stonks_response.stonks_amount
+    assert stonks.offer.id == OFFER_ID
+
+
+def test_get_stonks(client: TestClient, stonks_response: schemas.Stonks):
     r = client.get(f"/v1/stonks/{stonks_response.id}")
 
     assert r.status_code == 200
@@ -68,7 +106,7 @@ def test_get_stonks_not_found(client: TestClient):
     assert r.status_code == 404
 
 
-def test_delete_stonks(client: TestClient):
+def test_delete_stonks(client: TestClient, stonks_response: schemas.Stonks):
     r = client.delete(f"/v1/stonks/{stonks_response.id}")
 
     assert r.status_code == 200
@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+from stonks_types import schemas
+
+from stonks_api import models
+from stonks_api.database import SessionLocal
+
+now = datetime.utcnow()
+recently = now - timedelta(minutes=5)
+SELL_FEES = {"smartphones/other": 0.045}
+# Id, device, category, price, is_active, last stonks check
+OFFERS = [
+    ("recompute-stonks", "recompute device", "smartphones/other", 500, True, None),
+    ("recompute-expensive", "recompute device", "smartphones/other", 880, True, None),
+    ("recompute-no-prices", "recompute device without prices", "smartphones/other", 1, True, None),
+    ("recompute-no-fee", "recompute device", "laptops", 1, True, None),
+    ("recompute-recent", "recompute device", "smartphones/other", 1, True, recently),
+    ("recompute-inactive", "recompute device", "smartphones/other", 1, False, None),
+]
+
+
+@pytest.fixture
+def db():
+    db: Session = SessionLocal()
+    db.bulk_insert_mappings(models.Device, [{"name": "recompute device"},
+                                            {"name": "recompute device without prices"}])
+    db.bulk_insert_mappings(models.Price, [
+        {"device_name": "recompute device", "source": "test source", "price": price, "currency": "PLN",
+         "date": now - timedelta(days=1)}
+        for price in (900, 1000, 1100)
+    ] + [
+        # Outside of the window, so it does not change the median
+        {"device_name": "recompute device", "source": "test source", "price": 1, "currency": "PLN",
+         "date": now - timedelta(days=30)}
+    ])
+    db.bulk_insert_mappings(models.Offer, [
+        {"id": id,
+         "url": "https://example.org",
+         "title": id,
+         "category": category,
+         "device_name": device_name,
+         "price": price,
+         "currency": "PLN",
+         "photos": [],
+         "is_active": is_active,
+         "scraped_at": now,
+         "last_stonks_check": last_stonks_check}
+        for id, device_name, category, price, is_active, last_stonks_check in OFFERS
+    ])
+    db.add(models.Delivery(offer_id="recompute-stonks", title="Delivery", price=15, currency="PLN"))
+    db.commit()
+
+    yield db
+
+    db.rollback()
+    db.query(models.Offer).filter(models.Offer.id.like("recompute-%")).delete(synchronize_session=False)
+    db.query(models.Device).filter(models.Device.name.like("recompute device%")).delete(synchronize_session=False)
+    db.commit()
+    db.close()
+
+
+def test_recompute_stonks(client: TestClient, db: Session):
+    recompute = schemas.StonksRecompute(last_stonks_check_before=now - timedelta(days=1),
+                                        sell_fees=SELL_FEES)
+    r = client.post("/v1/stonks/recompute", data=recompute.json())
+
+    assert r.status_code == 200
+
+    result = schemas.StonksRecomputeResult(**r.json())
+
+    assert result.checked_offers >= 4
+    assert result.created_stonkses >= 1
+
+    stonkses = db.query(models.Stonks).filter(models.Stonks.offer_id.like("recompute-%")).all()
+
+    # Sold for 90% of the median 1000, without 4.5% sell fee, the offer price and the delivery
+    assert [(s.offer_id, s.stonks_amount) for s in stonkses] == [("recompute-stonks", 344.5)]
+    assert [(f.title, f.amount, f.currency) for f in stonkses[0].fees] == [("Prowizja", 40.5, "PLN")]
+
+    checked = {offer.id for offer in db.query(models.Offer)
+                                       .filter(models.Offer.id.like("recompute-%"),
+                                               models.Offer.last_stonks_check >= now)}
+
+    assert checked == {"recompute-stonks", "recompute-expensive", "recompute-no-prices", "recompute-no-fee"}
+
+
+def test_recompute_stonks_limit(client: TestClient, db: Session):
+    recompute = schemas.StonksRecompute(last_stonks_check_before=now - timedelta(days=1),
+                                        sell_fees=SELL_FEES,
+                                        limit=1)
+    r = client.post("/v1/stonks/recompute", data=recompute.json())
+
+    assert r.status_code == 200
+    assert r.json()["checked_offers"] == 1
@@ -0,0 +1,163 @@
+from datetime import datetime
+from typing import List
+
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import parse_obj_as
+from sqlalchemy.orm import Session
+from stonks_types import schemas
+
+from stonks_api import crud, models
+from stonks_api.database import SessionLocal
+
+# Device name suffix mapped to its prices, so every sort gives a different order
+DEVICE_PRICES = {
+    "a": [100, 200, 900],
+    "b": [300, 310, 320],
+    "c": [50, 1000],
+    "d": [],
+}
+now = datetime.utcnow()
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    """
+    Seed stonkses of devices with prices, the last one inactive and without prices.
+    """
+    db: Session = SessionLocal()
+    db.bulk_insert_mappings(models.Device, [{"name": f"sort device {name}"} for name in DEVICE_PRICES])
+    db.bulk_insert_mappings(models.Offer, [
+        {"id": f"sort-{name}",
+         "url": "https://example.org",
+         "title": f"Sort offer {name}",
+         "category": "smartphones/other",
+         "device_name": f"sort device {name}",
+         "price": 100,
+         "currency": "PLN",
+         "photos": [],
+         "is_active": True,
+         "scraped_at": now}
+        for name in DEVICE_PRICES
+    ])
+    db.bulk_insert_mappings(models.Stonks, [
+        {"id": 2_000_000 + i, "offer_id": f"sort-{name}", "stonks_amount": 2_000_000 + i,
+         "created_at": now, "is_active": name != "d"}
+        for i, name in enumerate(DEVICE_PRICES)
+    ])
+    db.bulk_insert_mappings(models.Price, [
+        {"device_name": f"sort device {name}", "source": "test source", "price": price, "currency": "PLN",
+         "date": now}
+        for name, prices in DEVICE_PRICES.items() for price in prices
+    ])
+    db.commit()
+    crud.price_stats.refresh(db, [f"sort device {name}" for name in DEVICE_PRICES])
+
+    yield db
+
+    db.query(models.Offer).filter(models.Offer.id.like("sort-%")).delete(synchronize_session=False)
+    db.query(models.Device).filter(models.Device.name.like("sort device %")).delete(synchronize_session=False)
+    db.commit()
+    db.close()
+
+
+def get_sorted(client: TestClient, sort: schemas.StonksSortBy, **params) -> List[str]:
+    r = client.get("/v1/stonks", params={"sort": sort.value, "limit": 1000, **params})
+
+    assert r.status_code == 200
+
+    stonkses = parse_obj_as(List[schemas.Stonks], r.json())
+
+    return [stonks.offer.id[len("sort-"):] for stonks in stonkses if stonks.offer.id.startswith("sort-")]
+
+
+def test_price_stats_refreshed(seeded: Session):
+    stats = crud.price_stats.get_one(seeded, "sort device a")
+
+    assert stats.sample_count == 3
+    assert stats.min_price == 100
+    assert stats.max_price == 900
+    assert stats.mean_price == 400
+    assert stats.median_price == 200
+
+    stats = crud.price_stats.get_one(seeded, "sort device d")
+
+    assert stats.sample_count == 0
+    assert stats.min_price is None
+
+
+def test_price_stats_copied_to_stonkses(db_session: Session):
+    offer = models.Offer(id="copied-stats", url="https://example.org", title="Copied stats offer",
+                         category="smartphones/other", price=100, currency="PLN", photos=[], is_active=True,
+                         scraped_at=now)
+    db_session.add_all([models.Device(name="copied stats device"), offer])
+    db_session.add(models.Price(device_name="copied stats device", source="test source", price=200, currency="PLN",
+                                date=now))
+    db_session.flush()
+    crud.price_stats.refresh(db_session, ["copied stats device"], commit=False)
+
+    stonks = models.Stonks(offer_id="copied-stats", stonks_amount=1, created_at=now, is_active=True)
+    db_session.add(stonks)
+    db_session.flush()
+    db_session.refresh(stonks)
+
+    # Offer without device
+    assert stonks.device_min_price is None
+
+    offer.device_name = "copied stats device"
+    db_session.flush()
+    db_session.refresh(stonks)
+
+    assert stonks.device_min_price == 200
+    assert stonks.device_median_price == 200
+
+    db_session.add(models.Price(device_name="copied stats device", source="test source", price=100, currency="PLN",
+                                date=now))
+    db_session.flush()
+    crud.price_stats.refresh(db_session, ["copied stats device"], commit=False)
+    db_session.refresh(stonks)
+
+    assert stonks.device_min_price == 100
+    assert stonks.device_max_price == 200
+
+    db_session.add(models.Stonks(offer_id="copied-stats", stonks_amount=2, created_at=now, is_active=True))
+    db_session.flush()
+    inserted = db_session.query(models.Stonks).filter_by(offer_id="copied-stats", stonks_amount=2).one()
+
+    assert inserted.device_mean_price == 150
+
+
+def test_price_stats_refreshed_on_create_prices(isolated_client: TestClient, isolated_db, seeded: Session):
+    r = isolated_client.post("/v1/prices/sort device d", json={
+        "prices": [{"source": "test source", "price": 10, "currency": "PLN"}]
+    })
+
+    assert r.status_code == 201
+
+    stats = isolated_db(lambda db: crud.price_stats.get_one(db, "sort device d"))
+
+    assert stats.sample_count == 1
+    assert stats.min_price == 10
+
+
+@pytest.mark.parametrize("sort, expected", [
+    (schemas.StonksSortBy.stonks_amount_asc, ["a", "b", "c"]),
+    (schemas.StonksSortBy.stonks_amount_desc, ["c", "b", "a"]),
+    (schemas.StonksSortBy.low_price_asc, ["c", "a", "b"]),
+    (schemas.StonksSortBy.high_price_desc, ["c", "a", "b"]),
+    (schemas.StonksSortBy.average_price_asc, ["b", "a", "c"]),
+    (schemas.StonksSortBy.median_price_desc, ["c", "b", "a"]),
+    (schemas.StonksSortBy.harmonic_price_asc, ["c", "a", "b"]),
+])
+def test_sort_stonkses(client: TestClient, seeded: Session, sort: schemas.StonksSortBy, expected: List[str]):
+    assert get_sorted(client, sort) == expected
+
+
+def test_sort_stonkses_inactive(client: TestClient, seeded: Session):
+    assert get_sorted(client, schemas.StonksSortBy.stonks_amount_desc, is_active=False) == ["d"]
+
+
+def test_sort_stonkses_by_price_with_cursor(client: TestClient, seeded: Session):
+    r = client.get("/v1/stonks", params={"sort": schemas.StonksSortBy.low_price_asc.value, "cursor": "abc"})
+
+    assert r.status_code == 400
@@ -1,20 +1,177 @@
+import asyncio
+import os
+from typing import Callable, TypeVar, Union
+
 import pytest
+from _pytest.config import Config
+from _pytest.monkeypatch import MonkeyPatch
 from fastapi.testclient import TestClient
-from pytest import Session
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.util import greenlet_spawn
+
+from stonks_api.tests.worker_database import CLONE_DATABASE, setup_worker_database
+
+T = TypeVar("T")
+
+
+def pytest_configure(config: Config):
+    # xdist controller only distributes tests, workers are configured separately
+    is_controller = not hasattr(config, "workerinput") and getattr(config.option, "dist", "no") != "no"
+
+    if CLONE_DATABASE and not is_controller:
+        # Every worker runs tests in its own database cloned from a migrated template.
+        # Before anything imports `stonks_api.database`, which creates engines
+        setup_worker_database(os.getenv("PYTEST_XDIST_WORKER", "main"))
 
-from main import app
-from stonks_api.tests.utils import delete_data
+
+def pytest_sessionstart(session: pytest.Session):
+    if not CLONE_DATABASE:
+        from stonks_api.tests.utils import delete_data
+        delete_data()
+
+
+def pytest_sessionfinish(session: pytest.Session):
+    if not CLONE_DATABASE:
+        from stonks_api.tests.utils import delete_data
+        delete_data()
 
 
 @pytest.fixture
 def client():
+    from main import app
+
     with TestClient(app) as c:
         yield c
 
 
-def pytest_sessionstart(session: Session):
-    delete_data()
+def restart_savepoints(session: Session, connection: Connection):
+    """
+    Begin a new SAVEPOINT whenever `session` ends one, so commits and rollbacks of the session
+    never end the transaction of `connection`, which is rolled back after the test.
+    """
+    @event.listens_for(session, "after_transaction_end")
+    def restart_savepoint(session, session_transaction):
+        if not connection.in_nested_transaction():
+            connection.begin_nested()
+
+
+@pytest.fixture
+def db_session():
+    """
+    Session in a transaction which is rolled back after the test.
+    Commits and rollbacks of the session only end a SAVEPOINT, nothing is written to the database.
+    """
+    from stonks_api.database import SessionLocal, engine
+
+    connection = engine.connect()
+    transaction = connection.begin()
+    session = SessionLocal(bind=connection)
+    connection.begin_nested()
+    restart_savepoints(session, connection)
+
+    yield session
+
+    session.close()
+    transaction.rollback()
+    connection.close()
+
+
+@pytest.fixture
+def async_db_session():
+    """
+    Asynchronous `db_session`, on the event loop the test client runs requests on.
+    """
+    from stonks_api.database import AsyncSessionLocal, async_engine
+
+    loop = asyncio.get_event_loop_policy().get_event_loop()
+    connection = loop.run_until_complete(async_engine.connect())
+    transaction = loop.run_until_complete(connection.begin())
+    session: AsyncSession = AsyncSessionLocal(bind=connection)
+    loop.run_until_complete(connection.begin_nested())
+    # Called from the session inside of the greenlet, where the sync connection can emit statements
+    restart_savepoints(session.sync_session, connection.sync_connection)
+
+    yield session
+
+    loop.run_until_complete(session.close())
+    loop.run_until_complete(transaction.rollback())
+    loop.run_until_complete(connection.close())
 
 
-def pytest_sessionfinish(session: Session):
-    delete_data()
+@pytest.fixture
+def isolated_sync_session(async_db_session: AsyncSession):
+    """
+    Synchronous session on the connection of `async_db_session`, so each of them sees what the other one wrote.
+    The asyncpg connection can only be used inside of a greenlet, e.g. started by `greenlet_spawn`.
+    """
+    from stonks_api.database import SessionLocal
+
+    loop = asyncio.get_event_loop_policy().get_event_loop()
+    connection = async_db_session.bind.sync_connection
+    session: Session = SessionLocal(bind=connection)
+    restart_savepoints(session, connection)
+
+    yield session
+
+    loop.run_until_complete(greenlet_spawn(session.close))
+
+
+@pytest.fixture
+def isolated_db(isolated_sync_session: Session) -> Callable[[Callable[[Session], T]], T]:
+    """
+    Run a function with `isolated_sync_session` and return its result, to seed or check rows of `isolated_client`,
+    e.g. `isolated_db(lambda db: db.get(models.Device, name))`. The session is closed afterwards like after requests,
+    so only attributes loaded by the function can be used.
+    """
+    loop = asyncio.get_event_loop_policy().get_event_loop()
+
+    def run(function: Callable[[Session], T]) -> T:
+        try:
+            return loop.run_until_complete(greenlet_spawn(function, isolated_sync_session))
+        finally:
+            loop.run_until_complete(greenlet_spawn(isolated_sync_session.close))
+
+    return run
+
+
+@pytest.fixture
+def isolated_client(async_db_session: AsyncSession, isolated_sync_session: Session, monkeypatch: MonkeyPatch):
+    """
+    Test client whose requests use `async_db_session` and `isolated_sync_session`, so nothing they write outlives
+    the test. Both sessions share a connection, so async endpoints see writes of sync endpoints and the other way round.
+    Sync endpoints run in a greenlet on the event loop instead of a thread pool, where their session can use
+    the asyncpg connection.
+    """
+    import fastapi.dependencies.utils
+    import fastapi.routing
+    from main import app
+    from stonks_api.database import get_db, get_async_db, get_read_db, get_async_read_db
+
+    for module in (fastapi.routing, fastapi.dependencies.utils):
+        monkeypatch.setattr(module, "run_in_threadpool", greenlet_spawn)
+
+    def override(session: Union[Session, AsyncSession]):
+        sync_session = session.sync_session if isinstance(session, AsyncSession) else session
+
+        async def get_session():
+            try:
+                yield session
+            finally:
+                # Every request ends its transaction and loads fresh models, as with a session of its own.
+                # Otherwise the session would keep a SAVEPOINT which the other one has already released
+                await greenlet_spawn(sync_session.close)
+
+        return get_session
+
+    app.dependency_overrides[get_db] = override(isolated_sync_session)
+    app.dependency_overrides[get_async_db] = override(async_db_session)
+    app.dependency_overrides[get_read_db] = override(isolated_sync_session)
+    app.dependency_overrides[get_async_read_db] = override(async_db_session)
+
+    with TestClient(app) as c:
+        yield c
+
+    app.dependency_overrides.clear()
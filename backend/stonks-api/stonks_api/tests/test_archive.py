@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+from stonks_types import schemas
+
+from stonks_api import models
+from stonks_api.archive import archive_offers
+from stonks_api.database import SessionLocal
+
+now = datetime.utcnow()
+old = now - timedelta(days=100)
+
+
+@pytest.fixture
+def db():
+    """
+    Seed old inactive offers with deliveries, stonkses and fees, and offers which must not be archived.
+    """
+    db: Session = SessionLocal()
+    db.bulk_insert_mappings(models.Offer, [
+        {"id": f"archive-{i}",
+         "url": "https://example.org",
+         "title": f"Archive offer {i}",
+         "category": "smartphones/other",
+         "price": 100 + i,
+         "currency": "PLN",
+         "photos": ["https://example.org/photo.jpg"],
+         "is_active": False,
+         "scraped_at": old - timedelta(minutes=i)}
+        for i in range(5)
+    ] + [
+        {"id": "archive-recent",
+         "url": "https://example.org",
+         "title": "Recently inactive offer",
+         "category": "smartphones/other",
+         "price": 100,
+         "currency": "PLN",
+         "photos": [],
+         "is_active": False,
+         "scraped_at": old,
+         "last_update_at": now}
+    ])
+    db.add(models.Delivery(offer_id="archive-0", title="Delivery", price=10, currency="PLN"))
+    db.add(models.Stonks(id=3_000_000, offer_id="archive-0", stonks_amount=50, created_at=old, is_active=True))
+    db.add(models.Fee(stonks_id=3_000_000, title="Fee", amount=5, currency="PLN"))
+    db.commit()
+
+    yield db
+
+    db.rollback()
+    db.query(models.Offer).filter(models.Offer.id.like("archive-%")).delete(synchronize_session=False)
+    db.query(models.OfferArchive).filter(models.OfferArchive.id.like("archive-%")).delete(synchronize_session=False)
+    db.commit()
+    db.close()
+
+
+def test_archive_offers(db: Session):
+    assert archive_offers(db, older_than_days=30, batch_size=2) == 5
+
+    assert db.query(models.Offer).filter(models.Offer.id.like("archive-%")).all()[0].id == "archive-recent"
+    assert db.query(models.Stonks).filter(models.Stonks.id == 3_000_000).count() == 0
+
+    archived = db.get(models.OfferArchive, "archive-0")
+
+    assert archived.archived_at is not None
+    assert archived.photos == ["https://example.org/photo.jpg"]
+    assert [d.title for d in archived.deliveries] == ["Delivery"]
+    assert db.query(models.StonksArchive).filter(models.StonksArchive.offer_id == "archive-0").count() == 1
+    assert db.query(models.FeeArchive).filter(models.FeeArchive.stonks_id == 3_000_000).count() == 1
+
+
+def test_archive_offers_max_batches(db: Session):
+    assert archive_offers(db, older_than_days=30, batch_size=2, max_batches=2) == 4
+
+
+def test_get_archived_offer(client: TestClient, db: Session):
+    archive_offers(db, older_than_days=30)
+
+    r = client.get("/v1/offers/archive-0")
+
+    assert r.status_code == 404
+
+    r = client.get("/v1/offers/archive-0", params={"include_archived": True})
+
+    assert r.status_code == 200
+
+    offer = schemas.Offer(**r.json())
+
+    assert offer.id == "archive-0"
+    assert not offer.is_active
+    assert offer.deliveries[0].title == "Delivery"
@@ -0,0 +1,113 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from stonks_api import crud, models
+
+now = datetime.utcnow()
+
+
+def run(coroutine):
+    # The event loop of `async_db_session`
+    return asyncio.get_event_loop_policy().get_event_loop().run_until_complete(coroutine)
+
+
+@pytest.fixture
+def db(db_session: Session):
+    """
+    Seed an offer in a transaction which is rolled back after the test.
+    """
+    db_session.bulk_insert_mappings(models.Offer, [{"id": "crud-offer",
+                                                    "url": "https://example.org",
+                                                    "title": "Crud offer",
+                                                    "category": "smartphones/other",
+                                                    "price": 100,
+                                                    "currency": "PLN",
+                                                    "photos": [],
+                                                    "is_active": True,
+                                                    "scraped_at": now}])
+    db_session.commit()
+
+    return db_session
+
+
+def test_create_many(db: Session):
+    deliveries = crud.delivery.create_many(db=db,
+                                           new_models=[{"offer_id": "crud-offer", "title": f"Delivery {i}",
+                                                        "price": i, "currency": "PLN"} for i in range(5)],
+                                           commit=False,
+                                           chunk_size=2)
+
+    assert [delivery.title for delivery in deliveries] == [f"Delivery {i}" for i in range(5)]
+    assert all(delivery.id is not None for delivery in deliveries)
+    assert crud.delivery.create_many(db=db, new_models=[], commit=False) == []
+
+    db.rollback()
+
+    assert db.query(models.Delivery).filter(models.Delivery.offer_id == "crud-offer").count() == 0
+
+
+def test_update_many(db: Session):
+    deliveries = crud.delivery.create_deliveries_for_offer(db=db,
+                                                           offer_id="crud-offer",
+                                                           deliveries=[],
+                                                           commit=False)
+
+    assert deliveries == []
+
+    deliveries = crud.delivery.create_many(db=db,
+                                           new_models=[{"offer_id": "crud-offer", "title": f"Delivery {i}",
+                                                        "price": i, "currency": "PLN"} for i in range(3)],
+                                           commit=False)
+    ids = [delivery.id for delivery in deliveries[:2]]
+
+    updated = crud.delivery.update_many(db=db, ids=[*ids, -1], update_model={"price": 42}, commit=False)
+
+    assert sorted(delivery.id for delivery in updated) == ids
+    # Models already in the session are updated too
+    assert [delivery.price for delivery in deliveries] == [42, 42, 2]
+    assert crud.delivery.update(db=db, id=-1, update_model={"price": 42}, commit=False) is None
+
+
+def test_upsert_many(db: Session):
+    crud.device.create_many(db=db, new_models=[{"name": "crud device 1", "category": "laptops"}], commit=False)
+
+    devices = crud.device.upsert_many(db=db,
+                                      new_models=[{"name": "crud device 1", "category": "tablets"},
+                                                  {"name": "crud device 2", "category": "tablets"}],
+                                      commit=False)
+
+    assert [(device.name, device.category) for device in devices] == [("crud device 1", "tablets"),
+                                                                       ("crud device 2", "tablets")]
+
+    devices = crud.device.upsert_many(db=db,
+                                      new_models=[{"name": "crud device 1", "category": "laptops"},
+                                                  {"name": "crud device 3", "category": "laptops"}],
+                                      update_columns=[],
+                                      commit=False)
+
+    # Existing devices are skipped without columns to update
+    assert [device.name for device in devices] == ["crud device 3"]
+    assert db.get(models.Device, "crud device 1").category == "tablets"
+
+
+def test_create_async_by_primary_key(async_db_session: AsyncSession):
+    async def create_device():
+        # Devices are identified by name, they have no id
+        device = await crud.device.create_async(db=async_db_session,
+                                                new_model={"name": "crud device async", "category": "laptops"},
+                                                commit=False)
+        updated = await crud.device.update_async(db=async_db_session,
+                                                 id="crud device async",
+                                                 update_model={"category": "tablets"},
+                                                 commit=False)
+
+        return device, updated
+
+    device, updated = run(create_device())
+
+    assert device.name == "crud device async"
+    assert updated.category == "tablets"
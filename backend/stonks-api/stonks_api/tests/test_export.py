@@ -0,0 +1,101 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from stonks_api import crud, models
+from stonks_api.export import ndjson_chunks, csv_chunks
+
+now = datetime.utcnow()
+
+
+def run(coroutine):
+    # The event loop of `async_db_session`
+    return asyncio.get_event_loop_policy().get_event_loop().run_until_complete(coroutine)
+
+
+async def collect(chunks) -> list:
+    return [chunk async for chunk in chunks]
+
+
+@pytest.fixture
+def db(async_db_session: AsyncSession):
+    """
+    Offers with stonkses in a transaction which is rolled back after the test.
+    """
+    async def seed():
+        async_db_session.add(models.Device(name="export device"))
+        await async_db_session.flush()
+
+        for i in range(5):
+            async_db_session.add(models.Offer(id=f"export-offer-{i}",
+                                              url="https://example.org",
+                                              title=f"Export offer {i}",
+                                              description="Multi-line,\n\"quoted\" description",
+                                              category="smartphones/other",
+                                              device_name="export device",
+                                              price=100 + i,
+                                              currency="PLN",
+                                              photos=["https://example.org/1.jpg", "https://example.org/2.jpg"],
+                                              is_active=True,
+                                              scraped_at=now))
+
+        await async_db_session.flush()
+        async_db_session.add(models.Stonks(offer_id="export-offer-0",
+                                           stonks_amount=Decimal("12.5"),
+                                           created_at=now,
+                                           is_active=True))
+        await async_db_session.flush()
+
+    run(seed())
+
+    return async_db_session
+
+
+def test_export_ndjson(db: AsyncSession):
+    statement = crud.offer.select_export(has_device=True).where(models.Offer.id.like("export-offer-%"))
+    chunks = run(collect(ndjson_chunks(db, statement, batch_size=2)))
+
+    # A chunk per batch
+    assert len(chunks) == 3
+
+    offers = [json.loads(line) for line in "".join(chunks).splitlines()]
+
+    assert [offer["id"] for offer in offers] == [f"export-offer-{i}" for i in range(5)]
+    assert offers[0]["price"] == 100
+    assert offers[0]["photos"] == ["https://example.org/1.jpg", "https://example.org/2.jpg"]
+    assert offers[0]["scraped_at"] == now.isoformat()
+    assert "search_vector" not in offers[0]
+
+
+def test_export_csv(db: AsyncSession):
+    statement = crud.offer.select_export(has_device=True).where(models.Offer.id.like("export-offer-%"))
+    chunks = run(collect(csv_chunks(db, statement, batch_size=2)))
+    rows = list(csv.DictReader(io.StringIO("".join(chunks))))
+
+    assert len(chunks) == 3
+    assert [row["id"] for row in rows] == [f"export-offer-{i}" for i in range(5)]
+    assert rows[0]["description"] == "Multi-line,\n\"quoted\" description"
+    assert json.loads(rows[0]["photos"]) == ["https://example.org/1.jpg", "https://example.org/2.jpg"]
+
+
+def test_export_stonks(db: AsyncSession):
+    statement = crud.stonks.select_export().where(models.Stonks.offer_id == "export-offer-0")
+    rows = list(csv.DictReader(io.StringIO("".join(run(collect(csv_chunks(db, statement)))))))
+
+    assert len(rows) == 1
+    assert Decimal(rows[0]["stonks_amount"]) == Decimal("12.5")
+    assert rows[0]["category"] == "smartphones/other"
+    assert Decimal(rows[0]["offer_price"]) == 100
+
+
+def test_export_empty(db: AsyncSession):
+    statement = crud.price.select_export(device_name="export device")
+
+    assert run(collect(csv_chunks(db, statement))) == ["id,device_name,source,price,currency,date\r\n"]
+    assert run(collect(ndjson_chunks(db, statement))) == []
@@ -0,0 +1,93 @@
+from datetime import datetime
+from typing import List
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+from stonks_types import schemas
+
+from stonks_api import models
+from stonks_api.database import SessionLocal
+
+
+def is_committed(name: str) -> bool:
+    db: Session = SessionLocal()
+
+    try:
+        return db.get(models.Device, name) is not None
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def rolled_back() -> List[str]:
+    """
+    Names of devices the test writes, which must not be committed after its sessions are closed.
+    Requested before the sessions, so it is finalized after them.
+    """
+    names = []
+
+    yield names
+
+    for name in names:
+        assert not is_committed(name)
+
+
+def test_db_session(rolled_back: List[str], db_session: Session):
+    rolled_back.extend(["isolated device", "rolled back device"])
+    db_session.add(models.Device(name="isolated device"))
+    db_session.commit()
+    db_session.add(models.Device(name="rolled back device"))
+    db_session.rollback()
+
+    assert db_session.get(models.Device, "isolated device") is not None
+    assert db_session.get(models.Device, "rolled back device") is None
+    assert not is_committed("isolated device")
+
+
+def test_isolated_client(rolled_back: List[str], isolated_client: TestClient, isolated_db):
+    rolled_back.append("isolated client device")
+    r = isolated_client.post("/v1/devices/", data=schemas.DeviceCreate(name="isolated client device").json())
+
+    assert r.status_code == 201
+    assert isolated_db(lambda db: db.get(models.Device, "isolated client device")) is not None
+    assert not is_committed("isolated client device")
+
+
+def test_isolated_client_shares_connection(rolled_back: List[str], isolated_client: TestClient):
+    rolled_back.append("isolated shared device")
+    r = isolated_client.post("/v1/devices/", data=schemas.DeviceCreate(name="isolated shared device").json())
+
+    assert r.status_code == 201
+
+    # Offer created by a sync endpoint is seen by async endpoints, and the other way round
+    offer = schemas.OfferCreate(id="isolated-shared", url="https://example.org", title="Isolated offer",
+                                category="smartphones/other", device_name="isolated shared device", price=100,
+                                currency="PLN", photos=[], is_active=True, scraped_at=datetime.utcnow())
+    r = isolated_client.post("/v1/offers/", data=offer.json())
+
+    assert r.status_code == 201
+
+    r = isolated_client.post("/v1/prices/isolated shared device", json={
+        "prices": [{"source": "test source", "price": 200, "currency": "PLN"}]
+    })
+
+    assert r.status_code == 201
+
+    r = isolated_client.get("/v1/offers/isolated-shared")
+
+    assert r.status_code == 200
+    assert r.json()["device"]["name"] == "isolated shared device"
+
+    r = isolated_client.get("/v1/devices/isolated shared device/price-stats")
+
+    assert r.status_code == 200
+    assert r.json()["sample_count"] == 1
+
+    r = isolated_client.post("/v1/offers/isolated-shared/stonks", json={"stonks_amount": 100})
+
+    assert r.status_code == 201
+
+    r = isolated_client.delete(f"/v1/stonks/{r.json()['id']}")
+
+    assert r.status_code == 200
@@ -0,0 +1,17 @@
+from fastapi.testclient import TestClient
+
+
+def test_metrics(client: TestClient):
+    client.get("v1/offers/")
+    client.get("v1/devices/")
+
+    r = client.get("metrics")
+
+    assert r.status_code == 200
+    assert 'stonks_api_requests_total{method="GET",route="/v1/offers/",status="200"}' in r.text
+    assert 'stonks_api_request_duration_seconds_bucket{le="0.005",method="GET",route="/v1/offers/"}' in r.text
+    # Both sync and async endpoints count their queries
+    assert 'stonks_api_sql_queries_total{route="/v1/offers/"}' in r.text
+    assert 'stonks_api_sql_queries_total{route="/v1/devices/"}' in r.text
+    assert 'stonks_api_db_pool_connections_in_use{engine="async"}' in r.text
+    assert 'stonks_api_db_pool_checkout_wait_seconds_count{engine="sync"}' in r.text
@@ -0,0 +1,82 @@
+from typing import List
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from loguru import logger
+
+from stonks_api.middleware import TimingMiddleware, UNMATCHED_ROUTE, CompressionMiddleware
+
+
+def make_client(body_sample_rate: float, max_body_size: int = 100) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(TimingMiddleware, body_sample_rate=body_sample_rate, max_body_size=max_body_size)
+
+    @app.post("/items/{item_id}")
+    async def create_item(item_id: int, request: Request):
+        return {"id": item_id, "size": len(await request.body())}
+
+    return TestClient(app)
+
+
+@pytest.fixture
+def messages() -> List[str]:
+    messages = []
+    sink_id = logger.add(lambda message: messages.append(message.record["message"]), level="DEBUG")
+
+    yield messages
+
+    logger.remove(sink_id)
+
+
+def test_logs_route_template(messages: List[str]):
+    r = make_client(body_sample_rate=0).post("/items/1", data=b"abc")
+
+    assert r.json() == {"id": 1, "size": 3}
+    assert len(messages) == 1
+    assert messages[0].startswith("POST /items/{item_id} 200 ")
+
+
+def test_logs_unmatched_route(messages: List[str]):
+    make_client(body_sample_rate=0).get("/unknown/1")
+
+    assert messages[0].startswith(f"GET {UNMATCHED_ROUTE} 404 ")
+
+
+def test_logs_sampled_body(messages: List[str]):
+    make_client(body_sample_rate=1).post("/items/1", data=b"abc")
+
+    assert messages[1] == "POST /items/1 body: b'abc'"
+
+
+def test_skips_large_body(messages: List[str]):
+    r = make_client(body_sample_rate=1, max_body_size=2).post("/items/1", data=b"abc")
+
+    # Endpoint still receives the whole body
+    assert r.json()["size"] == 3
+    assert len(messages) == 1
+
+
+def test_skips_body_of_malformed_content_length():
+    middleware = TimingMiddleware(FastAPI(), body_sample_rate=1)
+
+    assert not middleware._should_log_body({"headers": [(b"content-length", b"abc")]})
+
+
+def test_compression():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100, exclude_paths=["/stream"])
+
+    @app.get("/items")
+    async def get_items(count: int):
+        return ["item"] * count
+
+    @app.get("/stream")
+    async def stream():
+        return ["item"] * 100
+
+    client = TestClient(app)
+
+    assert client.get("/items", params={"count": 100}).headers.get("Content-Encoding") == "gzip"
+    assert client.get("/items", params={"count": 1}).headers.get("Content-Encoding") is None
+    assert client.get("/stream").headers.get("Content-Encoding") is None
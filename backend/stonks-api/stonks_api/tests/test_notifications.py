@@ -0,0 +1,147 @@
+import asyncio
+from datetime import datetime
+from decimal import Decimal
+
+import asyncpg
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from stonks_types import schemas
+
+from stonks_api import crud, models
+from stonks_api.database import SessionLocal
+from stonks_api.notifications import StonksBroadcaster, Subscription, stonks_broadcaster, stonks_events
+
+OFFER_ID = "test notifications offer"
+
+
+@pytest.fixture
+def db():
+    db: Session = SessionLocal()
+    db.add(models.Offer(id=OFFER_ID,
+                        url="https://example.org",
+                        title="Notified offer",
+                        category="smartphones/other",
+                        price=100,
+                        currency="PLN",
+                        photos=[],
+                        is_active=True,
+                        scraped_at=datetime.utcnow()))
+    db.commit()
+
+    yield db
+
+    # Stonkses and fees are deleted by cascade
+    db.query(models.Offer).filter(models.Offer.id == OFFER_ID).delete(synchronize_session=False)
+    db.commit()
+    db.close()
+
+
+def run(coroutine):
+    # The event loop of the test client, which the asynchronous engine is used on
+    return asyncio.get_event_loop_policy().get_event_loop().run_until_complete(coroutine)
+
+
+def test_subscription_matches():
+    stonks = models.Stonks(stonks_amount=Decimal(100), offer=models.Offer(category="smartphones/other"))
+
+    assert Subscription().matches(stonks)
+    assert Subscription(category="smartphones").matches(stonks)
+    assert Subscription(category="smartphones/other", min_stonks_amount=Decimal(100)).matches(stonks)
+    assert not Subscription(category="smartphone").matches(stonks)
+    assert not Subscription(category="laptops").matches(stonks)
+    assert not Subscription(min_stonks_amount=Decimal("100.01")).matches(stonks)
+
+
+def test_new_stonks_are_broadcast(db: Session):
+    broadcaster = StonksBroadcaster(stonks_broadcaster.dsn, keepalive_interval=0.5)
+
+    async def scenario():
+        everything = broadcaster.subscribe()
+        smartphones = broadcaster.subscribe(category="smartphones", min_stonks_amount=Decimal(50))
+        laptops = broadcaster.subscribe(category="laptops")
+
+        await asyncio.wait_for(broadcaster.listening.wait(), timeout=5)
+
+        db_stonks = crud.stonks.create_for_offer(db=db,
+                                                 offer_id=OFFER_ID,
+                                                 stonks=schemas.StonksCreate(stonks_amount=100))
+        crud.stonks.create_for_offer(db=db,
+                                     offer_id=OFFER_ID,
+                                     stonks=schemas.StonksCreate(stonks_amount=10))
+
+        first = await asyncio.wait_for(everything.queue.get(), timeout=1)
+        second = await asyncio.wait_for(everything.queue.get(), timeout=1)
+        matched = await asyncio.wait_for(smartphones.queue.get(), timeout=1)
+
+        assert first[0] == db_stonks.id
+        assert schemas.Stonks.parse_raw(first[1]).offer.id == OFFER_ID
+        assert second[0] == db_stonks.id + 1
+        assert matched == first
+        assert smartphones.queue.empty()
+        assert laptops.queue.empty()
+
+        await broadcaster.stop()
+
+        assert await everything.queue.get() is None
+
+    run(scenario())
+
+
+def test_stonks_created_while_reconnecting_are_sent(db: Session, monkeypatch: MonkeyPatch):
+    broadcaster = StonksBroadcaster(stonks_broadcaster.dsn, reconnect_delay=0.5, keepalive_interval=0.1)
+    connections = []
+    connect = asyncpg.connect
+
+    async def listen_connect(dsn, *args, **kwargs):
+        connection = await connect(dsn, *args, **kwargs)
+
+        if dsn == broadcaster.dsn:
+            connections.append(connection)
+
+        return connection
+
+    monkeypatch.setattr(asyncpg, "connect", listen_connect)
+
+    async def scenario():
+        subscription = broadcaster.subscribe()
+
+        try:
+            await asyncio.wait_for(broadcaster.listening.wait(), timeout=5)
+
+            # Connection is lost before any stonks is published
+            db.execute(text("SELECT pg_terminate_backend(:pid)"), {"pid": connections[0].get_server_pid()})
+
+            while broadcaster.listening.is_set():
+                await asyncio.sleep(0.05)
+
+            db_stonks = crud.stonks.create_for_offer(db=db,
+                                                     offer_id=OFFER_ID,
+                                                     stonks=schemas.StonksCreate(stonks_amount=100))
+            event = await asyncio.wait_for(subscription.queue.get(), timeout=5)
+
+            assert event[0] == db_stonks.id
+            assert len(connections) == 2
+        finally:
+            await broadcaster.stop()
+
+    run(scenario())
+
+
+def test_stonks_events():
+    broadcaster = StonksBroadcaster(stonks_broadcaster.dsn, keepalive_interval=0.01)
+    subscription = Subscription()
+    broadcaster.subscriptions.add(subscription)
+    subscription.queue.put_nowait((1, '{"id": 1}'))
+
+    async def events():
+        stream = stonks_events(subscription, broadcaster)
+        received = [await stream.__anext__(), await stream.__anext__()]
+        # Closed subscription ends the stream
+        subscription.queue.put_nowait(None)
+
+        return received + [event async for event in stream]
+
+    assert run(events()) == ['id: 1\nevent: stonks\ndata: {"id": 1}\n\n', ": keepalive\n\n"]
+    assert subscription not in broadcaster.subscriptions
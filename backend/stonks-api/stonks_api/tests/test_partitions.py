@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta, date
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from stonks_api import crud, models
+from stonks_api.database import SessionLocal
+from stonks_api.partitions import ensure_price_partitions, create_price_partition, roll_up_prices, \
+    get_price_partitions, add_months, DEFAULT_PARTITION
+
+DEVICE_NAME = "partition device"
+now = datetime.utcnow()
+current_month = now.date().replace(day=1)
+# Months far enough from the current one, so they are not partitioned by the migration
+old_month = add_months(current_month, -24)
+future_month = add_months(current_month, 24)
+
+
+@pytest.fixture
+def db():
+    db: Session = SessionLocal()
+    db.add(models.Device(name=DEVICE_NAME))
+    db.commit()
+
+    yield db
+
+    db.rollback()
+    db.query(models.Device).filter(models.Device.name == DEVICE_NAME).delete(synchronize_session=False)
+    db.commit()
+
+    for month, name in get_price_partitions(db).items():
+        if month in (old_month, future_month):
+            db.execute(text(f"DROP TABLE {name}"))
+
+    db.commit()
+    db.close()
+
+
+def add_prices(db: Session, day: datetime, prices):
+    db.bulk_insert_mappings(models.Price, [
+        {"device_name": DEVICE_NAME, "source": "test source", "price": price, "currency": "PLN", "date": day}
+        for price in prices
+    ])
+    db.commit()
+
+
+def partition_of_prices(db: Session) -> set:
+    return set(db.execute(text("SELECT tableoid::regclass::text FROM price WHERE device_name = :name"),
+                          {"name": DEVICE_NAME}).scalars())
+
+
+def test_ensure_price_partitions(db: Session):
+    ensure_price_partitions(db, months_ahead=2)
+
+    assert ensure_price_partitions(db, months_ahead=2) == []
+    assert {add_months(current_month, i) for i in range(3)} <= get_price_partitions(db).keys()
+
+
+def test_create_price_partition_moves_default_rows(db: Session):
+    add_prices(db, datetime.combine(future_month, datetime.min.time()) + timedelta(days=3), [100])
+
+    assert partition_of_prices(db) == {DEFAULT_PARTITION}
+
+    name = create_price_partition(db, future_month)
+
+    assert partition_of_prices(db) == {name}
+
+
+def test_roll_up_prices(db: Session):
+    old_day = datetime.combine(old_month, datetime.min.time()) + timedelta(days=2, hours=12)
+    name = create_price_partition(db, old_month)
+    add_prices(db, old_day, [100, 200, 600])
+    # Older than any partition, so it is kept in the default partition
+    add_prices(db, old_day - timedelta(days=365), [50])
+    add_prices(db, now, [300])
+
+    assert roll_up_prices(db, keep_days=90) == [name]
+    assert old_month not in get_price_partitions(db)
+    assert [p.price for p in crud.price.get_many(db, DEVICE_NAME)] == [300]
+
+    daily = db.query(models.PriceDaily)\
+        .filter(models.PriceDaily.device_name == DEVICE_NAME)\
+        .order_by(models.PriceDaily.day)\
+        .all()
+
+    assert [(d.day, d.sample_count, d.min_price, d.max_price, d.sum_price) for d in daily] == [
+        ((old_day - timedelta(days=365)).date(), 1, 50, 50, 50),
+        (old_day.date(), 3, 100, 600, 900),
+    ]
+
+
+def test_roll_up_prices_keeps_statistics_window(db: Session):
+    with pytest.raises(ValueError):
+        roll_up_prices(db, keep_days=7)
+
+
+def test_recent_prices_skip_old_partitions(db: Session):
+    name = create_price_partition(db, old_month)
+    q = crud.price._select_many(DEVICE_NAME, newer_than=now - timedelta(days=7))
+    plan = "\n".join(db.execute(text(f"EXPLAIN {q.compile(compile_kwargs={'literal_binds': True})}")).scalars())
+
+    assert name not in plan
+    assert f"price_{current_month:%Y_%m}" in plan
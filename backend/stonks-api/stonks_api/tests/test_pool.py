@@ -0,0 +1,43 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError
+
+from stonks_api.database import DATABASE_URL
+from stonks_api.pool import InstrumentedQueuePool, track_usage, pool_status
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine(DATABASE_URL, poolclass=InstrumentedQueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=0.1)
+    track_usage(engine)
+
+    yield engine
+
+    engine.dispose()
+
+
+def test_pool_stats(engine):
+    connection = engine.connect()
+
+    assert pool_status(engine)["in_use"] == 1
+
+    with pytest.raises(TimeoutError):
+        engine.connect()
+
+    connection.close()
+    status = pool_status(engine)
+
+    assert status["in_use"] == 0
+    assert status["peak_in_use"] == 1
+    assert status["checkouts"] == 1
+    assert status["timeouts"] == 1
+    assert status["wait_max_ms"] >= 100
+
+
+def test_pool_stats_survive_dispose(engine):
+    engine.connect().close()
+    engine.dispose()
+    engine.connect().close()
+
+    assert pool_status(engine)["checkouts"] == 2
@@ -0,0 +1,68 @@
+from typing import List
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from loguru import logger
+
+from stonks_api.api.v1.api import api_router
+from stonks_api.middleware import TimingMiddleware
+from stonks_api.profiling import ProfileMode
+
+
+@pytest.fixture
+def profiled_client() -> TestClient:
+    app = FastAPI()
+    # Every statement is slow, so every statement is explained
+    app.add_middleware(TimingMiddleware, sql_profile=ProfileMode.header, slow_query_threshold=0)
+    app.include_router(api_router, prefix="/v1")
+
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def plans() -> List[str]:
+    plans = []
+    sink_id = logger.add(lambda message: plans.append(message.record["message"]),
+                         filter=lambda record: "explain" in record["extra"])
+
+    yield plans
+
+    logger.remove(sink_id)
+
+
+@pytest.mark.parametrize("path", [
+    # async session
+    "v1/offers/",
+    # sync session
+    "v1/devices/",
+])
+def test_profiled_request(profiled_client: TestClient, plans: List[str], path: str):
+    r = profiled_client.get(path, headers={"X-SQL-Profile": "1"})
+
+    assert r.status_code == 200
+    assert "sql;dur=" in r.headers["Server-Timing"]
+    assert len(plans) > 0
+    assert all("Execution Time" in plan for plan in plans)
+
+
+def test_not_profiled_request(profiled_client: TestClient, plans: List[str]):
+    r = profiled_client.get("v1/offers/")
+
+    assert r.status_code == 200
+    assert "Server-Timing" not in r.headers
+    assert len(plans) == 0
+
+
+def test_profiled_write(profiled_client: TestClient, plans: List[str]):
+    r = profiled_client.post("v1/devices/", headers={"X-SQL-Profile": "1"}, json={"name": "profiled device"})
+    profiled_client.delete("v1/devices/profiled device")
+
+    assert r.status_code == 201
+
+    insert_plans = [plan for plan in plans if "INSERT" in plan]
+
+    # Writes are explained without running them again
+    assert len(insert_plans) == 1
+    assert "Execution Time" not in insert_plans[0]
@@ -0,0 +1,120 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import List
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from stonks_types import schemas
+
+from stonks_api import crud, models
+from stonks_api.database import SessionLocal, engine, async_engine, create_no_device
+
+OFFERS_COUNT = 60
+now = datetime.utcnow()
+
+
+@pytest.fixture(scope="module")
+def db():
+    """
+    Seed offers with device and deliveries, and stonkses with fees, so every relationship is serialized.
+    """
+    create_no_device()
+
+    db: Session = SessionLocal()
+    db.bulk_insert_mappings(models.Device, [{"name": f"count device {i}"} for i in range(OFFERS_COUNT)])
+    db.bulk_insert_mappings(models.Offer, [
+        {"id": f"count-{i}",
+         "url": "https://example.org",
+         "title": f"Count offer {i}",
+         "category": "smartphones/other",
+         "device_name": f"count device {i}",
+         "price": 100 + i,
+         "currency": "PLN",
+         "photos": [],
+         "is_active": True,
+         "scraped_at": now - timedelta(minutes=i)}
+        for i in range(OFFERS_COUNT)
+    ])
+    db.bulk_insert_mappings(models.Delivery, [
+        {"offer_id": f"count-{i}", "title": f"Delivery {j}", "price": 10 + j, "currency": "PLN"}
+        for i in range(OFFERS_COUNT) for j in range(2)
+    ])
+    db.bulk_insert_mappings(models.Stonks, [
+        {"id": 1_000_000 + i, "offer_id": f"count-{i}", "stonks_amount": 1_000_000 + i,
+         "created_at": now, "is_active": True}
+        for i in range(OFFERS_COUNT)
+    ])
+    db.bulk_insert_mappings(models.Fee, [
+        {"stonks_id": 1_000_000 + i, "title": f"Fee {j}", "amount": 1 + j, "currency": "PLN"}
+        for i in range(OFFERS_COUNT) for j in range(2)
+    ])
+    db.commit()
+
+    yield db
+
+    db.rollback()
+    db.query(models.Offer).filter(models.Offer.id.like("count-%")).delete(synchronize_session=False)
+    db.query(models.Device).filter(models.Device.name.like("count device %")).delete(synchronize_session=False)
+    db.commit()
+    db.close()
+
+
+@contextmanager
+def count_queries():
+    """
+    Collect statements executed by both engines.
+    """
+    statements: List[str] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engines = (engine, async_engine.sync_engine)
+
+    for _engine in engines:
+        event.listen(_engine, "before_cursor_execute", capture)
+
+    try:
+        yield statements
+    finally:
+        for _engine in engines:
+            event.remove(_engine, "before_cursor_execute", capture)
+
+
+@pytest.mark.parametrize("path,expected", [
+    # offers with joined devices, deliveries
+    ("v1/offers/?has_device=true", 2),
+    # stonkses with joined offers and devices, fees, deliveries
+    ("v1/stonks", 3),
+])
+def test_list_query_count(db: Session, client: TestClient, path: str, expected: int):
+    counts = []
+
+    for limit in (5, 50):
+        with count_queries() as statements:
+            r = client.get(path, params={"limit": limit})
+
+        assert r.status_code == 200
+        assert len(r.json()) == limit
+        counts.append(len(statements))
+
+    assert counts == [expected, expected], counts
+
+
+def test_get_many_query_count(db: Session):
+    counts = []
+
+    for limit in (5, 50):
+        with count_queries() as statements:
+            offers = crud.offer.get_many(db=db, skip=0, limit=limit, has_device=True)
+            [schemas.Offer.from_orm(offer) for offer in offers]
+
+            stonkses = crud.stonks.get_many(db=db, skip=0, limit=limit)
+            [schemas.Stonks.from_orm(stonks) for stonks in stonkses]
+
+        counts.append(len(statements))
+        db.rollback()
+
+    assert counts == [5, 5], counts
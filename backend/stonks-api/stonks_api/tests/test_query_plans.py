@@ -0,0 +1,145 @@
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from stonks_types import schemas
+
+from stonks_api import crud, models
+from stonks_api.crud.crud_stonks import CURSOR_SORTS, PRICE_SORT_COLUMNS
+from stonks_api.database import SessionLocal, engine, create_no_device
+from stonks_api.pagination import encode_cursor
+
+OFFERS_COUNT = 2000
+DEVICES_COUNT = 50
+now = datetime.utcnow()
+
+
+def device_name(i: int) -> str:
+    return f"explain device {i}"
+
+
+@pytest.fixture(scope="module")
+def db():
+    """
+    Seed offers, devices and prices with a realistic spread of polling columns.
+    """
+    create_no_device()
+
+    db: Session = SessionLocal()
+    db.bulk_insert_mappings(models.Device, [
+        {"name": device_name(i),
+         "last_price_update": None if i % 5 == 0 else now - timedelta(days=i % 14)}
+        for i in range(DEVICES_COUNT)
+    ])
+    db.bulk_insert_mappings(models.Offer, [
+        {"id": f"explain-{i}",
+         "url": "https://example.org",
+         "title": f"Explain offer {i}",
+         "category": "smartphones/other",
+         "device_name": [None, "_no_device", device_name(i % DEVICES_COUNT)][i % 3],
+         "price": 100 + i,
+         "currency": "PLN",
+         "is_active": i % 10 != 0,
+         "scraped_at": now - timedelta(minutes=i),
+         "last_update_at": None if i % 4 == 0 else now - timedelta(minutes=i % 120),
+         "last_stonks_check": None if i % 7 == 0 else now - timedelta(hours=i % 48)}
+        for i in range(OFFERS_COUNT)
+    ])
+    db.bulk_insert_mappings(models.Price, [
+        {"device_name": device_name(i % DEVICES_COUNT),
+         "source": "allegro",
+         "price": 500 + i,
+         "currency": "PLN",
+         "date": now - timedelta(hours=i)}
+        for i in range(OFFERS_COUNT)
+    ])
+    db.commit()
+    # Stonkses of offers with devices, with statistics of their devices copied by triggers
+    db.bulk_insert_mappings(models.Stonks, [
+        {"offer_id": f"explain-{i}", "stonks_amount": i, "created_at": now, "is_active": i % 10 != 0}
+        for i in range(2, OFFERS_COUNT, 3)
+    ])
+    crud.price_stats.refresh(db, [device_name(i) for i in range(DEVICES_COUNT)])
+    db.execute("ANALYZE offer, device, price, stonks")
+
+    yield db
+
+    db.rollback()
+    db.query(models.Offer).filter(models.Offer.id.like("explain-%")).delete(synchronize_session=False)
+    db.query(models.Device).filter(models.Device.name.like("explain device %")).delete(synchronize_session=False)
+    db.commit()
+    db.close()
+
+
+def explain(db: Session, run: Callable[[], object]) -> List[str]:
+    """
+    Run `run` and return plans of all statements it executed.
+    Sequential scans are disabled, so the plan contains `Seq Scan` only if no index can serve the query.
+    """
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+
+    try:
+        run()
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    cursor = db.connection().connection.cursor()
+    cursor.execute("SET LOCAL enable_seqscan = off")
+    plans = []
+
+    for statement, parameters in statements:
+        cursor.execute(f"EXPLAIN {statement}", parameters)
+        plans.append("\n".join(row[0] for row in cursor.fetchall()))
+
+    db.rollback()
+
+    return plans
+
+
+polling_queries = {
+    "offers_update": lambda db: crud.offer.get_many(db=db, skip=0, limit=50, is_active=True,
+                                                    last_update_before=now - timedelta(minutes=60)),
+    "offers_without_device": lambda db: crud.offer.get_many(db=db, skip=0, limit=500, is_active=True,
+                                                            has_device=False),
+    "offers_stonks_check": lambda db: crud.offer.get_many(db=db, skip=0, limit=50, is_active=True,
+                                                          has_device=True,
+                                                          last_stonks_check_before=now - timedelta(hours=24)),
+    "offers_scraped_between": lambda db: crud.offer.get_many(db=db, skip=0, limit=50, is_active=True,
+                                                             scraped_after=now - timedelta(hours=2),
+                                                             scraped_before=now - timedelta(hours=1)),
+    "offers_cursor": lambda db: crud.offer.get_many(db=db, skip=0, limit=50, is_active=True,
+                                                    cursor=encode_cursor(now - timedelta(hours=10), "explain-600")),
+    "prices_for_device": lambda db: crud.price.get_many(db=db, device_name=device_name(1),
+                                                        newer_than=now - timedelta(days=7)),
+    "devices_price_update": lambda db: crud.device.get_many(db=db, skip=0, limit=6,
+                                                            last_price_update_before=now - timedelta(days=7)),
+    "stonks": lambda db: crud.stonks.get_many(db=db, skip=0, limit=50),
+}
+
+
+@pytest.mark.parametrize("query", polling_queries.keys())
+def test_polling_query_uses_index(db: Session, query: str):
+    plans = explain(db, lambda: polling_queries[query](db))
+
+    assert len(plans) > 0
+
+    for plan in plans:
+        assert "Seq Scan" not in plan, plan
+
+
+@pytest.mark.parametrize("sort", [sort for sort in schemas.StonksSortBy if sort not in CURSOR_SORTS])
+def test_price_sort_uses_index_order(db: Session, sort: schemas.StonksSortBy):
+    # Stonkses are selected by the first statement, fees by the following ones
+    plan = explain(db, lambda: crud.stonks.get_many(db=db, skip=100, limit=50, sort=sort))[0]
+    column = PRICE_SORT_COLUMNS[sort.value.rsplit("_", 1)[0]]
+    index = f"ix_stonks_is_active_{column.key}{'_desc' if sort.value.endswith('_desc') else ''}"
+
+    assert f"Index Scan using {index} on stonks" in plan, plan
+    assert "Sort" not in plan, plan
@@ -0,0 +1,69 @@
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from stonks_api.replica import RecentWriters, ReadYourWritesMiddleware, LAST_WRITE_COOKIE
+
+app = FastAPI()
+app.add_middleware(ReadYourWritesMiddleware, lag_window=60)
+
+
+@app.get("/read")
+def read(request: Request):
+    return {"read_from_primary": request.state.read_from_primary}
+
+
+@app.post("/write")
+def write():
+    return {}
+
+
+def reads_from_primary(client: TestClient, **kwargs) -> bool:
+    return client.get("/read", **kwargs).json()["read_from_primary"]
+
+
+def test_recent_writers():
+    writers = RecentWriters(lag_window=5, max_writers=2)
+    writers.mark("a", now=100)
+    writers.mark("b", now=101)
+
+    assert writers.is_recent("a", now=104.9)
+    assert not writers.is_recent("a", now=105)
+    assert not writers.is_recent("c", now=101)
+
+    writers.mark("c", now=102)
+    writers.mark("d", now=102)
+
+    # The least recent writer is forgotten
+    assert not writers.is_recent("b", now=102)
+    assert writers.is_recent("c", now=102)
+
+
+def test_reads_after_write_go_to_primary():
+    with TestClient(app) as client:
+        assert not reads_from_primary(client, headers={"X-Client-Id": "watcher"})
+
+        r = client.post("/write", headers={"X-Client-Id": "watcher"})
+
+        assert LAST_WRITE_COOKIE in r.cookies
+        assert reads_from_primary(client, headers={"X-Client-Id": "watcher"})
+        # Recognized by the cookie
+        assert reads_from_primary(client, headers={"X-Client-Id": "scraper"})
+
+        client.cookies.clear()
+
+        assert not reads_from_primary(client, headers={"X-Client-Id": "scraper"})
+        # Without the header clients are recognized by their address
+        assert not reads_from_primary(client)
+
+        client.post("/write")
+        client.cookies.clear()
+
+        assert reads_from_primary(client)
+
+
+def test_expired_cookie():
+    with TestClient(app) as client:
+        headers = {"X-Client-Id": "expired"}
+
+        assert not reads_from_primary(client, headers=headers, cookies={LAST_WRITE_COOKIE: "1000000000.0"})
+        assert not reads_from_primary(client, headers=headers, cookies={LAST_WRITE_COOKIE: "invalid"})
@@ -1,10 +1,15 @@
+import json
 import logging
+import time
+from typing import List
 
 import requests
+from pydantic import parse_obj_as
+from pydantic.json import pydantic_encoder
 from scrapy import Spider
 
 from stonks_scraper.items import OlxOfferItem
-from stonks_types.schemas import OfferCreate
+from stonks_types.schemas import OfferCreate, OfferBulkResult, BulkStatus
 
 from stonks_scraper.utils.apis import STONKS_API
 
@@ -12,6 +17,18 @@ from stonks_scraper.utils.apis import STONKS_API
 class OlxOffersPipeline:
     logger = logging.getLogger("olx_offers_pipeline")
 
+    def __init__(self, batch_size: int = 100, retries: int = 3, retry_delay: float = 1.0):
+        self.batch_size = batch_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.offers: List[OfferCreate] = []
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(batch_size=crawler.settings.getint("OFFERS_BATCH_SIZE", 100),
+                   retries=crawler.settings.getint("OFFERS_BATCH_RETRIES", 3),
+                   retry_delay=crawler.settings.getfloat("OFFERS_BATCH_RETRY_DELAY", 1.0))
+
     def process_item(self, item: OlxOfferItem, spider: Spider):
         offer = OfferCreate(**dict(item))
 
@@ -24,32 +41,68 @@ class OlxOffersPipeline:
         #     logging.error("Device name is None. Currently, stonks watcher is useless without it, so offer won't be saved.")
         #     return item
 
-        try:
-            self.logger.debug(f"Creating new offer id={offer.id}...")
-            r = requests.post(f"{STONKS_API}/v1/offers",
-                              data=offer.json(),
-                              headers={'Content-type': 'application/json'})
-
-            # if r.status_code == 409:
-            #     self.logger.debug(f"Offer id={offer.id} already exists, updating ...")
-            #     r = requests.put(f"{STONKS_API}/v1/offers/{offer.id}",
-            #                      data=offer.json(),
-            #                      headers={'Content-type': 'application/json'})
-            r.raise_for_status()
-
-        except requests.HTTPError as e:
-            msg = f"Creating an offer failed. Exiting...\n" \
-                  f"Exception: {e}\n" \
-                  f"Response: {e.response.json()}"
-            self.logger.error(msg)
-            return
+        self.offers.append(offer)
 
-        except requests.exceptions.ConnectionError:
-            self.logger.error(f"Could not connect to the stonks API.")
-            return
+        if len(self.offers) >= self.batch_size:
+            self.flush()
 
-        except requests.exceptions.Timeout:
-            self.logger.error(f"Timed out while connecting to the stonks API.")
+        return item
+
+    def close_spider(self, spider: Spider):
+        self.flush()
+
+    def flush(self):
+        """
+        Save buffered offers in stonks API with a single request.
+        Offers which already exist are left untouched.
+        Failed requests are retried with backoff, offers of a batch which could not be saved are lost.
+        """
+        if len(self.offers) == 0:
             return
 
-        return item
+        offers, self.offers = self.offers, []
+
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                delay = self.retry_delay * 2 ** (attempt - 1)
+                self.logger.warning(f"Retrying to create {len(offers)} offers in {delay}s...")
+                time.sleep(delay)
+
+            try:
+                self.logger.debug(f"Creating {len(offers)} new offers...")
+                r = requests.post(f"{STONKS_API}/v1/offers/bulk",
+                                  params={"on_conflict": "skip"},
+                                  data=json.dumps(offers, default=pydantic_encoder),
+                                  headers={'Content-type': 'application/json'})
+                r.raise_for_status()
+
+            except requests.HTTPError as e:
+                msg = f"Creating offers failed.\n" \
+                      f"Exception: {e}\n" \
+                      f"Response: {e.response.text}"
+                self.logger.error(msg)
+
+                # Invalid batch would be rejected again
+                if e.response.status_code < 500:
+                    break
+
+            except requests.exceptions.ConnectionError:
+                self.logger.error(f"Could not connect to the stonks API.")
+
+            except requests.exceptions.Timeout:
+                self.logger.error(f"Timed out while connecting to the stonks API.")
+
+            else:
+                self.log_results(parse_obj_as(List[OfferBulkResult], r.json()))
+                return
+
+        self.logger.error(f"Lost {len(offers)} offers which could not be created: "
+                          f"{', '.join(offer.id for offer in offers)}")
+
+    def log_results(self, results: List[OfferBulkResult]):
+        for result in results:
+            if result.status == BulkStatus.skipped:
+                self.logger.debug(f"Offer <id={result.id}> skipped: {result.detail}")
+
+        created_count = sum(result.status == BulkStatus.created for result in results)
+        self.logger.info(f"Created {created_count} of {len(results)} offers.")
@@ -8,6 +8,12 @@ USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64; rv:49.0) Gecko/20100101 Firefox/49
 
 ENV = os.getenv("ENV", "development")
 
+# Number of offers sent to the stonks API in a single request
+OFFERS_BATCH_SIZE = int(os.getenv("OFFERS_BATCH_SIZE", 100))
+# Failed requests saving a batch of offers are retried, with delay doubled after every attempt
+OFFERS_BATCH_RETRIES = int(os.getenv("OFFERS_BATCH_RETRIES", 3))
+OFFERS_BATCH_RETRY_DELAY = float(os.getenv("OFFERS_BATCH_RETRY_DELAY", 1))
+
 SENTRY_DSN = os.getenv("SENTRY_DSN", None)
 if SENTRY_DSN is not None:
     sentry_sdk.init(
@@ -7,7 +7,7 @@ from celery import group
 from olx_sdk.models import Offer as OlxOffer
 from olx_sdk.models import Status as OlxOfferStatus
 from pydantic import parse_obj_as
-from stonks_types.schemas import Offer, OfferUpdate, DeviceCreate
+from stonks_types.schemas import Offer, OfferUpdate, OfferPatch, DeviceCreate
 
 from celeryapp import app
 from config import config, API_URL
@@ -127,11 +127,10 @@ def create_device(offer: Offer, device: DeviceCreate):
     if device_name is None:
         return
 
-    offer_update: OfferUpdate = OfferUpdate(**offer.dict(exclude={"device_name"}),
-                                            device_name=device_name)
+    offer_patch: OfferPatch = OfferPatch(device_name=device_name)
 
     try:
-        r = requests.put(f"{API_URL}/v1/offers/{offer.id}", data=offer_update.json())
+        r = requests.patch(f"{API_URL}/v1/offers/{offer.id}", data=offer_patch.json(exclude_unset=True))
         r.raise_for_status()
 
         logger.info(f"Updated offer <id={offer.id}> with device_name={device_name}")
@@ -1,15 +1,14 @@
 import logging
-import statistics
-from datetime import datetime
-from typing import List
+from datetime import datetime, timedelta
+from typing import Optional
+from urllib import parse
 
 import requests
-from pydantic import parse_obj_as
-from stonks_types.schemas import Offer, Price, StonksCreate, FeeCreate, OfferUpdate
+from stonks_types.schemas import Offer, PriceStats, StonksCreate, FeeCreate, OfferPatch, StonksRecompute, \
+    StonksRecomputeResult
 
 from celeryapp import app
 from config.config import API_URL, config
-from stonks_watcher.utils import older_than, newer_than
 
 logger = logging.getLogger(__name__)
 
@@ -46,39 +45,38 @@ fees = {
 
 @app.task
 def periodic_stonks_finder():
-    # Get offers for which stonks has not been checked for more than 1 day (can be changed in config)
-    # Only get offers which have a device
-    last_stonks_check_before = older_than(minutes=config["stonks"]["older_than"])
-    params = {
-        "last_stonks_check_before": last_stonks_check_before,
-        "has_device": True,
-        "is_active": True,
-    }
-    r = requests.get(f"{API_URL}/v1/offers",
-                     params=params)
-    offers: List[Offer] = parse_obj_as(List[Offer], r.json())
-    logger.info(f"Downloaded {len(offers)} offers with outdated stonks.")
+    # Find stonkses of offers which have not been checked for more than 1 day (can be changed in config)
+    # All offers are checked by the API with a single query, instead of a request per offer
+    recompute = StonksRecompute(
+        last_stonks_check_before=datetime.utcnow() - timedelta(minutes=config["stonks"]["older_than"]),
+        sell_fees=fees["sell"],
+        window_days=config["prices"]["update_older_than"],
+    )
+    r = requests.post(f"{API_URL}/v1/stonks/recompute", data=recompute.json())
+    r.raise_for_status()
 
-    for offer in offers:
-        find_stonks(offer)
+    result = StonksRecomputeResult(**r.json())
+    logger.info(f"Checked {result.checked_offers} offers with outdated stonks, "
+                f"found {result.created_stonkses} stonkses.")
 
 
 @app.task
-def find_stonks(offer: Offer):
+def find_stonks(offer: Offer, stats: Optional[PriceStats] = None):
+    """
+    :param stats: Price statistics of the offer device, downloaded if not given.
+    """
     logger.info(f"Looking for stonks for offer id={offer.id}")
 
-    # Get prices for device
-    prices = get_prices(offer.device.name)
+    if stats is None:
+        stats = get_price_stats(offer.device.name)
 
-    if len(prices) == 0:
+    if stats is None or stats.sample_count == 0:
         logger.info(f"No prices for device {offer.device}")
         update_offer_last_stonks_check(offer)
 
         return
 
-    prices_amounts = [price.price for price in prices]
-
-    average_price = statistics.median(prices_amounts) * 0.9
+    average_price = stats.median_price * 0.9
     lowest_delivery_price = min([delivery.price for delivery in offer.deliveries], default=10)
     sell_fee = average_price * fees["sell"][offer.category]
 
@@ -100,19 +98,17 @@ def find_stonks(offer: Offer):
         update_offer_last_stonks_check(offer)
 
 
-def get_prices(device_name: str) -> List[Price]:
+def get_price_stats(device_name: str) -> Optional[PriceStats]:
     params = {
-        "newer_than": newer_than(days=config["prices"]["update_older_than"])
+        "window": f"{config['prices']['update_older_than']}d"
     }
-    r = requests.get(f"{API_URL}/v1/prices/{device_name}",
+    r = requests.get(f"{API_URL}/v1/devices/{parse.quote(device_name, safe='')}/price-stats",
                      params=params)
 
-    return parse_obj_as(List[Price], r.json()["prices"]) if r.status_code == 200 else []
+    return PriceStats(**r.json()) if r.status_code == 200 else None
 
 
 def update_offer_last_stonks_check(offer: Offer):
-    offer_update_dict = offer.dict(exclude={"last_stonks_check"})
-    offer_update_dict = {**offer_update_dict, "last_stonks_check": datetime.utcnow()}
-    offer_update = OfferUpdate(**offer_update_dict)
-    r = requests.put(f"{API_URL}/v1/offers/{offer.id}", data=offer_update.json())
+    offer_patch = OfferPatch(last_stonks_check=datetime.utcnow())
+    r = requests.patch(f"{API_URL}/v1/offers/{offer.id}", data=offer_patch.json(exclude_unset=True))
     r.raise_for_status()
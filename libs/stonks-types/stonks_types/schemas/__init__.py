@@ -4,3 +4,4 @@ from .category import *
 from .devices import *
 from .offer import *
 from .stonks import *
+from .export import *
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -11,13 +11,20 @@ class PriceBase(BaseModel):
 
 
 class PriceCreate(PriceBase):
-    date: datetime = datetime.utcnow()
+    date: datetime = Field(default_factory=datetime.utcnow)
 
 
 class PricesCreate(BaseModel):
     prices: List[PriceCreate]
 
 
+class PricesBulkResult(BaseModel):
+    # Number of created prices of every device
+    created: Dict[str, int]
+    # Devices which do not exist, their prices are not created
+    not_found: List[str] = []
+
+
 class Price(PriceBase):
     id: int
     date: datetime
@@ -49,3 +56,41 @@ class Device(DeviceBase):
 
 class Prices(BaseModel):
     prices: List[Price]
+
+
+class PriceStats(BaseModel):
+    device_name: str
+    window_days: int
+    sample_count: int
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    mean_price: Optional[float] = None
+    # Mean without the lowest and the highest 10% of prices
+    trimmed_mean_price: Optional[float] = None
+    median_price: Optional[float] = None
+    q1_price: Optional[float] = None
+    q3_price: Optional[float] = None
+    harmonic_price: Optional[float] = None
+    # Date of the newest price in the window
+    last_price_at: Optional[datetime] = None
+    updated_at: datetime
+
+    class Config:
+        orm_mode = True
+
+
+class SimilarDevice(Device):
+    # Trigram similarity of names, from 0 to 1
+    similarity: float
+
+
+class DeviceMerge(BaseModel):
+    # Names of devices merged into the canonical device and deleted
+    duplicates: List[str] = Field(..., min_items=1, example=["iphone8", "iphone 8 64gb"])
+
+
+class DeviceMergeResult(BaseModel):
+    device: Device
+    merged: List[str]
+    moved_offers: int
+    moved_prices: int
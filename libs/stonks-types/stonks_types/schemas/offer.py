@@ -2,7 +2,7 @@ from datetime import datetime
 from enum import Enum
 from typing import Optional, List
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, validator
 
 from stonks_types.schemas import DeliveryCreate, Delivery, DeviceCreate, Device
 
@@ -30,6 +30,35 @@ class OfferUpdate(OfferBase):
     device_name: Optional[str] = None
 
 
+class OfferPatch(BaseModel):
+    """
+    Partial update of an offer. Only fields which are sent are updated.
+    """
+    url: Optional[str] = Field(None, example="https://example.org")
+    title: Optional[str] = Field(None, example="Telefon pixel 3a")
+    description: Optional[str] = Field(None, example="Sprzedam telefon pixel 3a")
+    category: Optional[str] = Field(None, example="smartphone")
+    price: Optional[float] = Field(None, example=500.59)
+    currency: Optional[str] = Field(None, example="PLN")
+    photos: Optional[List[str]] = None
+    is_active: Optional[bool] = None
+    device_name: Optional[str] = None
+    last_stonks_check: Optional[datetime] = None
+    last_update_at: Optional[datetime] = None
+
+    @validator("title", "category", "price", "currency", "is_active")
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError("field cannot be null")
+
+        return value
+
+
+class OfferPatchItem(BaseModel):
+    id: str
+    fields: OfferPatch
+
+
 class Offer(OfferBase):
     id: str
     deliveries: List[Delivery] = []
@@ -39,3 +68,45 @@ class Offer(OfferBase):
 
     class Config:
         orm_mode = True
+
+
+class OfferSummary(BaseModel):
+    """
+    Offer without its description, photos, deliveries and device, returned with `view=summary`.
+    """
+    id: str
+    url: str
+    title: str
+    category: str
+    price: float
+    currency: str
+    is_active: bool
+    device_name: Optional[str] = None
+    scraped_at: datetime
+    last_update_at: Optional[datetime] = None
+    last_stonks_check: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+
+class ResponseView(str, Enum):
+    summary = "summary"
+    full = "full"
+
+
+class OfferConflict(str, Enum):
+    update = "update"
+    skip = "skip"
+
+
+class BulkStatus(str, Enum):
+    created = "created"
+    updated = "updated"
+    skipped = "skipped"
+
+
+class OfferBulkResult(BaseModel):
+    id: str
+    status: BulkStatus
+    detail: Optional[str] = None
@@ -1,11 +1,11 @@
 from datetime import datetime
 from decimal import Decimal
 from enum import Enum
-from typing import List
+from typing import List, Dict, Optional
 
 from pydantic import BaseModel, Field
 
-from stonks_types.schemas import Offer, Fee, FeeCreate
+from stonks_types.schemas import Offer, OfferSummary, Fee, FeeCreate
 
 
 class StonksBase(BaseModel):
@@ -30,6 +30,18 @@ class Stonks(StonksBase):
         orm_mode = True
 
 
+class StonksSummary(StonksBase):
+    """
+    Stonks without fees, with a summary of its offer, returned with `view=summary`.
+    """
+    id: int
+    offer: OfferSummary
+    created_at: datetime
+
+    class Config:
+        orm_mode = True
+
+
 class StonksSortBy(str, Enum):
     stonks_amount_asc = "stonks_amount_asc"
     stonks_amount_desc = "stonks_amount_desc"
@@ -43,3 +55,27 @@ class StonksSortBy(str, Enum):
     median_price_desc = "median_price_desc"
     harmonic_price_asc = "harmonic_price_asc"
     harmonic_price_desc = "harmonic_price_desc"
+
+
+class StonksRecompute(BaseModel):
+    """
+    Parameters of finding stonkses of all offers which were not checked since `last_stonks_check_before`.
+    Offer is sold for `price_factor` of the median price of its device from the last `window_days` days,
+    reduced by the sell fee of its category and the cheapest delivery.
+    """
+    last_stonks_check_before: datetime
+    # Sell fee of every category as a fraction of the sell price, offers of other categories are only marked checked
+    sell_fees: Dict[str, float] = Field(..., example={"smartphones/samsung": 0.045, "laptops": 0.02})
+    window_days: int = Field(7, gt=0)
+    price_factor: float = Field(0.9, gt=0)
+    # Used for offers without deliveries
+    default_delivery_price: float = 10
+    fee_title: str = "Prowizja"
+    currency: str = Field("PLN", min_length=3, max_length=3)
+    # Maximum number of offers checked at once, the rest is checked by the next run
+    limit: Optional[int] = Field(None, gt=0)
+
+
+class StonksRecomputeResult(BaseModel):
+    checked_offers: int
+    created_stonkses: int